@@ -0,0 +1,148 @@
+import os
+import sys
+import stat
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from tinymolecule.utils.docking import N_MODES, get_vina_header
+from tinymolecule.utils.scheduler import DockingJob
+
+# Stand-in for the vina CLI: every ligand file holds its own outcome.
+#   "AFFINITY <x>"  best mode scores x kcal/mol, the next ones 0.5 worse each,
+#                   without it a score between -3 and -9 fixed by ligand and target
+#   "FAIL"          vina can't parse the ligand and exits with 1
+#   "SLOW"          vina takes 30 s
+#   "FLAKY"         vina is killed on its first run on the ligand
+FAKE_VINA = """#!{python}
+import os, sys, time, zlib
+
+
+args = sys.argv[1:]
+
+
+def option(name):
+    return args[args.index(name) + 1] if name in args else None
+
+
+def dock(ligand, out, log):
+    text = open(ligand).read()
+    if "FAIL" in text:
+        sys.stderr.write(f"cannot parse {{ligand}}\\n")
+        return False
+    if "SLOW" in text:
+        time.sleep(30)
+    if "FLAKY" in text and not os.path.exists(ligand + ".tried"):
+        open(ligand + ".tried", "w").close()
+        os.kill(os.getpid(), 9)
+    words = text.split()
+    if "AFFINITY" in words:
+        best = float(words[words.index("AFFINITY") + 1])
+    else:
+        pair = os.path.basename(ligand) + os.path.basename(option("--config"))
+        best = -3.0 - zlib.crc32(pair.encode()) % 600 / 100
+    modes = [(best + 0.5 * i, float(i), 2.0 * i) for i in range(int(option("--num_modes") or 3))]
+
+    with open(out, "w") as out_file:
+        for i, mode in enumerate(modes):
+            out_file.write(f"MODEL {{i + 1}}\\nREMARK VINA RESULT: %8.3f %6.3f %6.3f\\nENDMDL\\n" % mode)
+    if log:
+        with open(log, "w") as log_file:
+            log_file.write(
+                "AutoDock Vina\\n\\nmode |   affinity | dist from best mode\\n"
+                "     | (kcal/mol) | rmsd l.b.| rmsd u.b.\\n"
+                "-----+------------+----------+----------\\n"
+            )
+            for i, mode in enumerate(modes):
+                log_file.write(f"{{i + 1:4d}}    %8.1f   %8.3f   %8.3f\\n" % mode)
+    return True
+
+
+if "--batch" in args:
+    ligands = args[args.index("--batch") + 1 :]
+    docked = [
+        dock(ligand, os.path.join(option("--dir"), os.path.basename(ligand)[:-6] + "_out.pdbqt"), None)
+        for ligand in ligands
+    ]
+    sys.exit(0 if all(docked) else 1)
+sys.exit(0 if dock(option("--ligand"), option("--out"), option("--log")) else 1)
+"""
+
+
+@pytest.fixture(scope="session", autouse=True)
+def fake_vina(tmp_path_factory):
+    """
+    Puts the fake vina first on PATH for the whole session: pool workers started by
+    forkserver keep the environment the server was started with.
+    """
+
+    bin_dir = tmp_path_factory.mktemp("bin")
+    vina = bin_dir / "vina"
+    vina.write_text(FAKE_VINA.format(python=sys.executable))
+    vina.chmod(vina.stat().st_mode | stat.S_IEXEC)
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        monkeypatch.setenv("PATH", f"{bin_dir}{os.pathsep}{os.environ['PATH']}")
+        yield vina
+
+
+@pytest.fixture
+def make_jobs(tmp_path):
+    """
+    Builds docking jobs on one target from {ligand name: ligand file contents}, with
+    poses and logs going to `tmp_path`/<target>/poses and /logs.
+    """
+
+    def make(ligands, target="CCR5", params="p0", **kwargs):
+        ligand_dir = tmp_path / "ligands"
+        target_dir = tmp_path / target.lower()
+        for subdir in (ligand_dir, target_dir / "poses", target_dir / "logs"):
+            subdir.mkdir(parents=True, exist_ok=True)
+        config_path = target_dir / "config.txt"
+        config_path.touch()
+
+        jobs = []
+        for name, text in ligands.items():
+            (ligand_dir / f"{name}.pdbqt").write_text(text)
+            jobs.append(
+                DockingJob(
+                    target=target,
+                    ligand=f"{name}.pdbqt",
+                    ligand_path=ligand_dir / f"{name}.pdbqt",
+                    receptor_path=target_dir / "receptor.pdbqt",
+                    config_path=config_path,
+                    out_pdbqt=target_dir / "poses" / f"{name}_out.pdbqt",
+                    out_log=target_dir / "logs" / f"{name}.log",
+                    params=params,
+                    **kwargs,
+                )
+            )
+
+        return jobs
+
+    return make
+
+
+@pytest.fixture
+def make_summary():
+    """
+    Builds the summary table of a target from {ligand ID: best affinity}, each further
+    binding mode 0.5 kcal/mol worse.
+    """
+
+    def make(affinities, tier="standard"):
+        ligands = list(affinities)
+        table = np.zeros((len(ligands), N_MODES, 3))
+        table[:, :, 0] = [
+            [affinities[lig] + 0.5 * m for m in range(N_MODES)] for lig in ligands
+        ]
+        summary = pd.DataFrame(
+            table.transpose(0, 2, 1).reshape(len(ligands), -1),
+            columns=get_vina_header(),
+        )
+        summary["uuid"] = ligands
+        summary["tier"] = tier
+
+        return summary
+
+    return make
@@ -0,0 +1,98 @@
+import pickle
+
+import pytest
+
+from tinymolecule.utils.archive import (
+    Folder,
+    PackedArchive,
+    pack_directory,
+    unpack_archive,
+)
+
+
+@pytest.mark.parametrize("compress", [False, True])
+def test_write_shadow_and_refresh(tmp_path, compress):
+    writer = PackedArchive(tmp_path / "ligands", compress=compress)
+    reader = PackedArchive(tmp_path / "ligands.pack")
+    writer.write_many([("pdbqt/a.pdbqt", "A1"), ("pdbqt/b.pdbqt", b"B1")])
+    first = writer.locate("pdbqt/a.pdbqt")
+
+    writer.write("pdbqt/a.pdbqt", "A2")  # shadows the first entry
+
+    assert writer.read_text("pdbqt/a.pdbqt") == "A2"
+    assert writer.locate("pdbqt/a.pdbqt") != first
+    assert len(writer) == 2
+    assert "pdbqt/a.pdbqt" not in reader
+    reader.refresh()
+    assert reader.read_text("pdbqt/a.pdbqt") == "A2"
+    assert reader.read("pdbqt/b.pdbqt") == b"B1"
+    assert sorted(reader.keys("pdbqt/")) == ["pdbqt/a.pdbqt", "pdbqt/b.pdbqt"]
+    writer.close()
+    reader.close()
+
+    with PackedArchive(tmp_path / "ligands") as reopened:
+        assert reopened.read_text("pdbqt/a.pdbqt") == "A2"
+
+
+def test_partial_index_record_is_read_once_complete(tmp_path):
+    with PackedArchive(tmp_path / "logs") as archive:
+        archive.write("l0.txt", "log 0")
+        index = archive.index_path.read_bytes()
+        archive.write("l1.txt", "log 1")
+        record = archive.index_path.read_bytes()[len(index) :]
+
+    # another process is halfway through appending the second record
+    archive.index_path.write_bytes(index + record[:-2])
+    with PackedArchive(tmp_path / "logs") as reader:
+        assert reader.keys() == ["l0.txt"]
+        with open(reader.index_path, "ab") as index_file:
+            index_file.write(record[-2:])
+        reader.refresh()
+        assert reader.read_text("l1.txt") == "log 1"
+
+
+def test_pack_and_unpack_round_trip(tmp_path):
+    src = tmp_path / "src"
+    (src / "logs").mkdir(parents=True)
+    files = {"a.pdbqt": "ATOM A\n", "logs/a.txt": "mode 1\n", "logs/b.txt": ""}
+    for name, text in files.items():
+        (src / name).write_text(text)
+
+    n_packed = pack_directory(
+        src, src / "out", compress=True, remove=True, batch_size=2
+    )
+    n_unpacked = unpack_archive(src / "out", tmp_path / "dest")
+
+    assert n_packed == n_unpacked == 3
+    assert sorted(path.name for path in src.rglob("*") if path.is_file()) == [
+        "out.idx",
+        "out.pack",
+    ]
+    for name, text in files.items():
+        assert (tmp_path / "dest" / name).read_text() == text
+
+
+def test_folder_reads_loose_files_first(tmp_path):
+    archive = PackedArchive(tmp_path / "out")
+    archive.write_many([("logs/a.txt", "archived a"), ("logs/b.txt", "archived b")])
+    (tmp_path / "logs").mkdir()
+    (tmp_path / "logs" / "b.txt").write_text("loose b")
+    (tmp_path / "logs" / "c.txt").write_text("loose c")
+    folder = Folder(tmp_path / "logs", archive, "logs")
+
+    assert folder.listdir() == ["a.txt", "b.txt", "c.txt"]
+    assert [folder.read_text(name) for name in folder.listdir()] == [
+        "archived a",
+        "loose b",
+        "loose c",
+    ]
+    assert not folder.exists("d.txt")
+    with pytest.raises(FileNotFoundError):
+        folder.read_text("d.txt")
+
+    # sent to a worker, it reopens the archive and sees entries added meanwhile
+    archive.write("logs/d.txt", "archived d")
+    copy = pickle.loads(pickle.dumps(folder))
+    assert copy == folder
+    assert copy.read_text("d.txt") == "archived d"
+    archive.close()
@@ -0,0 +1,77 @@
+import time
+import asyncio
+
+from tinymolecule.utils.archive import Folder, PackedArchive
+from tinymolecule.utils.async_docking import run_jobs_async
+from tinymolecule.utils.docking import read_vina_log
+from tinymolecule.utils.scheduler import SPAWN_ERROR_EXIT_CODE, TIMEOUT_EXIT_CODE
+
+
+def _exit_codes(results):
+    return {result.job.ligand: result.exit_code for result in results}
+
+
+def test_docks_every_job_and_reports_failures(make_jobs):
+    jobs = make_jobs({"a": "AFFINITY -8.5", "b": "FAIL", "c": "AFFINITY -6.0"})
+
+    results = list(run_jobs_async(jobs, n_workers=2, backoff=0))
+
+    assert _exit_codes(results) == {"a.pdbqt": 0, "b.pdbqt": 1, "c.pdbqt": 0}
+    assert "cannot parse" in [r.error for r in results if r.exit_code][0]
+    assert read_vina_log(jobs[0].out_log)[0, 0] == -8.5
+
+
+def test_killed_vina_is_retried(make_jobs):
+    jobs = make_jobs({"flaky": "FLAKY AFFINITY -7.0"})
+    (result,) = run_jobs_async(jobs, retries=0, backoff=0)
+    assert result.exit_code < 0  # killed by a signal
+
+    jobs = make_jobs({"flaky2": "FLAKY AFFINITY -7.0"})
+    (result,) = run_jobs_async(jobs, retries=1, backoff=0)
+    assert result.exit_code == 0
+
+
+def test_timeouts_are_not_retried(make_jobs):
+    jobs = make_jobs({"slow": "SLOW"})
+
+    start = time.time()
+    (result,) = run_jobs_async(jobs, timeout=0.5, retries=2, backoff=0)
+
+    assert result.exit_code == TIMEOUT_EXIT_CODE
+    assert time.time() - start < 10
+
+
+def test_job_errors_become_failed_results(tmp_path, make_jobs):
+    (job,) = make_jobs({"a": "AFFINITY -7.0"})
+    # an archived ligand that isn't in its archive
+    folder = Folder(tmp_path / "archived", PackedArchive(tmp_path / "ligands"))
+    job = job._replace(
+        ligand_path=tmp_path / "staged" / job.ligand, ligand_folder=folder
+    )
+
+    (result,) = run_jobs_async([job])
+
+    assert result.exit_code == SPAWN_ERROR_EXIT_CODE
+    assert result.error
+
+
+def test_runs_inside_a_running_event_loop(make_jobs):
+    jobs = make_jobs({f"l{i}": "AFFINITY -7.0" for i in range(4)})
+
+    async def notebook_cell():
+        return list(run_jobs_async(jobs, n_workers=2))
+
+    results = asyncio.run(notebook_cell())
+
+    assert sorted(_exit_codes(results).values()) == [0, 0, 0, 0]
+
+
+def test_stopping_early_kills_running_vina(make_jobs):
+    jobs = make_jobs({"fast": "AFFINITY -7.0", "slow": "SLOW"})
+
+    start = time.time()
+    for result in run_jobs_async(jobs, n_workers=2):
+        break
+
+    assert result.job.ligand == "fast.pdbqt"
+    assert time.time() - start < 10
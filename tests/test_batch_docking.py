@@ -0,0 +1,54 @@
+from tinymolecule.utils.batch_docking import make_batches, run_jobs_batched
+from tinymolecule.utils.docking import read_vina_log
+
+
+def test_batches_keep_job_order(make_jobs):
+    jobs = make_jobs({f"a{i}": "" for i in range(5)}, target="CCR5")
+    jobs += make_jobs({f"b{i}": "" for i in range(3)}, target="CCR2")
+    jobs += make_jobs({"c0": ""}, target="CCR5", params="p1")
+    # longest first across targets
+    order = [jobs[i] for i in (0, 5, 1, 8, 2, 6, 3, 7, 4)]
+
+    batches = make_batches(order, batch_size=2)
+
+    assert [[job.ligand for job in batch] for batch in batches] == [
+        ["a0.pdbqt", "a1.pdbqt"],
+        ["b0.pdbqt", "b1.pdbqt"],
+        ["c0.pdbqt"],
+        ["a2.pdbqt", "a3.pdbqt"],
+        ["b2.pdbqt"],
+        ["a4.pdbqt"],
+    ]
+    for batch in batches:
+        assert len({(job.target, job.params) for job in batch}) == 1
+
+
+def test_batch_results_match_single_runs(make_jobs):
+    affinities = {f"l{i}": -5.0 - i for i in range(5)}
+    jobs = make_jobs({name: f"AFFINITY {aff}" for name, aff in affinities.items()})
+
+    results = list(run_jobs_batched(jobs, n_workers=2, batch_size=2))
+
+    assert sorted(result.job.ligand for result in results) == sorted(
+        job.ligand for job in jobs
+    )
+    assert all(result.exit_code == 0 for result in results)
+    for job in jobs:
+        table = read_vina_log(job.out_log)
+        assert table[0, 0] == affinities[job.ligand[:-6]]
+        assert job.out_pdbqt.is_file()
+
+
+def test_failed_ligand_is_attributed_to_itself(make_jobs):
+    jobs = make_jobs({"a": "AFFINITY -7.0", "bad": "FAIL", "c": "AFFINITY -8.0"})
+
+    results = list(run_jobs_batched(jobs, n_workers=1, batch_size=3))
+
+    exit_codes = {result.job.ligand: result.exit_code for result in results}
+    assert exit_codes == {"a.pdbqt": 0, "bad.pdbqt": 1, "c.pdbqt": 0}
+    (failed,) = [result for result in results if result.exit_code]
+    assert "cannot parse" in failed.error
+    assert not any(
+        path.name.startswith(".batch_")
+        for path in jobs[0].out_pdbqt.parent.parent.iterdir()
+    )
@@ -0,0 +1,72 @@
+import numpy as np
+import pytest
+
+from tinymolecule.TinyDock import TinyDock
+from tinymolecule.utils.cascade import kth_best, select_binders
+from tinymolecule.utils.ledger import DONE, PENDING
+
+
+@pytest.fixture
+def tiny_dock(tmp_path, monkeypatch):
+    """
+    TinyDock on a data directory in `tmp_path` with 40 generated ligands to dock.
+    """
+
+    monkeypatch.setattr(TinyDock, "_ROOT_DIR", tmp_path)
+    td = TinyDock()
+    targets_dir = td.data_path / td.paths["targets_dir"]
+    config_dir = targets_dir / td.paths["targets_vina_config_dir"]
+    pdbqt_dir = targets_dir / td.paths["targets_pdbqt_dir"]
+    for subdir in (config_dir, pdbqt_dir, td.ligands_gen_dir):
+        subdir.mkdir(parents=True, exist_ok=True)
+    for target in td.all_targets.values():
+        (config_dir / target["vina_config"]).write_text("exhaustiveness = 8\n")
+        (pdbqt_dir / target["pdbqt"]).write_text("REMARK receptor\n")
+    for i in range(40):
+        (td.ligands_gen_dir / f"l{i:02d}.pdbqt").write_text("ROOT\nENDROOT\n")
+
+    return td
+
+
+def _top_k(td, k):
+    """
+    The k best ligands by objective among those docked on every target.
+    """
+
+    ligands = [f"l{i:02d}.pdbqt" for i in range(40)]
+    variants = [td._read_scores(trgt, ligands) for trgt in td.targets["variants"]]
+    off_targets = [td._read_scores(trgt, ligands) for trgt in td.targets["off_targets"]]
+    objective = {
+        lig: np.mean([scores[lig] for scores in variants])
+        - max(scores[lig] for scores in off_targets)
+        for lig in ligands
+        if all(lig in scores for scores in variants + off_targets)
+    }
+
+    return sorted(objective, key=objective.get, reverse=True)[:k]
+
+
+def test_select_binders_by_percentile_and_cutoff():
+    scores = {f"l{i}": float(i) for i in range(10)}  # mean affinity -i kcal/mol
+
+    assert sorted(select_binders(scores, percentile=20)) == ["l8", "l9"]
+    assert sorted(select_binders(scores, cutoff=-7)) == ["l7", "l8", "l9"]
+    assert sorted(select_binders(scores, percentile=50, cutoff=-8)) == ["l8", "l9"]
+    assert len(select_binders(scores)) == 10
+
+
+def test_kth_best():
+    assert kth_best([3.0, -1.0, 7.0, 5.0], 2) == 5.0
+    assert kth_best([3.0], 2) == -np.inf
+
+
+def test_cascade_top_k_matches_exhaustive_docking(tiny_dock):
+    tiny_dock.dock_cascade(top_k=5, variant_percentile=100, n_workers=2)
+    cascade_top = _top_k(tiny_dock, 5)
+    counts = tiny_dock._get_ledger().counts()
+    assert counts[PENDING] > 0  # some off-target jobs were pruned
+
+    tiny_dock.dock(n_workers=2)
+
+    assert tiny_dock._get_ledger().counts() == {DONE: counts[DONE] + counts[PENDING]}
+    assert cascade_top == _top_k(tiny_dock, 5)
@@ -0,0 +1,96 @@
+import numpy as np
+
+from tinymolecule.utils.cost_model import (
+    CostModel,
+    RunEstimator,
+    format_eta,
+    host_model_path,
+    ligand_features,
+)
+from tinymolecule.utils.scheduler import JobResult
+
+
+def _pdbqt(elements, torsdof):
+    atoms = [
+        f"ATOM  {i + 1:5d}  C   UNL     1       0.000   0.000   0.000  0.00  0.00    +0.000 {el}"
+        for i, el in enumerate(elements)
+    ]
+
+    return "\n".join(["ROOT"] + atoms + ["ENDROOT", f"TORSDOF {torsdof}"]) + "\n"
+
+
+def test_ligand_features_count_heavy_atoms_and_torsions(tmp_path):
+    ligand = tmp_path / "l.pdbqt"
+    ligand.write_text(_pdbqt(["C", "C", "OA", "HD", "N", "H"], 3))
+
+    assert ligand_features(ligand) == (4, 3)
+    assert ligand_features(tmp_path / "missing.pdbqt") == (25, 5)
+
+
+def test_updates_converge_to_measured_times():
+    rng = np.random.default_rng(0)
+    true_weights = np.array([-5.0, 1.2, 0.05, 0.4, 0.9, -0.7])
+    features = np.column_stack(
+        [
+            np.ones(500),
+            np.log(rng.integers(10, 60, 500)),
+            rng.integers(0, 12, 500),
+            np.log(rng.uniform(5e3, 3e4, 500)),
+            np.log(rng.choice([8, 16, 32], 500)),
+            np.log(rng.choice([1, 2, 4], 500)),
+        ]
+    )
+    seconds = np.exp(features @ true_weights)
+
+    model = CostModel()
+    before = np.abs(np.log(model.predict(features) / seconds)).mean()
+    for x, y in zip(features, seconds):
+        model.update(x, y)
+    after = np.abs(np.log(model.predict(features) / seconds)).mean()
+
+    assert after < 0.05 < before
+
+
+def test_save_and_load(tmp_path):
+    path = host_model_path(tmp_path / "cost_model.json", host="node1")
+    assert path.name == "cost_model.node1.json"
+    assert np.allclose(CostModel.load(path).weights, CostModel().weights)
+
+    model = CostModel()
+    model.update(np.ones(6), 42.0)
+    model.save(path)
+
+    loaded = CostModel.load(path)
+    assert np.allclose(loaded.weights, model.weights)
+    assert np.allclose(loaded.covariance, model.covariance)
+    assert list(tmp_path.iterdir()) == [path]
+
+
+def test_run_estimator_orders_longest_first_and_tracks_eta(make_jobs):
+    jobs = make_jobs(
+        {
+            "small": _pdbqt(["C"] * 10, 1),
+            "large": _pdbqt(["C"] * 50, 10),
+            "medium": _pdbqt(["C"] * 25, 4),
+        }
+    )
+    estimator = RunEstimator(jobs, CostModel(), n_workers=2)
+
+    assert [job.ligand for job in estimator.jobs] == [
+        "large.pdbqt",
+        "medium.pdbqt",
+        "small.pdbqt",
+    ]
+    predicted = estimator.model.predict(estimator.features)
+    assert np.isclose(
+        estimator.eta(refresh_seconds=0), max(predicted.sum() / 2, predicted.max())
+    )
+
+    for job in estimator.jobs:
+        estimator.finished(JobResult(job, 0, 1.0))
+    assert estimator.eta(refresh_seconds=0) == 0.0
+
+
+def test_format_eta():
+    assert format_eta(75) == "1m15s"
+    assert format_eta(2 * 3600 + 5 * 60 + 9) == "2h05m"
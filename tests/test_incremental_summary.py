@@ -0,0 +1,100 @@
+import os
+
+import pytest
+
+from tinymolecule.utils import docking
+from tinymolecule.utils.archive import Folder, PackedArchive
+from tinymolecule.utils.docking import update_tiered_logs_table, write_vina_log
+
+
+def _write_log(path, affinity):
+    write_vina_log(path, [(affinity, 0.0, 0.0)])
+
+
+@pytest.fixture
+def logs_dirs(tmp_path):
+    """
+    Standard logs of l0 to l2 and a refined log of l0.
+    """
+
+    standard, refine = tmp_path / "logs", tmp_path / "logs_refine"
+    standard.mkdir()
+    refine.mkdir()
+    for i in range(3):
+        _write_log(standard / f"l{i}.txt", -6.0 - i)
+    _write_log(refine / "l0.txt", -9.5)
+
+    return [("refine", refine), ("standard", standard)]
+
+
+def _affinities(summary):
+    return dict(zip(summary["uuid"], summary["affin_kcal_mol-1_1"]))
+
+
+def test_unchanged_logs_are_not_parsed_again(tmp_path, logs_dirs, monkeypatch):
+    paths = (tmp_path / "summary.csv", tmp_path / "state.csv")
+    summary, n_parsed, changed = update_tiered_logs_table(
+        logs_dirs, *paths, n_workers=1
+    )
+    assert (n_parsed, changed) == (4, True)
+    assert _affinities(summary) == {"l0": -9.5, "l1": -7.0, "l2": -8.0}
+    assert summary.set_index("uuid")["tier"].to_dict() == {
+        "l0": "refine",
+        "l1": "standard",
+        "l2": "standard",
+    }
+
+    def fail(*args, **kwargs):
+        raise AssertionError("parsed a log")
+
+    monkeypatch.setattr(docking, "parse_vina_logs", fail)
+    again, n_parsed, changed = update_tiered_logs_table(logs_dirs, *paths)
+
+    assert (n_parsed, changed) == (0, False)
+    assert again.equals(summary)
+
+
+def test_only_new_or_changed_logs_are_parsed(tmp_path, logs_dirs):
+    paths = (tmp_path / "summary.csv", tmp_path / "state.csv")
+    update_tiered_logs_table(logs_dirs, *paths, n_workers=1)
+    standard = logs_dirs[1][1]
+
+    _write_log(standard / "l1.txt", -7.7)
+    os.utime(standard / "l1.txt", ns=(1, 1))  # a new version even within one mtime tick
+    _write_log(standard / "l3.txt", -5.5)
+    summary, n_parsed, _ = update_tiered_logs_table(logs_dirs, *paths, n_workers=1)
+
+    assert n_parsed == 2
+    assert _affinities(summary) == {"l0": -9.5, "l1": -7.7, "l2": -8.0, "l3": -5.5}
+
+
+def test_removed_logs_fall_back_to_the_next_tier(tmp_path, logs_dirs):
+    paths = (tmp_path / "summary.csv", tmp_path / "state.csv")
+    update_tiered_logs_table(logs_dirs, *paths, n_workers=1)
+
+    os.remove(logs_dirs[0][1] / "l0.txt")
+    os.remove(logs_dirs[1][1] / "l2.txt")
+    summary, _, changed = update_tiered_logs_table(logs_dirs, *paths, n_workers=1)
+
+    assert changed
+    assert _affinities(summary) == {"l0": -6.0, "l1": -7.0}
+    assert set(summary["tier"]) == {"standard"}
+
+
+def test_rewritten_archive_entries_are_parsed_again(tmp_path):
+    logs_dir = tmp_path / "logs"
+    _write_log(tmp_path / "log.txt", -6.0)
+    with PackedArchive(tmp_path / "logs_archive") as archive:
+        archive.write_many(
+            [(f"logs/l{i}.txt", (tmp_path / "log.txt").read_text()) for i in range(3)]
+        )
+        logs_dirs = [("standard", Folder(logs_dir, archive, "logs"))]
+        paths = (tmp_path / "summary.csv", tmp_path / "state.csv")
+        update_tiered_logs_table(logs_dirs, *paths, n_workers=1)
+
+        _write_log(tmp_path / "log.txt", -8.0)
+        archive.write("logs/l1.txt", (tmp_path / "log.txt").read_text())
+        summary, n_parsed, _ = update_tiered_logs_table(logs_dirs, *paths, n_workers=1)
+
+    assert n_parsed == 1
+    assert _affinities(summary) == {"l0": -6.0, "l1": -8.0, "l2": -6.0}
@@ -0,0 +1,111 @@
+import os
+import time
+from multiprocessing import Pool, Process
+from types import SimpleNamespace
+
+from tinymolecule.utils.ledger import DONE, PENDING, RUNNING, SKIPPED, JobLedger
+
+
+TARGET, PARAMS = "CCR5", "p0"
+
+
+def _make_ledger(db_path, n_ligands, **kwargs):
+    ledger = JobLedger(db_path, **kwargs)
+    ledger.add_ligands(f"l{i:04d}.pdbqt" for i in range(n_ligands))
+    ledger.enqueue(TARGET, PARAMS)
+
+    return ledger
+
+
+def _claim_all(db_path, worker):
+    """
+    Claims small batches until no work is left, finishing every job.
+    """
+
+    ledger = JobLedger(db_path, worker=worker)
+    claimed = []
+    while True:
+        jobs = ledger.claim([(TARGET, PARAMS)], 3)
+        if not jobs:
+            break
+        for ligand, target, params in jobs:
+            job = SimpleNamespace(ligand=ligand, target=target, params=params)
+            ledger.mark_finished(
+                SimpleNamespace(job=job, exit_code=0, duration=0.0, error="")
+            )
+        claimed += jobs
+    ledger.close()
+
+    return claimed
+
+
+def _claim_and_crash(db_path, n):
+    ledger = JobLedger(db_path, lease_seconds=0.5, worker="crashed")
+    ledger.claim([(TARGET, PARAMS)], n)
+    os._exit(1)  # no heartbeat, no cleanup, the jobs stay running
+
+
+def test_concurrent_workers_never_claim_a_job_twice(tmp_path):
+    db_path = tmp_path / "ledger.sqlite"
+    _make_ledger(db_path, 300).close()
+
+    with Pool(4) as pool:
+        claims = pool.starmap(_claim_all, [(db_path, f"worker{i}") for i in range(4)])
+
+    claimed = [job for worker_claims in claims for job in worker_claims]
+    assert len(claimed) == len(set(claimed)) == 300
+    ledger = JobLedger(db_path)
+    assert ledger.counts() == {DONE: 300}
+    ledger.close()
+
+
+def test_expired_leases_are_reclaimed(tmp_path):
+    db_path = tmp_path / "ledger.sqlite"
+    _make_ledger(db_path, 10).close()
+
+    crashed = Process(target=_claim_and_crash, args=(db_path, 4))
+    crashed.start()
+    crashed.join()
+
+    ledger = JobLedger(db_path, worker="survivor")
+    assert ledger.counts() == {RUNNING: 4, PENDING: 6}
+    # leased jobs aren't handed out while the lease holds
+    assert len(ledger.claim([(TARGET, PARAMS)], 10)) == 6
+
+    time.sleep(0.6)
+    reclaimed = ledger.claim([(TARGET, PARAMS)], 10)
+    assert len(reclaimed) == 4
+    rows = ledger.conn.execute("SELECT DISTINCT worker FROM jobs").fetchall()
+    assert rows == [("survivor",)]
+    ledger.close()
+
+
+def test_reset_stale_keeps_live_leases(tmp_path):
+    db_path = tmp_path / "ledger.sqlite"
+    _make_ledger(db_path, 10).close()
+
+    crashed = Process(target=_claim_and_crash, args=(db_path, 4))
+    crashed.start()
+    crashed.join()
+
+    alive = JobLedger(db_path, lease_seconds=0.3, worker="alive")
+    alive.claim([(TARGET, PARAMS)], 3)
+    alive.start_heartbeat()
+    time.sleep(0.6)
+
+    alive.reset_stale()
+    assert alive.counts() == {RUNNING: 3, PENDING: 7}
+    alive.close()
+
+
+def test_restrict_skips_unselected_jobs(tmp_path):
+    ledger = _make_ledger(tmp_path / "ledger.sqlite", 10)
+
+    ledger.restrict(TARGET, PARAMS, ["l0000.pdbqt", "l0001.pdbqt"])
+    assert ledger.counts() == {PENDING: 2, SKIPPED: 8}
+    assert sorted(ledger.pending(TARGET, PARAMS)) == ["l0000.pdbqt", "l0001.pdbqt"]
+
+    # a wider selection later picks skipped jobs up again
+    ledger.restrict(TARGET, PARAMS, ["l0000.pdbqt", "l0001.pdbqt", "l0002.pdbqt"])
+    assert ledger.counts() == {PENDING: 3, SKIPPED: 7}
+    ledger.close()
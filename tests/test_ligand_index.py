@@ -0,0 +1,77 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from tinymolecule.utils import ligand_index
+from tinymolecule.utils.ligand_index import LigandIndex
+from tinymolecule.utils.molecules import PROPERTY_NAMES
+
+
+@pytest.fixture
+def calculated(monkeypatch):
+    """
+    SMILES whose properties get calculated, each property being the SMILES length.
+    """
+
+    smiles = []
+
+    def properties(smi):
+        smiles.append(smi)
+        return {name: float(len(smi)) for name in PROPERTY_NAMES}
+
+    monkeypatch.setattr(ligand_index, "molecular_properties", properties)
+
+    return smiles
+
+
+def _write_table(path, rows, mtime_ns):
+    pd.DataFrame(rows, columns=["uuid", "SMILES"]).to_csv(path, index=False)
+    os.utime(path, ns=(mtime_ns, mtime_ns))  # a new version even within one mtime tick
+
+
+def test_looks_up_smiles_by_id(tmp_path):
+    csv_path = tmp_path / "gen.csv"
+    _write_table(
+        csv_path,
+        [("c3", "CCO"), ("a1", "c1ccccc1"), ("b2", "CCN"), ("a1", "OCC")],
+        1,
+    )
+    index = LigandIndex(csv_path, tmp_path / "index")
+
+    assert len(index) == 3
+    assert index.smiles(["b2", "zz", "a1", "c3"]) == ["CCN", None, "c1ccccc1", "CCO"]
+    assert "c3" in index and "zz" not in index
+    assert index.positions(["a1", "b2", "c3", "zz"]).tolist() == [0, 1, 2, -1]
+
+
+def test_properties_are_calculated_once(tmp_path, calculated):
+    csv_path = tmp_path / "gen.csv"
+    _write_table(csv_path, [("a1", "CCO"), ("b2", "not a smiles"), ("c3", "CCCN")], 1)
+    index = LigandIndex(csv_path, tmp_path / "index")
+
+    props = index.properties(["c3", "zz", "b2"], names=["logP", "QED"])
+    assert props.columns.tolist() == ["logP", "QED"]
+    assert np.array_equal(
+        props.values, [[4.0, 4.0], [np.nan, np.nan], [np.nan, np.nan]], equal_nan=True
+    )
+    assert calculated == ["CCCN"]
+
+    props = index.properties(["a1", "c3", "b2"])
+    assert props["weight"].tolist()[:2] == [3.0, 4.0]
+    assert calculated == ["CCCN", "CCO"]
+
+
+def test_changed_table_is_reindexed_keeping_known_properties(tmp_path, calculated):
+    csv_path = tmp_path / "gen.csv"
+    _write_table(csv_path, [("a1", "CCO"), ("b2", "CCN")], 1)
+    index = LigandIndex(csv_path, tmp_path / "index")
+    index.properties(["a1", "b2"])
+
+    _write_table(csv_path, [("a1", "CCO"), ("b2", "CCCCN"), ("d4", "CC")], 2)
+
+    assert index.smiles(["b2", "d4"]) == ["CCCCN", "CC"]
+    assert index.properties(["a1", "b2", "d4"])["SA"].tolist() == [3.0, 5.0, 2.0]
+    assert calculated == ["CCO", "CCN", "CCCCN", "CC"]
+    assert sorted(os.listdir(tmp_path)) == ["gen.csv", "index"]
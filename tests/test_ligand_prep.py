@@ -0,0 +1,41 @@
+from tinymolecule.utils.ligand_prep import failures_table, pdbqt_error, prepare_ligands
+
+
+MOLECULES = [
+    ("m0", "CCO"),
+    ("m1", "not a smiles"),
+    ("m2", "c1ccccc1O"),
+    ("m3", "CC(=O)N"),
+    ("m4", "C1CC"),  # unclosed ring
+    ("m5", "CCN"),
+]
+
+
+def test_pool_prepares_in_input_order_with_failures(tmp_path):
+    results = list(prepare_ligands(MOLECULES, tmp_path, n_workers=2, chunksize=2))
+
+    assert [result.uuid for result in results] == [uuid for uuid, _ in MOLECULES]
+    failed = failures_table(results)
+    assert failed.uuid.tolist() == ["m1", "m4"]
+    assert failed.error.str.len().gt(0).all()
+    for result in results:
+        pdbqt_path = tmp_path / f"{result.uuid}.pdbqt"
+        assert pdbqt_path.is_file() == (not result.error)
+        if not result.error:
+            assert pdbqt_error(pdbqt_path.read_text()) == ""
+    assert sorted(path.name for path in tmp_path.iterdir()) == [
+        "m0.pdbqt",
+        "m2.pdbqt",
+        "m3.pdbqt",
+        "m5.pdbqt",
+    ]
+
+
+def test_pdbqt_error_flags_unembedded_molecules():
+    atom = "ATOM      1  C   UNL     1       {x:.3f}   0.000   0.000  0.00  0.00    +0.000 C"
+    embedded = "\n".join([atom.format(x=0.0), atom.format(x=1.5)])
+    flat = "\n".join([atom.format(x=0.0), atom.format(x=0.0)])
+
+    assert pdbqt_error(embedded) == ""
+    assert pdbqt_error(flat) == "3D embedding failed"
+    assert pdbqt_error("REMARK nothing\n") == "no atoms written"
@@ -0,0 +1,87 @@
+import numpy as np
+
+from tinymolecule.utils.docking import (
+    parse_vina_log,
+    parse_vina_logs,
+    read_vina_log,
+    write_vina_log,
+)
+
+
+HEADER = """AutoDock Vina v1.2.3
+
+Scoring function : vina
+   1    -99.9      0.000      0.000  <- not part of any table
+
+mode |   affinity | dist from best mode
+     | (kcal/mol) | rmsd l.b.| rmsd u.b.
+-----+------------+----------+----------
+"""
+
+
+def _log(rows, footer="Writing output ... done.\n"):
+    lines = [
+        f"{i + 1:4d}    {aff:8.1f}   {lb:8.3f}   {ub:8.3f}"
+        for i, (aff, lb, ub) in enumerate(rows)
+    ]
+
+    return HEADER + "\n".join(lines) + "\n" + footer
+
+
+def test_parses_the_results_table_only():
+    table = parse_vina_log(_log([(-7.5, 0, 0), (-7.1, 1.2, 2.5)]), n_modes=3)
+
+    assert np.array_equal(
+        table, [[-7.5, 0, 0], [-7.1, 1.2, 2.5], [np.nan] * 3], equal_nan=True
+    )
+
+
+def test_rows_past_n_modes_are_dropped():
+    rows = [(-8.0 + 0.1 * i, i, 2 * i) for i in range(5)]
+
+    table = parse_vina_log(_log(rows), n_modes=2)
+
+    assert np.allclose(table, rows[:2])
+
+
+def test_table_ends_at_the_first_line_that_is_not_the_next_row():
+    text = _log([(-7.5, 0, 0)], footer="   3    -6.0      1.000      2.000\n")
+
+    table = parse_vina_log(text, n_modes=3)
+
+    assert np.allclose(table[0], [-7.5, 0, 0]) and np.isnan(table[1:]).all()
+
+
+def test_logs_without_a_complete_table_are_not_parsed():
+    assert parse_vina_log(HEADER) is None  # killed before any mode was written
+    assert parse_vina_log(HEADER.replace("-----+", "")) is None
+    assert parse_vina_log("") is None
+
+
+def test_written_logs_read_back(tmp_path):
+    results = np.array([[-9.2, 0.0, 0.0], [-8.7, 1.5, 3.25]])
+    write_vina_log(tmp_path / "l.txt", results)
+
+    table = read_vina_log(tmp_path / "l.txt", n_modes=2)
+
+    assert np.allclose(table, results)
+
+
+def test_parallel_chunks_keep_log_order(tmp_path):
+    logfiles = []
+    for i in range(7):
+        logfiles.append(f"l{i}.txt")
+        if i == 3:  # unfinished log
+            (tmp_path / logfiles[-1]).write_text(HEADER)
+        else:
+            (tmp_path / logfiles[-1]).write_text(_log([(-5.0 - i, 0, 0)]))
+
+    table, parsed = parse_vina_logs(
+        tmp_path, logfiles, n_workers=2, chunksize=2, n_modes=2
+    )
+
+    assert parsed.tolist() == [True, True, True, False, True, True, True]
+    assert np.array_equal(
+        table[:, 0], [-5.0, -6.0, -7.0, np.nan, -9.0, -10.0, -11.0], equal_nan=True
+    )
+    assert np.isnan(table[:, 1]).all()
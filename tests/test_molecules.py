@@ -0,0 +1,49 @@
+import numpy as np
+import pandas as pd
+
+from tinymolecule.utils.helper_fn import hash_smiles
+from tinymolecule.utils.molecules import MoleculeIds, canonical_smiles
+
+
+def test_canonical_smiles_of_missing_or_blank_smiles_is_none():
+    assert canonical_smiles(np.nan) is None
+    assert canonical_smiles(None) is None
+    assert canonical_smiles("") is None
+    assert canonical_smiles("  ") is None
+    assert canonical_smiles("OCC") == canonical_smiles("CCO")
+
+
+def test_assign_gives_missing_or_blank_smiles_no_id():
+    smiles = pd.Series(["CCO", np.nan, "", "OCC", " "])
+
+    ids = MoleculeIds().assign(smiles)
+
+    assert ids["uuid"][[1, 2, 4]].isna().all()
+    assert ids["canonical_smiles"][[1, 2, 4]].isna().all()
+    assert ids["uuid"][0] == ids["uuid"][3]
+
+
+def test_known_id_in_a_later_batch_stays_with_its_molecule():
+    # "C" and "CC" hash onto the same 1-character ID
+    known_id = MoleculeIds(hash_crop=1).assign(pd.Series(["CC"]))["uuid"][0]
+    batches = [
+        (pd.Series(["C"]), pd.Series([np.nan])),  # new molecule
+        (pd.Series(["CC"]), pd.Series([known_id])),  # docked in an earlier run
+    ]
+
+    molecule_ids = MoleculeIds(hash_crop=1)
+    molecule_ids.add_known(
+        pd.concat([smiles for smiles, _ in batches], ignore_index=True),
+        pd.concat([uuids for _, uuids in batches], ignore_index=True),
+    )
+    new_ids, known_ids = (molecule_ids.assign(*batch)["uuid"][0] for batch in batches)
+
+    assert known_ids == known_id
+    assert new_ids != known_id
+    assert molecule_ids.n_collisions == 1
+
+
+def test_hash_smiles_still_accepts_a_seed():
+    assert (
+        hash_smiles("CCO", hash_seed=7) == hash_smiles("CCO") == hash_smiles("CCO", 8)
+    )
@@ -0,0 +1,76 @@
+import numpy as np
+import pytest
+
+from tinymolecule.utils import pareto
+from tinymolecule.utils.pareto import (
+    crowding_distance,
+    non_dominated_sort,
+    pareto_order,
+)
+
+
+def _brute_force_fronts(points):
+    """
+    Fronts by peeling off the non-dominated points over and over, comparing all pairs.
+    """
+
+    fronts = np.full(len(points), -1)
+    front = 0
+    while (fronts < 0).any():
+        left = np.flatnonzero(fronts < 0)
+        rest = points[left]
+        no_worse = (rest[:, None, :] <= rest[None, :, :]).all(axis=2)
+        better = (rest[:, None, :] < rest[None, :, :]).any(axis=2)
+        dominated = (no_worse & better).any(axis=0)
+        fronts[left[~dominated]] = front
+        front += 1
+
+    return fronts
+
+
+@pytest.mark.parametrize("n_objectives", [1, 2, 3, 4, 6])
+def test_fronts_match_brute_force(n_objectives, monkeypatch):
+    # few distinct values, so many points tie on some or all objectives
+    points = np.random.default_rng(n_objectives).integers(0, 8, (400, n_objectives))
+    monkeypatch.setattr(pareto, "_BLOCK_POINTS", 32)  # many blocks
+
+    assert non_dominated_sort(points).tolist() == _brute_force_fronts(points).tolist()
+
+
+@pytest.mark.parametrize("n_objectives", [2, 5])
+def test_max_fronts_cuts_off_later_fronts(n_objectives, monkeypatch):
+    points = np.random.default_rng(0).normal(size=(300, n_objectives))
+    monkeypatch.setattr(pareto, "_BLOCK_POINTS", 32)
+
+    fronts = non_dominated_sort(points, max_fronts=3)
+
+    expected = _brute_force_fronts(points)
+    assert fronts.tolist() == np.where(expected < 3, expected, -1).tolist()
+
+
+def test_crowding_distance_within_fronts():
+    points = np.array([[0.0, 4.0], [1.0, 2.0], [3.0, 1.0], [4.0, 0.0], [2.0, 3.0]])
+    fronts = np.array([0, 0, 0, 0, 1])
+
+    distance = crowding_distance(points, fronts)
+
+    # neighbors of (1, 2) span 3 of 4 on both objectives, of (3, 1) 3 of 4 and 2 of 4
+    assert distance.tolist() == [np.inf, 1.5, 1.25, np.inf, np.inf]
+
+
+def test_pareto_order_ranks_by_front_then_crowding():
+    points = np.random.default_rng(2).normal(size=(200, 3))
+
+    order, fronts, distance = pareto_order(points, max_fronts=4)
+
+    keys = [
+        (front if front >= 0 else np.inf, -dist)
+        for front, dist in zip(fronts[order], distance[order])
+    ]
+    assert keys == sorted(keys)
+    assert sorted(order.tolist()) == list(range(200))
+
+
+def test_rejects_missing_objective_values():
+    with pytest.raises(ValueError):
+        non_dominated_sort(np.array([[1.0, np.nan]]))
@@ -0,0 +1,25 @@
+from tinymolecule.utils.ligand_prep import conversion_settings, prepare_chunk
+from tinymolecule.utils.prep_cache import PrepCache
+
+
+def test_reprep_with_new_settings_keeps_old_entry(tmp_path):
+    out_dir = tmp_path / "ligands"
+    out_dir.mkdir()
+    molecule = ("ec0fdc31", "CCO")
+
+    openbabel_cache = PrepCache(tmp_path / "cache", conversion_settings("openbabel"))
+    (result,) = prepare_chunk([molecule], out_dir, engine="openbabel")
+    openbabel_key = openbabel_cache.key("CCO")
+    openbabel_cache.store(openbabel_key, result, out_dir)
+    openbabel_pdbqt = (out_dir / "ec0fdc31.pdbqt").read_text()
+
+    rdkit_cache = PrepCache(tmp_path / "cache", conversion_settings("rdkit"))
+    (result,) = prepare_chunk([molecule], out_dir, engine="rdkit")
+    rdkit_key = rdkit_cache.key("CCO")
+    rdkit_cache.store(rdkit_key, result, out_dir)
+    rdkit_pdbqt = (out_dir / "ec0fdc31.pdbqt").read_text()
+
+    assert openbabel_key != rdkit_key
+    assert openbabel_pdbqt != rdkit_pdbqt
+    assert openbabel_cache.lookup(openbabel_key)[0].read_text() == openbabel_pdbqt
+    assert rdkit_cache.lookup(rdkit_key)[0].read_text() == rdkit_pdbqt
@@ -0,0 +1,80 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from tinymolecule.utils.ranking import prioritize_results, top_k_indices
+from tinymolecule.utils.results_store import ResultsStore, update_results_store
+
+
+VARIANTS = ["WT_CCR5", "CCR5_Y3D", "CCR5_G301E"]
+OFF_TARGETS = ["CCR2", "CCR1"]
+
+
+@pytest.fixture
+def screen(tmp_path, make_summary):
+    """
+    Results store of 200 molecules with random best affinities, each target missing
+    about a tenth of them, and those affinities as a (ligand, target) DataFrame.
+    """
+
+    rng = np.random.default_rng(0)
+    ligands = [f"l{i:03d}" for i in range(200)]
+    best = pd.DataFrame(
+        rng.uniform(-11, -4, (len(ligands), len(VARIANTS + OFF_TARGETS))),
+        index=ligands,
+        columns=VARIANTS + OFF_TARGETS,
+    )
+    best = best.mask(rng.random(best.shape) < 0.1)
+    summaries = {
+        target: make_summary(best[target].dropna().to_dict()) for target in best
+    }
+    groups = {target: "variants" for target in VARIANTS}
+    groups.update({target: "off_targets" for target in OFF_TARGETS})
+    update_results_store(tmp_path, summaries, groups)
+
+    return ResultsStore(tmp_path), best
+
+
+def _ranked(best, n_modes=None):
+    """
+    Objective of every molecule docked on all targets by sorting them all, best first.
+    """
+
+    # mean affinity over the modes, which are 0.5 kcal/mol apart
+    scores = -(best.dropna() + 0.25 * ((n_modes or 10) - 1))
+    objective = scores[VARIANTS].mean(axis=1) - scores[OFF_TARGETS].max(axis=1)
+
+    return objective.sort_values(ascending=False)
+
+
+def test_top_k_indices_match_a_full_sort():
+    values = np.random.default_rng(1).normal(size=1000)
+
+    assert top_k_indices(values, 7).tolist() == np.argsort(-values)[:7].tolist()
+    assert top_k_indices(values[:5], 7).tolist() == np.argsort(-values[:5]).tolist()
+
+
+def test_full_ranking_matches_a_full_sort(screen):
+    store, best = screen
+
+    priority = prioritize_results(store, VARIANTS, OFF_TARGETS)
+
+    expected = _ranked(best)
+    assert priority["uuid"].tolist() == expected.index.tolist()
+    assert np.allclose(priority["objective"], expected.values, atol=1e-4)
+
+
+@pytest.mark.parametrize("chunk_size", [None, 1, 17, 1000])
+def test_streaming_top_k_matches_a_full_sort(screen, chunk_size):
+    store, best = screen
+
+    priority = prioritize_results(
+        store, VARIANTS, OFF_TARGETS, top_k=10, chunk_size=chunk_size, n_modes=3
+    )
+
+    expected = _ranked(best, n_modes=3)[:10]
+    assert priority["uuid"].tolist() == expected.index.tolist()
+    assert np.allclose(priority["objective"], expected.values, atol=1e-4)
+    assert np.allclose(
+        priority["variants_mean"] - priority["off_targets_max"], priority["objective"]
+    )
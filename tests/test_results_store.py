@@ -0,0 +1,84 @@
+import numpy as np
+
+from tinymolecule.utils.docking import N_MODES, get_vina_header
+from tinymolecule.utils.results_store import ResultsStore, update_results_store
+
+
+def test_store_reads_back_summaries(tmp_path, make_summary):
+    summaries = {
+        "WT_CCR5": make_summary({"a": -9.0, "b": -8.0}),
+        "CCR2": make_summary({"b": -6.0, "c": -5.0}, tier="refine"),
+    }
+    update_results_store(
+        tmp_path, summaries, {"WT_CCR5": "variants", "CCR2": "off_targets"}
+    )
+
+    store = ResultsStore(tmp_path)
+    assert store.targets == ["WT_CCR5", "CCR2"]
+    assert store.ligands.tolist() == ["a", "b", "c"]
+    assert store.docked(["CCR2", "wt_ccr5"]).tolist() == [
+        [False, True],
+        [True, True],
+        [True, False],
+    ]
+    affinities = store.affinities(
+        ["WT_CCR5", "CCR2"], rows=store.ligand_indices(["b"]), n_modes=2
+    )
+    assert affinities.tolist() == [[[-8.0, -7.5], [-6.0, -5.5]]]
+    assert store.results.shape == (3, 2, N_MODES, 3)
+
+    summary = store.summary("CCR2")
+    assert summary["uuid"].tolist() == ["b", "c"]
+    assert set(summary["tier"]) == {"refine"}
+    assert np.allclose(
+        summary[get_vina_header()].values, summaries["CCR2"][get_vina_header()].values
+    )
+
+
+def test_updates_replace_targets_and_append_ligands(tmp_path, make_summary):
+    update_results_store(
+        tmp_path,
+        {"WT_CCR5": make_summary({"a": -9.0}), "CCR2": make_summary({"a": -6.0})},
+        {"WT_CCR5": "variants", "CCR2": "off_targets"},
+    )
+
+    update_results_store(tmp_path, {"CCR2": make_summary({"b": -7.0, "a": -6.5})})
+    update_results_store(
+        tmp_path, {"CCR1": make_summary({"c": -4.0})}, {"CCR1": "off_targets"}
+    )
+
+    store = ResultsStore(tmp_path)
+    assert store.ligands.tolist() == ["a", "b", "c"]
+    assert store.groups == {
+        "WT_CCR5": "variants",
+        "CCR2": "off_targets",
+        "CCR1": "off_targets",
+    }
+    # WT_CCR5 was written before b and c existed
+    affinities = store.affinities(["WT_CCR5", "CCR2", "CCR1"], n_modes=1)[:, :, 0]
+    assert np.array_equal(
+        affinities,
+        [[-9.0, -6.5, np.nan], [np.nan, -7.0, np.nan], [np.nan, np.nan, -4.0]],
+        equal_nan=True,
+    )
+    assert store.docked(["WT_CCR5"], rows=slice(1, 3)).tolist() == [[False], [False]]
+
+
+def test_open_store_keeps_reading_its_version(tmp_path, make_summary):
+    update_results_store(
+        tmp_path, {"CCR2": make_summary({"a": -6.0})}, {"CCR2": "off_targets"}
+    )
+    reader = ResultsStore(tmp_path)
+
+    update_results_store(
+        tmp_path, {"CCR2": make_summary({"a": -8.0, "b": -7.0}, tier="refine")}
+    )
+
+    assert reader.ligands.tolist() == ["a"]
+    assert reader.affinities(["CCR2"], n_modes=1).ravel().tolist() == [-6.0]
+    assert reader.summary("CCR2")["tier"].tolist() == ["standard"]
+    store = ResultsStore(tmp_path)
+    assert store.version == reader.version + 1
+    assert store.affinities(["CCR2"], n_modes=1).ravel().tolist() == [-8.0, -7.0]
+    # files of the old version are gone once replaced
+    assert len(list(tmp_path.glob("*.npy"))) == 3
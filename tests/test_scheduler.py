@@ -0,0 +1,85 @@
+import queue
+
+from tinymolecule.utils.docking import read_vina_log
+from tinymolecule.utils.ledger import DONE, FAILED, JobLedger
+from tinymolecule.utils.scheduler import (
+    TIMEOUT_EXIT_CODE,
+    run_jobs,
+    run_jobs_streaming,
+)
+
+
+def _exit_codes(results):
+    return {result.job.ligand: result.exit_code for result in results}
+
+
+def test_pool_docks_every_job_and_reports_failures(make_jobs):
+    jobs = make_jobs(
+        {"a": "AFFINITY -8.5", "b": "FAIL", "c": "AFFINITY -6.0", "d": "AFFINITY -9.0"}
+    )
+
+    results = list(run_jobs(jobs, n_workers=2))
+
+    assert _exit_codes(results) == {
+        "a.pdbqt": 0,
+        "b.pdbqt": 1,
+        "c.pdbqt": 0,
+        "d.pdbqt": 0,
+    }
+    errors = {result.job.ligand: result.error for result in results}
+    assert "cannot parse" in errors["b.pdbqt"] and errors["a.pdbqt"] == ""
+    assert read_vina_log(jobs[0].out_log)[0, 0] == -8.5
+    assert read_vina_log(jobs[3].out_log)[1, 0] == -8.5
+
+
+def test_timed_out_job_is_killed(make_jobs):
+    jobs = make_jobs({"slow": "SLOW", "fast": "AFFINITY -7.0"})
+
+    results = list(run_jobs(jobs, n_workers=2, timeout=0.5))
+
+    assert _exit_codes(results) == {"slow.pdbqt": TIMEOUT_EXIT_CODE, "fast.pdbqt": 0}
+    assert max(result.duration for result in results) < 10
+
+
+def test_streaming_docks_jobs_until_the_queue_ends(make_jobs):
+    jobs = make_jobs({f"l{i}": "AFFINITY -7.0" for i in range(6)})
+    job_queue = queue.Queue()
+    for job in jobs:
+        job_queue.put(job)
+    job_queue.put(None)
+
+    results = list(run_jobs_streaming(job_queue, n_workers=2))
+
+    assert sorted(result.job.ligand for result in results) == sorted(
+        job.ligand for job in jobs
+    )
+    assert all(result.exit_code == 0 for result in results)
+
+
+def test_interrupted_run_resumes_from_pending_jobs(tmp_path, make_jobs):
+    jobs = make_jobs(
+        {"a": "AFFINITY -7.0", "b": "FAIL", "c": "AFFINITY -7.0", "d": "AFFINITY -7.0"}
+    )
+    ledger = JobLedger(tmp_path / "ledger.sqlite", max_attempts=2)
+    ledger.add_ligands(job.ligand for job in jobs)
+    ledger.enqueue("CCR5", "p0")
+
+    # a first run stops after two jobs
+    ledger.mark_running(jobs[:2])
+    for result in run_jobs(jobs[:2], n_workers=1):
+        ledger.mark_finished(result)
+    assert sorted(ledger.pending("CCR5", "p0")) == ["b.pdbqt", "c.pdbqt", "d.pdbqt"]
+
+    # the next one docks what's left, and the failed job once more
+    by_ligand = {job.ligand: job for job in jobs}
+    resumed = [by_ligand[ligand] for ligand in ledger.pending("CCR5", "p0")]
+    ledger.mark_running(resumed)
+    for result in run_jobs(resumed, n_workers=2):
+        ledger.mark_finished(result)
+
+    assert ledger.pending("CCR5", "p0") == []
+    assert ledger.counts() == {DONE: 3, FAILED: 1}
+    ((ligand, _, attempts, exit_code, error),) = ledger.failures()
+    assert (ligand, attempts, exit_code) == ("b.pdbqt", 2, 1)
+    assert "cannot parse" in error
+    ledger.close()
@@ -2,15 +2,23 @@ import os
 from copy import deepcopy
 from pathlib import Path
 from typing import Optional, Union, List, Tuple
-from functools import reduce
 
 import yaml
+import numpy as np
 import pandas as pd
 
-from moses.metrics.utils import get_mol, logP, weight, get_n_rings, mol_passes_filters
-
-from tinymolecule.utils.molecules import molecular_properties
-from tinymolecule.utils.helper_fn import get_mean_baff_df
+from tinymolecule.utils.molecules import PROPERTY_NAMES
+from tinymolecule.utils.ligand_index import LigandIndex
+from tinymolecule.utils.docking import update_tiered_logs_table
+from tinymolecule.utils.archive import Folder, PackedArchive
+from tinymolecule.utils.pose_store import PoseStore, build_pose_store
+from tinymolecule.utils.results_store import ResultsStore, update_results_store
+from tinymolecule.utils.ranking import (
+    objective_sense,
+    objective_table,
+    prioritize_results,
+)
+from tinymolecule.utils.pareto import pareto_order
 
 
 class TinyAnalyze:
@@ -55,46 +63,223 @@ class TinyAnalyze:
             self.data_path / self.paths["out_dir"] / self.paths[f"out_gen_dir"]
         )
 
-    def summarize_logs(self):  # TODO: fix paths
+        self._ligand_indexes = {}
+
+    def summarize_logs(
+        self,
+        which_ligands="gen",
+        targets: list = None,
+        n_workers: int = None,
+        rebuild: bool = False,
+    ):
         """
         Prepares a summary file in each output directory, concatenating all the logs for that target.
+
+        Summaries are updated incrementally: only logs that are new or changed since the
+        last summary are parsed, so this can run periodically during a long docking run.
+
+        If molecules were docked in tiers (`TinyDock.dock_tiered`), each one is summarized
+        from its most thorough docking: refinement, then regular docking, then screening.
+        The `tier` column of the summary tells which one was used.
+
+        The results store of the ligand set (see `load_results`) is updated along with the
+        summaries.
+
+        Parameters
+        ----------
+        which_ligands: string, ["gen", "train"] (Optional)
+            Summarize docking of training or generated molecules
+
+        targets: list of strings (Optional)
+            Targets to summarize, all if not specified
+
+        n_workers: int (Optional)
+            Number of processes parsing logs, defaults to CPU count
+
+        rebuild: bool (Optional)
+            Parse every log again instead of updating the existing summaries
         """
 
-        all_logs = os.listdir(logs_path)
-        logs_table = get_vina_header()  # get header of log entries
-        log_ids = []
+        if not targets:  # summarize all
+            targets = list(self.targets["off_targets"].keys()) + list(
+                self.targets["variants"].keys()
+            )
+        out_subdir = (
+            self.out_gen_subdir if which_ligands == "gen" else self.out_train_subdir
+        )
+
+        summaries, changed = {}, set()
+        for target in targets:
+            target_dir = out_subdir / target.lower()
+            # logs may be loose files, in the target's archive (`storage: "archive"`) or both
+            archive_path = target_dir / self.paths["out_archive"]
+            archive = (
+                PackedArchive(archive_path)
+                if PackedArchive.exists(archive_path)
+                else None
+            )
+            logs_dirs = [
+                (tier, Folder(target_dir / prefix, archive, prefix))
+                for tier, prefix in (
+                    ("refine", f"refine/{self.paths['out_logs_dir']}"),
+                    ("standard", self.paths["out_logs_dir"]),
+                    ("screen", f"screen/{self.paths['out_logs_dir']}"),
+                )
+            ]
+            state_path = target_dir / self.paths["summary_state_csv"]
+            if rebuild and state_path.is_file():
+                os.remove(state_path)
+
+            logs_df, n_parsed, updated = update_tiered_logs_table(
+                logs_dirs,
+                target_dir / self.paths["summary_csv"],
+                state_path,
+                n_workers,
+            )
+            if archive is not None:
+                archive.close()
+            summaries[target] = logs_df
+            if updated:
+                changed.add(target)
+            print(f"summarized {len(logs_df)} logs on {target}, {n_parsed} parsed")
 
-        for logfile in all_logs:
-            if logfile == LOGS_SUMMARY_FILE:  # ignore summary file that we will create
-                continue
+        self._store_results(which_ligands, summaries, changed)
 
-            with open(logs_path / logfile) as _log:
-                lines = _log.readlines()
+    def load_results(self, which_ligands="gen") -> ResultsStore:
+        """
+        Opens the results store of a ligand set: the summaries of all targets read as one
+        memory-mapped (ligands, targets, modes, 3) array of affinities and rmsd bounds,
+        kept up to date by `summarize_logs`. A missing store is built from the existing
+        summary files first.
+        """
 
-            if len(lines) > 27:  # where the table starts
-                all_positions = lines[
-                    -lines[::-1].index("\n") + 3 : -1
-                ]  # binding positions log
+        store_dir = self._results_dir(which_ligands)
+        if not ResultsStore.exists(store_dir):
+            out_subdir = (
+                self.out_gen_subdir if which_ligands == "gen" else self.out_train_subdir
+            )
+            summaries, groups = {}, {}
+            for group in ("variants", "off_targets"):
+                for target in self.targets[group]:
+                    summary_path = (
+                        out_subdir / target.lower() / self.paths["summary_csv"]
+                    )
+                    if summary_path.is_file():
+                        summaries[target] = pd.read_csv(
+                            summary_path, dtype={"uuid": str}
+                        )
+                        groups[target] = group
+            if summaries:
+                update_results_store(store_dir, summaries, groups)
             else:
-                continue
+                raise FileNotFoundError(
+                    f"no summaries of {which_ligands} ligands, run summarize_logs first"
+                )
+
+        return ResultsStore(store_dir)
+
+    def _store_results(self, which_ligands, summaries, changed):
+        """
+        Writes the summaries of the `changed` targets into the results store in one
+        update, along with any summaries the store doesn't hold yet.
+        """
+
+        store_dir = self._results_dir(which_ligands)
+        stored = set()
+        if ResultsStore.exists(store_dir):
+            stored = {name.lower() for name in ResultsStore(store_dir).targets}
+        summaries = {
+            target: logs_df
+            for target, logs_df in summaries.items()
+            if target in changed or target.lower() not in stored
+        }
+        if not summaries:
+            return
+
+        groups = {
+            target: "variants" if target in self.targets["variants"] else "off_targets"
+            for target in summaries
+        }
+        update_results_store(store_dir, summaries, groups)
+
+    def _results_dir(self, which_ligands="gen") -> Path:
+        out_subdir = (
+            self.out_gen_subdir if which_ligands == "gen" else self.out_train_subdir
+        )
+
+        return out_subdir / self.paths["results_store_dir"]
+
+    def build_pose_stores(
+        self,
+        which_ligands="gen",
+        targets: list = None,
+        tier: str = None,
+        n_workers: int = None,
+    ):
+        """
+        Extracts the docked poses and their scores of each target into a memory-mapped
+        pose store (see `load_pose_store`), rebuilding it from the docked PDBQT files.
+
+        Parameters
+        ----------
+        which_ligands: string, ["gen", "train"] (Optional)
+            Poses of training or generated molecules
+
+        targets: list of strings (Optional)
+            Targets to extract, all if not specified
+
+        tier: string, ["screen", "refine"] (Optional)
+            Poses of a docking tier (`TinyDock.dock_tiered`) instead of regular docking
+
+        n_workers: int (Optional)
+            Number of processes parsing PDBQTs, defaults to CPU count
+        """
+
+        if not targets:  # extract all
+            targets = list(self.targets["off_targets"].keys()) + list(
+                self.targets["variants"].keys()
+            )
+
+        for target in targets:
+            target_dir, prefix = self._target_out_dir(target, which_ligands, tier)
+            archive_path = target_dir / self.paths["out_archive"]
+            archive = (
+                PackedArchive(archive_path)
+                if PackedArchive.exists(archive_path)
+                else None
+            )
+            pose_prefix = f"{prefix}{self.paths['out_pdbqt_dir']}"
+            n_ligands = build_pose_store(
+                Folder(target_dir / pose_prefix, archive, pose_prefix),
+                target_dir / prefix / self.paths["pose_store_dir"],
+                n_workers,
+            )
+            if archive is not None:
+                archive.close()
+            print(f"stored poses of {n_ligands} molecules on {target}")
 
-            for i in range(len(all_positions)):
-                all_positions[i] = list(map(float, all_positions[i].split()))
+    def load_pose_store(
+        self, target: str, which_ligands="gen", tier: str = None
+    ) -> PoseStore:
+        """
+        Opens the pose store of a target made by `build_pose_stores`, giving any docked
+        molecule's poses (`poses(uuid)`) and mode scores (`pose_scores(uuid)`) as arrays.
+        """
 
-            log = np.array(all_positions)[:, 1:]
-            if log.shape == ():
-                log = create_empty_entry()
-            elif log.shape[0] < 10:
-                filler = np.ones((10 - log.shape[0], 3)) * np.nan
-                log = np.vstack((log, filler))
-            entry = log.flatten(order="F")
+        target_dir, prefix = self._target_out_dir(target, which_ligands, tier)
 
-            logs_table = np.vstack((logs_table, entry))
-            log_ids.append(change_file_ext(logfile))
+        return PoseStore(target_dir / prefix / self.paths["pose_store_dir"])
 
-        logs_df = pd.DataFrame(logs_table[1:], columns=logs_table[0], dtype=float)
-        logs_df["uuid"] = log_ids
-        logs_df.to_csv(logs_path / LOGS_SUMMARY_FILE)  # save
+    def _target_out_dir(self, target, which_ligands="gen", tier=None):
+        """
+        Output directory of a target and the path prefix of a tier's outputs in it.
+        """
+
+        out_subdir = (
+            self.out_gen_subdir if which_ligands == "gen" else self.out_train_subdir
+        )
+
+        return out_subdir / target.lower(), f"{tier}/" if tier else ""
 
     def plot_binding_affinity_distribution(self, targets: list = None):
         """
@@ -136,93 +321,178 @@ class TinyAnalyze:
         | uuid | logP | weight | n_rings | MCF | affin_kcal_mol-1_avg | affin_kcal_mol-1_1 | ... | affin_kcal_mol-1_n |
         """
 
-        target_name = target.lower()
-        summary_path = self.out_gen_subdir / target_name / self.paths["summary_csv"]
-        baff_df = pd.read_csv(summary_path)
-        ligands_gen_df = pd.read_csv(self.ligands_gen_csv)
+        mol_props_and_baff_df = self.load_results(which_ligands).summary(target)
+        ligand_index = self.ligand_index(which_ligands)
+        uuids = mol_props_and_baff_df["uuid"]
+        mol_props_and_baff_df["SMILES"] = ligand_index.smiles(uuids)
 
-        # merge summary table and gen table
-        mol_props_and_baff_df = pd.merge(baff_df, ligands_gen_df, how="left", on="uuid")
-
-        # use smiles to calculate properties
-        mol_objs = [get_mol(smi) for smi in mol_props_and_baff_df["SMILES"]]
-        mol_props_and_baff_df["logP"] = [logP(mol) for mol in mol_objs]
-        mol_props_and_baff_df["weight"] = [weight(mol) for mol in mol_objs]
-        mol_props_and_baff_df["n_rings"] = [get_n_rings(mol) for mol in mol_objs]
-        mol_props_and_baff_df["MCF_PAINS"] = [
-            mol_passes_filters(mol) for mol in mol_objs
-        ]
+        props_df = ligand_index.properties(
+            uuids, ["logP", "weight", "n_rings", "MCF_PAINS_pass"]
+        )
+        mol_props_and_baff_df["logP"] = props_df["logP"].values
+        mol_props_and_baff_df["weight"] = props_df["weight"].values
+        mol_props_and_baff_df["n_rings"] = props_df["n_rings"].values
+        mol_props_and_baff_df["MCF_PAINS"] = props_df["MCF_PAINS_pass"].values == 1
 
         return mol_props_and_baff_df
 
-    def prioritize(self, which_ligands="gen"):
+    def prioritize(
+        self, which_ligands="gen", top_k: int = None, chunk_size: int = None
+    ):
         """
         Returns a dataframe of small molecules prioritized using the objective function
 
         | uuid | variants_mean | off_target_max | objective |
+
+        Parameters
+        ----------
+        which_ligands: string, ["gen", "train"] (Optional)
+            Prioritize training or generated molecules
+
+        top_k: int (Optional)
+            Only keep the best `top_k` molecules, defaults to `prioritize_params`
+
+        chunk_size: int (Optional)
+            Molecules read from the results store at once, defaults to `prioritize_params`
         """
 
-        logs_variants = {}
-        for target in self.targets["variants"]:
-            target_name = target.lower()
-            cur_summary = pd.read_csv(self.out_gen_subdir / target_name / "summary.csv")
-            logs_variants[target_name] = get_mean_baff_df(
-                cur_summary, prefix=f"{target_name}_"
-            )
+        params = self.config.get("prioritize_params", {})
+        self.priority_df = prioritize_results(
+            self.load_results(which_ligands),
+            list(self.targets["variants"]),
+            list(self.targets["off_targets"]),
+            top_k if top_k is not None else params.get("top_k"),
+            chunk_size or params.get("chunk_size"),
+            params.get("scored_modes"),
+        )
+        print("molecules prioritized, you can access at TinyAnalyze.priority_df")
 
-        logs_off_targets = {}
-        for target in self.targets["off_targets"]:
-            target_name = target.lower()
-            cur_summary = pd.read_csv(self.out_gen_subdir / target_name / "summary.csv")
-            logs_off_targets[target_name] = get_mean_baff_df(
-                cur_summary, prefix=f"{target_name}_"
-            )
+    def pareto_rank(
+        self, objectives: list = None, which_ligands="gen", n_fronts: int = None
+    ):
+        """
+        Returns a dataframe of small molecules ranked on several objectives at once by
+        non-dominated sorting. Front 0 holds the molecules no other one beats on every
+        objective, front 1 those only beaten by front 0, and so on. Within a front,
+        molecules with the larger crowding distance (fewer similar trade-offs) come first.
 
-        variants_merged = reduce(
-            lambda left, right: pd.merge(left, right, on="uuid"), logs_variants.values()
+        | uuid | <objectives> | pareto_front | crowding_distance |
+
+        Parameters
+        ----------
+        objectives: list of strings or (string, ["max", "min"]) tuples (Optional)
+            Docking objectives ("variants_mean", "variants_min" for the worst case over
+            the variants, "off_targets_max", "objective", a target name or
+            "selectivity_<off-target>") and molecular properties ("QED", "SA", "logP",
+            ...), with the better direction where it isn't obvious, e.g. ("logP", "min").
+            Defaults to `prioritize_params`
+
+        which_ligands: string, ["gen", "train"] (Optional)
+            Rank training or generated molecules
+
+        n_fronts: int (Optional)
+            Only rank the first `n_fronts` fronts, defaults to `prioritize_params`
+        """
+
+        params = self.config.get("prioritize_params", {})
+        objectives = objectives or params.get(
+            "pareto_objectives", ["variants_mean", "off_targets_max"]
         )
-        off_targets_merged = reduce(
-            lambda left, right: pd.merge(left, right, on="uuid"),
-            logs_off_targets.values(),
+        variants = list(self.targets["variants"])
+        off_targets = list(self.targets["off_targets"])
+
+        names, signs = [], []
+        for objective in objectives:
+            name, sense = (objective, None) if isinstance(objective, str) else objective
+            sense = sense or objective_sense(name, variants, off_targets)
+            if sense not in ("max", "min"):
+                raise ValueError(
+                    f"objective {name} needs a direction, e.g. ({name!r}, 'max')"
+                )
+            names.append(name)
+            signs.append(-1.0 if sense == "max" else 1.0)  # sorting minimizes
+
+        properties = [name for name in names if name in PROPERTY_NAMES]
+        ranking_df = objective_table(
+            self.load_results(which_ligands),
+            variants,
+            off_targets,
+            [name for name in names if name not in properties],
+            params.get("scored_modes"),
         )
+        if properties:
+            props_df = self.ligand_index(which_ligands).properties(
+                ranking_df["uuid"], properties
+            )
+            ranking_df = pd.concat([ranking_df, props_df], axis=1)
 
-        # the norms
-        variants_merged["variants_mean"] = variants_merged.mean(axis=1)
-        off_targets_merged["off_targets_max"] = off_targets_merged.max(axis=1)
+        # molecules whose properties can't be calculated are left out
+        values = ranking_df[names].to_numpy(dtype=float)
+        complete = np.isfinite(values).all(axis=1)
+        ranking_df = ranking_df[complete].reset_index(drop=True)
 
-        cross_baff = pd.merge(off_targets_merged, variants_merged, on="uuid")
-        cross_baff["objective"] = (
-            cross_baff["variants_mean"] - cross_baff["off_targets_max"]
+        order, fronts, distance = pareto_order(
+            values[complete] * signs,
+            n_fronts or params.get("pareto_fronts"),
         )
-        cross_baff.sort_values(by="objective", ascending=False, inplace=True)
+        ranking_df["pareto_front"] = fronts
+        ranking_df["crowding_distance"] = distance
+        ranking_df = ranking_df.iloc[order]
 
-        self.priority_df = cross_baff[
-            ["uuid", "variants_mean", "off_targets_max", "objective"]
-        ]
-        print("molecules prioritized, you can access at TinyAnalyze.priority_df")
+        self.pareto_df = ranking_df[ranking_df["pareto_front"] >= 0].reset_index(
+            drop=True
+        )
+        print("molecules ranked, you can access at TinyAnalyze.pareto_df")
 
-    def get_molecular_properties(self, molecules_uuid: list):
+    def ligand_index(self, which_ligands="gen") -> LigandIndex:
+        """
+        ID index of a ligand table, shared by all lookups of SMILES and molecular
+        properties. Built on first use under `ligand_index_dir` and rebuilt whenever
+        the table changes.
+        """
+
+        if which_ligands not in self._ligand_indexes:
+            ligands_csv = (
+                self.ligands_gen_csv
+                if which_ligands == "gen"
+                else self.ligands_train_csv
+            )
+            self._ligand_indexes[which_ligands] = LigandIndex(
+                ligands_csv,
+                self.data_path
+                / self.paths["ligands_dir"]
+                / self.paths["ligand_index_dir"]
+                / which_ligands,
+            )
+
+        return self._ligand_indexes[which_ligands]
+
+    def get_molecular_properties(self, molecules_uuid: list, which_ligands="gen"):
         """
         For a given list of molecular UUIDs, returns a dictionary of molecular properties.
         """
 
+        ligand_index = self.ligand_index(which_ligands)
+        unknown = ligand_index.positions(molecules_uuid) < 0
+        if unknown.any():
+            raise KeyError(
+                f"unknown molecules: {list(np.array(molecules_uuid)[unknown])}"
+            )
+
+        props_df = ligand_index.properties(molecules_uuid)
         props_dict = {}
-        ligands_gen_df = pd.read_csv(self.ligands_gen_csv)
-
-        # TODO: add uuid exists in .csv check
-        for m_uuid in molecules_uuid:
-            smiles = ligands_gen_df[ligands_gen_df["uuid"] == m_uuid][
-                "SMILES"
-            ].reset_index(drop=True)
-            props = molecular_properties(smiles[0])
+        for m_uuid, props in zip(molecules_uuid, props_df.to_dict("records")):
+            props["MCF_PAINS_pass"] = props["MCF_PAINS_pass"] == 1
+            props["n_rings"] = (
+                int(props["n_rings"]) if np.isfinite(props["n_rings"]) else np.nan
+            )
             props_dict[m_uuid] = props
 
         return props_dict
 
-    def get_smiles_from_uuid(self, uuid: str):
-        ligands_gen_df = pd.read_csv(self.ligands_gen_csv)
-        smiles = ligands_gen_df[ligands_gen_df["uuid"] == uuid]["SMILES"].reset_index(
-            drop=True
-        )
+    def get_smiles_from_uuid(self, uuid: str, which_ligands="gen"):
+        smiles = self.ligand_index(which_ligands).smiles([uuid])[0]
+        if smiles is None:
+            raise KeyError(f"unknown molecule: {uuid}")
 
-        return smiles[0]
+        return smiles
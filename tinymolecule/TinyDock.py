@@ -1,5 +1,9 @@
 import os
-from subprocess import CalledProcessError
+import time
+import queue
+import heapq
+import tempfile
+import threading
 from copy import deepcopy
 from pathlib import Path
 from typing import Optional, Union, List, Tuple
@@ -9,9 +13,40 @@ import yaml
 import numpy as np
 import pandas as pd
 
-from openbabel import openbabel
-from tinymolecule.utils.helper_fn import change_file_ext, hash_smiles, shell_command
-from tinymolecule.utils.molecules import molecule_is_valid
+from tinymolecule.utils.helper_fn import change_file_ext
+from tinymolecule.utils.scheduler import (
+    DockingJob,
+    default_n_workers,
+    run_jobs,
+    run_jobs_streaming,
+)
+from tinymolecule.utils.async_docking import run_jobs_async
+from tinymolecule.utils.vina_engine import run_jobs_in_process
+from tinymolecule.utils.batch_docking import run_jobs_batched
+from tinymolecule.utils.ledger import JobLedger, job_params
+from tinymolecule.utils.cascade import kth_best, ligand_score, select_binders
+from tinymolecule.utils.cost_model import (
+    CostModel,
+    RunEstimator,
+    format_eta,
+    host_model_path,
+)
+from tinymolecule.utils.metrics import DockingMetrics
+from tinymolecule.utils.ligand_prep import (
+    ENGINES,
+    conversion_settings,
+    failures_table,
+    prepare_ligands,
+)
+from tinymolecule.utils.prep_cache import PrepCache
+from tinymolecule.utils.docking import parse_vina_log, read_vina_log
+from tinymolecule.utils.archive import (
+    Folder,
+    PackedArchive,
+    pack_directory,
+    unpack_archive,
+)
+from tinymolecule.utils.molecules import MoleculeIds, canonical_smiles
 
 
 class TinyDock:
@@ -50,9 +85,16 @@ class TinyDock:
         )
 
         self.tiny_params = self.config["tiny_params"]
+        self.docking_params = self.config["docking_params"]
+        self._archives = {}
+        self._scratch_dir = None
 
     def prepare_molecules(
-        self, which_ligands: str = "gen", smiles_csv_path: Union[str, Path] = None
+        self,
+        which_ligands: str = "gen",
+        smiles_csv_path: Union[str, Path] = None,
+        n_workers: Optional[int] = None,
+        engine: Optional[str] = None,
     ):
         """
         Creates pdbqt ready-to-dock molecules from .csv of SMILES strings.
@@ -65,6 +107,23 @@ class TinyDock:
         smiles_csv_path: Path or string (Optional)
             Path to CSV file containing SMILES strings enerated or train molecules)
             Note: overwrites `which_ligands` if specified
+
+        n_workers: int (Optional)
+            Number of processes converting molecules at once, defaults to `prep_params` in config
+
+        engine: string, ["openbabel", "rdkit"] (Optional)
+            3D coordinates from openbabel gen3d, or from RDKit ETKDG conformers minimized
+            with a force field (`n_confs` in `prep_params`), defaults to `prep_params` in config
+        """
+
+        self._set_ligands(which_ligands, smiles_csv_path)
+        batches = self._assign_uuid(self.config["prep_params"]["batch_size"])
+        for _ in self._get_pdbqt(batches, n_workers, engine):
+            pass
+
+    def _set_ligands(self, which_ligands="gen", smiles_csv_path=None):
+        """
+        Points this TinyDock at the .csv of SMILES and the ligands directory to prepare.
         """
 
         if which_ligands in ["gen", "train"]:
@@ -83,51 +142,437 @@ class TinyDock:
         else:
             self.ligands_csv = Path(smiles_csv_path)
 
-        self._assign_uuid()
-        self._get_pdbqt()  # TODO: add check for which ones have been converted
-
-    def _assign_uuid(self):
+    def _assign_uuid(self, batch_size=100000):
         """
-        Appends a column of UUIDs to .csv of SMILES if the column isn't already there
+        Reads the .csv of SMILES in batches of `batch_size` rows and assigns every row the
+        UUID of its canonical molecule, keeping UUIDs assigned before, and the canonical
+        SMILES alongside. Duplicate molecules share a UUID and are prepared and docked once.
+
+        The .csv is rewritten with both columns once, after its last batch was read. UUIDs
+        assigned before are all read first, so new molecules can't take one from a later
+        batch.
+
+        Yields
+        ------
+        DataFrame of each batch of rows, with "canonical_smiles" and "uuid"
         """
 
-        ligands = pd.read_csv(self.ligands_csv)
-        if "uuid" not in ligands:  # if UUIDs are not assigned yet
-            ligands["uuid"] = ligands["SMILES"].apply(hash_smiles)
+        molecule_ids = MoleculeIds(self.tiny_params["uuid_crop"])
+        columns = pd.read_csv(self.ligands_csv, nrows=0).columns
+        if "uuid" in columns:
+            known_columns = [
+                c for c in ("SMILES", "uuid", "canonical_smiles") if c in columns
+            ]
+            for known in pd.read_csv(
+                self.ligands_csv,
+                usecols=known_columns,
+                dtype={"uuid": str},
+                chunksize=batch_size,
+            ):
+                molecule_ids.add_known(
+                    known["SMILES"], known["uuid"], known.get("canonical_smiles")
+                )
+        out_csv = self.ligands_csv.with_name(self.ligands_csv.name + ".tmp")
+        n_rows = 0
+        with open(out_csv, "w") as out:
+            for i, ligands in enumerate(
+                pd.read_csv(self.ligands_csv, chunksize=batch_size)
+            ):
+                ligands = ligands.drop(
+                    columns=[c for c in ligands.columns if c.startswith("Unnamed")]
+                )
+                ids = molecule_ids.assign(ligands["SMILES"], ligands.get("uuid"))
+                ligands["canonical_smiles"] = ids["canonical_smiles"]
+                ligands["uuid"] = ids["uuid"]
+                ligands.to_csv(out, header=i == 0, index=False)
+                n_rows += len(ligands)
+                yield ligands
 
-        ligands.to_csv(self.ligands_csv)
+        os.replace(out_csv, self.ligands_csv)
+        print(
+            f"{n_rows} SMILES, {len(molecule_ids.ids)} unique molecules, "
+            + f"{molecule_ids.n_collisions} UUID collisions resolved"
+        )
 
-    def _get_pdbqt(self):
+    def _get_pdbqt(self, batches, n_workers=None, engine=None, ledger=None):
         """
-        Generates PDBQT files from SMILES strings using open babel.
+        Generates PDBQT files from batches of SMILES strings (see `_assign_uuid`) using open
+        babel or RDKit, in parallel. Each batch is converted and registered for docking in
+        `ledger`, if given, before the next one is read, so memory stays bounded and the
+        first molecules can be docked while later ones are still being prepared. Without
+        a ledger, docking finds the new ligands when it opens its ledger.
+
+        Molecules that can't be converted (e.g. failed 3D embedding) leave no file behind
+        and are listed with the reason in the failures CSV next to the SMILES CSV.
+
+        Conversions are cached by canonical molecule and conversion settings, so only
+        molecules not converted with the current settings before are converted.
+
+        Yields
+        ------
+        Lists of PrepResults of new molecules, each list once its ligands are registered
         """
 
-        _ligands = pd.read_csv(self.ligands_csv)
-        valid = [molecule_is_valid(molec) for molec in _ligands["SMILES"]]
-        ligands = _ligands[valid].reset_index(drop=True)
         os.makedirs(self.ligands_subdir, exist_ok=True)
+        prep_params = self.config["prep_params"]
+        engine = engine or prep_params["engine"]
+        cache = PrepCache(
+            self.ligands_dir / self.paths["prep_cache_dir"],
+            conversion_settings(engine, prep_params["n_confs"]),
+        )
+        metrics = self._get_metrics()
 
-        for i in ligands.index:
-            print(f"converting molecule {ligands['uuid'][i]} ({i + 1}/{len(ligands)})")
+        def register(results):
+            # make the new molecules known to the docking job ledger
+            if ledger is not None:
+                ledger.add_ligands(f"{r.uuid}.pdbqt" for r in results if not r.error)
+            failures.extend(r for r in results if r.error)
+            return results
 
-            # write temporary SMILES
-            molec = ligands["SMILES"][i]
-            uuid = ligands["uuid"][i]
-            temp_file = self.ligands_subdir / f"temp_{uuid}.smi"  # "valid_sample_1e5"
-            with open(temp_file, "w") as temp:
-                temp.write(molec)
+        seen = set()  # UUIDs of molecules handled in an earlier batch
+        failures, n_molecules = [], 0
+        try:
+            for batch, ligands in enumerate(batches):
+                # every spelling of a molecule has its UUID, one of them is enough
+                new = ligands["canonical_smiles"].notna() & ~ligands["uuid"].isin(seen)
+                ligands = ligands[new].drop_duplicates("uuid")
+                seen.update(ligands["uuid"])
+                n_molecules += len(ligands)
 
-            # TODO: openbabel conversion settings, use FullConvert might be faster
-            conv = openbabel.OBConversion()
-            conv.SetInAndOutFormats("smi", "pdbqt")
-            conv.AddOption("gen3d", conv.GENOPTIONS)
-            conv.AddOption("h", conv.GENOPTIONS)
+                cached, to_convert = cache.split(
+                    zip(
+                        ligands["uuid"], ligands["SMILES"], ligands["canonical_smiles"]
+                    ),
+                    self.ligands_subdir,
+                )
+                print(
+                    f"batch {batch + 1}: {len(cached)} molecules prepared before, "
+                    + f"converting {len(to_convert)}"
+                )
+                yield register(cached)
+
+                prep = prepare_ligands(
+                    [(uuid, smiles) for uuid, smiles, _ in to_convert],
+                    self.ligands_subdir,
+                    n_workers or prep_params["n_workers"],
+                    prep_params["chunksize"],
+                    engine,
+                    prep_params["n_confs"],
+                )
+                converted = []
+                for i, (result, (*_, canonical)) in enumerate(zip(prep, to_convert)):
+                    status = f"❌ {result.error}" if result.error else "✅"
+                    print(
+                        f"converting molecule {result.uuid} ({i + 1}/{len(to_convert)}) {status}"
+                    )
+                    cache.store(cache.key(canonical), result, self.ligands_subdir)
+                    metrics.record_prep(result, engine)
+                    converted.append(result)
+                    if len(converted) == prep_params["chunksize"]:
+                        yield register(converted)
+                        converted = []
+                yield register(converted)
+        finally:
+            metrics.flush()
 
-            # convert temporary SMILES to PDBQT format
-            pdbqt_file = self.ligands_subdir / f"{uuid}.pdbqt"
-            conv.OpenInAndOutFiles(str(temp_file), str(pdbqt_file))
-            conv.Convert()
-            os.remove(temp_file)
+        failures = failures_table(failures)
+        failures.to_csv(
+            self.ligands_dir / self.paths[f"ligands_{self.which_ligands}_failures_csv"],
+            index=False,
+        )
+        print(
+            f"prepared {n_molecules - len(failures)} molecules, {len(failures)} failed"
+        )
+
+    def prepare_and_dock(
+        self,
+        which_ligands: str = "gen",
+        smiles_csv_path: Union[str, Path] = None,
+        targets=None,
+        prep_workers=None,
+        dock_workers=None,
+        cpu_per_job=None,
+        engine=None,
+        queue_size=None,
+        rewrite=False,
+        silent_error=False,
+        timeout=None,
+        verbose=None,
+    ):
+        """
+        Prepares molecules from a .csv of SMILES and docks them on the targets in one
+        pipelined run: every molecule is docked as soon as its PDBQT is ready instead of
+        after the whole set, so docking starts within seconds and prep and docking CPUs
+        are busy at the same time.
+
+        Prep workers put docking jobs of prepared molecules on a bounded queue that vina
+        workers take them from. When docking falls behind, the full queue pauses the prep
+        workers. Molecules prepared before and still pending are docked after the new ones.
+
+        Parameters
+        ----------
+        which_ligands, smiles_csv_path, engine:
+            See `prepare_molecules`
+
+        targets: list (Optional)
+            List of molecules to dock on. If not specified, then all will be docked
+
+        prep_workers: int (Optional)
+            Number of processes converting molecules, defaults to `pipeline_params` in config
+
+        dock_workers: int (Optional)
+            Number of vina processes to run at once, defaults to `pipeline_params` in config
+
+        cpu_per_job: int (Optional)
+            Number of CPUs each vina process uses (vina's --cpu), defaults to `docking_params` in config
+
+        queue_size: int (Optional)
+            Docking jobs waiting between the stages at most, defaults to `pipeline_params` in config
+
+        rewrite, silent_error, timeout, verbose:
+            See `dock`, docking runs on the process pool backend
+        """
+
+        self._set_ligands(which_ligands, smiles_csv_path)
+        if not targets:  # dock all
+            targets = list(self.targets["off_targets"].keys()) + list(
+                self.targets["variants"].keys()
+            )
+
+        pipeline_params = self.config["pipeline_params"]
+        cpu_per_job = cpu_per_job or self.docking_params["cpu_per_job"]
+        n_cpus = os.cpu_count() or 1
+        prep_workers = (
+            prep_workers or pipeline_params["prep_workers"] or max(1, n_cpus // 4)
+        )
+        dock_workers = (
+            dock_workers
+            or pipeline_params["dock_workers"]
+            or max(1, (n_cpus - prep_workers) // cpu_per_job)
+        )
+        queue_size = queue_size or pipeline_params["queue_size"]
+        options = self._run_options(None, None, timeout, verbose)
+
+        ledger = self._open_ledger()
+        queues = self._open_queues(ledger, targets, rewrite)
+        backlog = {
+            trgt: ledger.pending(trgt, params) for trgt, params in queues.items()
+        }
+        print(
+            f">>> PREPARING AND DOCKING ON {len(queues)} TARGETS, "
+            + f"{prep_workers} PREP AND {dock_workers} DOCKING WORKERS <<< "
+        )
+
+        job_queue = queue.Queue(maxsize=queue_size)
+        stop = threading.Event()
+        errors = []
+        producer = threading.Thread(
+            target=self._produce_jobs,
+            args=(job_queue, stop, errors, queues, backlog),
+            kwargs={
+                "n_workers": prep_workers,
+                "engine": engine,
+                "cpu_per_job": cpu_per_job,
+                "queue_size": queue_size,
+            },
+            daemon=True,
+        )
+
+        ledger.start_heartbeat()
+        producer.start()
+        try:
+            results = run_jobs_streaming(job_queue, dock_workers, options["timeout"])
+            self._record_results(results, ledger, silent_error, options["verbose"])
+        finally:
+            stop.set()
+            producer.join()
+            ledger.close()
+            self._remove_scratch_ligands()
+        if errors:
+            raise errors[0]
+
+    def _produce_jobs(
+        self,
+        job_queue,
+        stop,
+        errors,
+        queues,
+        backlog,
+        n_workers=None,
+        engine=None,
+        cpu_per_job=1,
+        queue_size=256,
+    ):
+        """
+        Prep stage of `prepare_and_dock`, run in a thread: puts the docking jobs of every
+        newly prepared molecule on `job_queue`, then those of the `backlog` ligands of each
+        target, then None.
+        """
+
+        def put(item):
+            if item is not None:  # the job's queue wait starts now
+                item = item._replace(queued=time.time())
+            while not stop.is_set():  # the docking side may have given up
+                try:
+                    return job_queue.put(item, timeout=0.5)
+                except queue.Full:
+                    continue
+
+        ledger = self._get_ledger()
+        try:
+            batches = self._assign_uuid(self.config["prep_params"]["batch_size"])
+            for results in self._get_pdbqt(batches, n_workers, engine, ledger):
+                if stop.is_set():
+                    break
+                ligands = [f"{r.uuid}.pdbqt" for r in results if not r.error]
+                if not ligands:
+                    continue
+                jobs = []
+                for trgt, params in queues.items():
+                    ledger.enqueue(trgt, params)
+                    # molecules prepared before may be docked already
+                    to_dock = ledger.pending(trgt, params, among=ligands)
+                    jobs += self._make_jobs(trgt, to_dock, cpu_per_job, params)
+                ledger.mark_running(jobs)
+                for job in jobs:
+                    put(job)
+
+            for trgt, ligands in backlog.items():
+                for i in range(0, len(ligands), queue_size):
+                    # skipping those docked among the new molecules
+                    to_dock = ledger.pending(
+                        trgt, queues[trgt], among=ligands[i : i + queue_size]
+                    )
+                    jobs = self._make_jobs(trgt, to_dock, cpu_per_job, queues[trgt])
+                    ledger.mark_running(jobs)
+                    for job in jobs:
+                        put(job)
+        except Exception as e:
+            errors.append(e)
+        finally:
+            ledger.close()
+            put(None)
+
+    def benchmark_prep_engines(
+        self, n_molecules=50, target=None, n_workers=None, cpu_per_job=None
+    ):
+        """
+        Prepares a random sample of molecules with every prep engine, docks each engine's
+        output on one target and compares preparation throughput and docking scores.
+
+        Parameters
+        ----------
+        n_molecules: int (Optional)
+            Number of molecules sampled from the SMILES CSV of the current ligand set
+
+        target: string (Optional)
+            Target to dock on, defaults to `primary_target` in `cascade_params` in config
+
+        n_workers: int (Optional)
+            Number of processes preparing and docking at once, defaults to config
+
+        cpu_per_job: int (Optional)
+            Number of CPUs each vina process uses, defaults to `docking_params` in config
+
+        Returns
+        -------
+        (per engine throughput table, score agreement between the engines)
+        """
+
+        target = target or self.config["cascade_params"]["primary_target"]
+        cpu_per_job = cpu_per_job or self.docking_params["cpu_per_job"]
+        prep_params = self.config["prep_params"]
+        config_path, receptor_path = self._target_paths(target)
+
+        ligands = pd.read_csv(
+            self.ligands_dir / self.paths[f"ligands_{self.which_ligands}_csv"]
+        )
+        ligands = ligands[ligands["SMILES"].map(canonical_smiles).notna()]
+        ligands = ligands.drop_duplicates("uuid")
+        ligands = ligands.sample(
+            min(n_molecules, len(ligands)), random_state=self.tiny_params["uuid_seed"]
+        )
+        bench_dir = (
+            self.data_path
+            / self.paths["out_dir"]
+            / self.paths[f"out_{self.which_ligands}_dir"]
+            / "prep_benchmark"
+        )
+
+        rows, best_scores = [], {}
+        for engine in ENGINES:
+            ligands_dir, out_dir = (
+                bench_dir / engine / "ligands",
+                bench_dir / engine / "out",
+            )
+            os.makedirs(ligands_dir, exist_ok=True)
+            os.makedirs(out_dir, exist_ok=True)
+
+            start = time.time()
+            results = list(
+                prepare_ligands(
+                    zip(ligands["uuid"], ligands["SMILES"]),
+                    ligands_dir,
+                    n_workers or prep_params["n_workers"],
+                    prep_params["chunksize"],
+                    engine,
+                    prep_params["n_confs"],
+                )
+            )
+            prep_seconds = time.time() - start
+
+            jobs = [
+                DockingJob(
+                    target=target,
+                    ligand=f"{r.uuid}.pdbqt",
+                    ligand_path=ligands_dir / f"{r.uuid}.pdbqt",
+                    receptor_path=receptor_path,
+                    config_path=config_path,
+                    out_pdbqt=out_dir / f"{r.uuid}.pdbqt",
+                    out_log=out_dir / f"{r.uuid}.txt",
+                    cpu=cpu_per_job,
+                )
+                for r in results
+                if not r.error
+            ]
+            start = time.time()
+            for _ in run_jobs(jobs, n_workers or self.docking_params["n_workers"]):
+                pass
+            dock_seconds = time.time() - start
+
+            tables = {job.ligand: read_vina_log(job.out_log) for job in jobs}
+            best_scores[engine] = pd.Series(
+                {
+                    lig: table[0, 0]
+                    for lig, table in tables.items()
+                    if table is not None
+                },
+                dtype=float,
+            )
+            rows.append(
+                {
+                    "engine": engine,
+                    "molecules_per_second": len(results) / prep_seconds,
+                    "prep_failed": sum(bool(r.error) for r in results),
+                    "docked": len(best_scores[engine]),
+                    "dock_seconds": dock_seconds,
+                    "mean_best_affinity": best_scores[engine].mean(),
+                }
+            )
+
+        throughput = pd.DataFrame(rows).set_index("engine")
+        both = pd.concat(best_scores, axis=1).dropna()
+        agreement = {
+            "n_molecules": len(both),
+            "spearman": float(both.corr(method="spearman").iloc[0, 1]),
+            "mean_abs_diff_kcal_mol": float(
+                (both.iloc[:, 0] - both.iloc[:, 1]).abs().mean()
+            ),
+        }
+        print(throughput)
+        print(agreement)
+
+        return throughput, agreement
 
     def dock(
         self,
@@ -136,10 +581,28 @@ class TinyDock:
         dock_from_logs=None,
         rewrite=False,
         silent_error=False,
+        n_workers=None,
+        cpu_per_job=None,
+        rescan_ligands=False,
+        backend=None,
+        timeout=None,
+        shard=None,
+        distributed=False,
+        tier=None,
+        verbose=None,
     ):
         """
         Performs docking for the prepared molecules on specified targets.
 
+        Every (target, ligand) pair of the run goes into one global queue served by
+        a pool of `n_workers` vina processes, each using `cpu_per_job` CPUs. Job states
+        are kept in a ledger under the output directory, so an interrupted run resumes
+        with the pending and retryable failed jobs only.
+
+        Several `dock` processes, on one or many hosts sharing the `data` directory, can
+        split a screen either by `shard` or by `distributed=True`, where each process
+        keeps claiming small batches of jobs from the shared ledger until none are left.
+
         Parameters
         ----------
         targets: list (Optional)
@@ -153,6 +616,40 @@ class TinyDock:
 
         rewrite: bool (Optional)
             Re-dock molecules that have already been docked
+
+        n_workers: int (Optional)
+            Number of vina processes to run at once, defaults to `docking_params` in config
+
+        cpu_per_job: int (Optional)
+            Number of CPUs each vina process uses (vina's --cpu), defaults to `docking_params` in config
+
+        rescan_ligands: bool (Optional)
+            Register ligand files added to the ligands directory outside of `prepare_molecules`
+
+        backend: string, ["pool", "asyncio", "vina_python", "batch"] (Optional)
+            Process pool of blocking vina calls, asyncio driver with retries of transient
+            failures, in-process docking with the Vina Python bindings reusing each
+            target's grid maps (no timeout), or process pool of vina 1.2 `--batch` calls
+            docking `batch_size` molecules each, defaults to `docking_params` in config
+
+        timeout: float (Optional)
+            Wall-clock limit in seconds for docking a single molecule, defaults to `docking_params` in config
+
+        shard: string (Optional)
+            "i/n" to dock only ligands hashed into shard i of n (0-based), e.g. "0/4" ... "3/4"
+            on four nodes
+
+        distributed: bool (Optional)
+            Claim leased batches of jobs from the shared ledger instead of taking a fixed
+            list up front, `subsample` and `dock_from_logs` are ignored
+
+        tier: string, ["screen", "refine"] (Optional)
+            Dock with the exhaustiveness and number of modes of a tier in `tier_params` in config,
+            writing to the tier's own output subdirectory of every target
+
+        verbose: bool (Optional)
+            Print a line for every docked molecule, defaults to `docking_params` in config.
+            Timing records and metrics are written either way
         """
 
         if not targets:  # dock all
@@ -162,76 +659,850 @@ class TinyDock:
         else:
             targets_to_dock = targets
 
+        cpu_per_job = cpu_per_job or self.docking_params["cpu_per_job"]
+        run_options = self._run_options(n_workers, backend, timeout, verbose)
+        ledger = self._open_ledger(rescan_ligands)
+        queues = self._open_queues(ledger, targets_to_dock, rewrite, tier)
+
+        ledger.start_heartbeat()
+        try:
+            if distributed:
+                self._dock_distributed(
+                    ledger, queues, cpu_per_job, silent_error, tier, **run_options
+                )
+            else:
+                jobs = []
+                for trgt, params in queues.items():
+                    ligands_to_dock = ledger.pending(trgt, params, shard)
+                    print(
+                        f">>> DOCKING {len(ligands_to_dock)} MOLECULES ON {trgt.upper()} <<< "
+                    )
+                    ligand_files = self._select_ligands(
+                        ligands_to_dock, subsample, dock_from_logs
+                    )
+                    jobs += self._make_jobs(
+                        trgt, ligand_files, cpu_per_job, params, tier
+                    )
+
+                ledger.mark_running(jobs)
+                self._run_jobs(jobs, ledger, silent_error, **run_options)
+        finally:
+            ledger.close()
+
+    def dock_cascade(
+        self,
+        top_k=None,
+        variant_percentile=None,
+        variant_cutoff=None,
+        primary_target=None,
+        silent_error=False,
+        n_workers=None,
+        cpu_per_job=None,
+        rescan_ligands=False,
+        backend=None,
+        timeout=None,
+        verbose=None,
+    ):
+        """
+        Docks only what the objective function needs to rank the top molecules.
+
+        1. All molecules are docked on the primary target (wild-type CCR5).
+        2. Only molecules passing `variant_percentile`/`variant_cutoff` there are docked on the other variants.
+        3. The `top_k` molecules by `variants_mean` are docked on every off-target, which sets
+           the objective of the current k-th best molecule (only counting those docked on
+           all of them, none if fewer than `top_k` were). The rest are docked one off-target
+           at a time and dropped as soon as `variants_mean - off_targets_max` falls below it,
+           since docking more off-targets can only lower their objective.
+
+        Dropped molecules miss some targets and don't appear in `TinyAnalyze.prioritize`.
+        The off-target pruning of step 3 is exact, but step 2 is a heuristic: a molecule
+        filtered out on the primary target may have ranked in the top `top_k`. Only with
+        `variant_percentile=100` and no `variant_cutoff` is the top `top_k` the same as
+        after docking everything exhaustively.
+
+        Parameters
+        ----------
+        top_k: int (Optional)
+            Number of top molecules the off-target pruning keeps exact, defaults to `cascade_params` in config
+
+        variant_percentile: float (Optional)
+            Percentage of best binders on the primary target docked on the other variants (0 to 100)
+
+        variant_cutoff: float (Optional)
+            Mean affinity in kcal/mol on the primary target a molecule needs to be docked on the other variants
+
+        primary_target: string (Optional)
+            Variant docked first for every molecule, defaults to `cascade_params` in config
+
+        Other parameters are the same as in `dock`
+        """
+
+        cascade_params = self.config["cascade_params"]
+        top_k = top_k or cascade_params["top_k"]
+        primary_target = primary_target or cascade_params["primary_target"]
+        if variant_percentile is None and variant_cutoff is None:
+            variant_percentile = cascade_params["variant_percentile"]
+            variant_cutoff = cascade_params["variant_cutoff"]
+
+        variants = list(self.targets["variants"].keys())
+        off_targets = list(self.targets["off_targets"].keys())
+        other_variants = [trgt for trgt in variants if trgt != primary_target]
+
+        cpu_per_job = cpu_per_job or self.docking_params["cpu_per_job"]
+        run_options = self._run_options(n_workers, backend, timeout, verbose)
+        ledger = self._open_ledger(rescan_ligands)
+        queues = self._open_queues(ledger, variants + off_targets)
+
+        def dock_stage(ligand_sets):
+            self._dock_stage(
+                ledger, queues, ligand_sets, cpu_per_job, silent_error, **run_options
+            )
+
+        ledger.start_heartbeat()
+        try:
+            # 1. primary target
+            ligands = ledger.ligands()
+            print(f">>> CASCADE: {len(ligands)} MOLECULES ON {primary_target} <<< ")
+            dock_stage({primary_target: ligands})
+            primary_scores = self._read_scores(primary_target, ligands)
+
+            # 2. remaining variants
+            binders = select_binders(primary_scores, variant_percentile, variant_cutoff)
+            print(f">>> CASCADE: {len(binders)} MOLECULES ON OTHER VARIANTS <<< ")
+            dock_stage({trgt: binders for trgt in other_variants})
+            variant_scores = [primary_scores] + [
+                self._read_scores(trgt, binders) for trgt in other_variants
+            ]
+            variants_mean = {
+                lig: np.mean([scores[lig] for scores in variant_scores])
+                for lig in binders
+                if all(lig in scores for scores in variant_scores)
+            }
+
+            # 3. off-targets, exhaustively for the current top k then pruned
+            ranked = sorted(variants_mean, key=variants_mean.get, reverse=True)
+            seeds, candidates = ranked[:top_k], ranked[top_k:]
+            print(f">>> CASCADE: {len(seeds)} TOP MOLECULES ON ALL OFF-TARGETS <<< ")
+            dock_stage({trgt: seeds for trgt in off_targets})
+
+            off_targets_max = {lig: -np.inf for lig in ranked}
+            complete = set(seeds)
+            for trgt in off_targets:
+                scores = self._read_scores(trgt, seeds)
+                complete &= set(scores)
+                for lig, score in scores.items():
+                    off_targets_max[lig] = max(off_targets_max[lig], score)
+            # seeds that failed on an off-target aren't ranked, and their objective
+            # would be overestimated, so they don't count towards the threshold
+            threshold = kth_best(
+                (variants_mean[lig] - off_targets_max[lig] for lig in complete), top_k
+            )
+
+            for trgt in off_targets:
+                print(f">>> CASCADE: {len(candidates)} MOLECULES ON {trgt} <<< ")
+                dock_stage({trgt: candidates})
+                scores = self._read_scores(trgt, candidates)
+                candidates = [  # failed molecules can't be ranked either
+                    lig
+                    for lig in candidates
+                    if lig in scores
+                    and variants_mean[lig] - max(off_targets_max[lig], scores[lig])
+                    >= threshold
+                ]
+                for lig in candidates:
+                    off_targets_max[lig] = max(off_targets_max[lig], scores[lig])
+
+            print(
+                f"cascade finished, {len(seeds) + len(candidates)} molecules docked on all targets"
+            )
+        finally:
+            ledger.close()
+
+    def dock_tiered(
+        self,
+        targets=None,
+        refine_top_n=None,
+        refine_top_percent=None,
+        silent_error=False,
+        n_workers=None,
+        cpu_per_job=None,
+        rescan_ligands=False,
+        backend=None,
+        timeout=None,
+        verbose=None,
+    ):
+        """
+        Screens all molecules with cheap vina settings, then re-docks the best of them per
+        target with thorough ones. Settings of both tiers are under `tier_params` in config.
+
+        Screening and refinement results are stored separately, in the `screen/` and `refine/`
+        subdirectories of each target's output directory. `TinyAnalyze.summarize_logs` takes
+        the most thorough result available for every molecule.
+
+        Parameters
+        ----------
+        targets: list (Optional)
+            List of targets to dock on. If not specified, then all will be docked
+
+        refine_top_n: int (Optional)
+            Number of best screened molecules per target to refine
+
+        refine_top_percent: float (Optional)
+            Percentage of best screened molecules per target to refine (0 to 100), used if
+            `refine_top_n` is not given. Both default to `tier_params` in config
+
+        Other parameters are the same as in `dock`
+        """
+
+        if not targets:  # dock all
+            targets = list(self.targets["off_targets"].keys()) + list(
+                self.targets["variants"].keys()
+            )
+
+        refine_params = self.config["tier_params"]["refine"]
+        if refine_top_n is None and refine_top_percent is None:
+            refine_top_n = refine_params["top_n"]
+            refine_top_percent = refine_params["top_percent"]
+
+        cpu_per_job = cpu_per_job or self.docking_params["cpu_per_job"]
+        run_options = self._run_options(n_workers, backend, timeout, verbose)
+        ledger = self._open_ledger(rescan_ligands)
+        screen_queues = self._open_queues(ledger, targets, tier="screen")
+        refine_queues = self._open_queues(ledger, targets, tier="refine")
+
+        ledger.start_heartbeat()
+        try:
+            ligands = ledger.ligands()
+            print(
+                f">>> SCREENING {len(ligands)} MOLECULES ON {len(targets)} TARGETS <<< "
+            )
+            self._dock_stage(
+                ledger,
+                screen_queues,
+                {trgt: ligands for trgt in targets},
+                cpu_per_job,
+                silent_error,
+                "screen",
+                **run_options,
+            )
+
+            to_refine = {}
+            for trgt in targets:
+                scores = self._read_scores(trgt, ligands, tier="screen")
+                n_refine = refine_top_n
+                if n_refine is None:
+                    n_refine = int(np.ceil(refine_top_percent / 100 * len(scores)))
+                to_refine[trgt] = heapq.nlargest(n_refine, scores, key=scores.get)
+                # the refine queue holds every molecule, the rest is never docked there
+                ledger.restrict(trgt, refine_queues[trgt], to_refine[trgt])
+
+            print(
+                f">>> REFINING {sum(map(len, to_refine.values()))} BEST SCREENED DOCKINGS <<< "
+            )
+            self._dock_stage(
+                ledger,
+                refine_queues,
+                to_refine,
+                cpu_per_job,
+                silent_error,
+                "refine",
+                **run_options,
+            )
+        finally:
+            ledger.close()
+
+    def _dock_stage(
+        self,
+        ledger,
+        queues,
+        ligand_sets,
+        cpu_per_job=1,
+        silent_error=False,
+        tier=None,
+        **run_options,
+    ):
+        """
+        Docks the not yet docked molecules of {target: ligand files} in one queue.
+        """
+
+        jobs = []
+        for trgt, ligands in ligand_sets.items():
+            pending = set(ledger.pending(trgt, queues[trgt]))
+            ligand_files = [lig for lig in ligands if lig in pending]
+            jobs += self._make_jobs(trgt, ligand_files, cpu_per_job, queues[trgt], tier)
+
+        ledger.mark_running(jobs)
+        self._run_jobs(jobs, ledger, silent_error, **run_options)
+
+    def _read_scores(self, target, ligand_files, tier=None):
+        """
+        Objective function scores ({ligand file: score}) of molecules with a complete log on a target.
+        """
+
+        _, logs = self._out_folders(target, tier)
+        # the modes `TinyAnalyze.prioritize` scores on, so both rank alike
+        n_modes = self.config.get("prioritize_params", {}).get("scored_modes")
+        scores = {}
+        for lig in ligand_files:
+            log_file = change_file_ext(lig, ext="txt")
+            table = (
+                parse_vina_log(logs.read_text(log_file))
+                if logs.exists(log_file)
+                else None
+            )
+            if table is not None:
+                scores[lig] = ligand_score(table, n_modes)
+
+        return scores
+
+    def _run_options(self, n_workers=None, backend=None, timeout=None, verbose=None):
+        """
+        Fills in unspecified docking run options from `docking_params` in config.
+        """
+
+        options = {
+            "n_workers": n_workers,
+            "backend": backend,
+            "timeout": timeout,
+            "verbose": verbose,
+        }
+
+        return {
+            key: self.docking_params[key] if value is None else value
+            for key, value in options.items()
+        }
+
+    def _open_ledger(self, rescan_ligands=False):
+        """
+        Opens the job ledger for a docking run, making sure it knows the prepared ligands.
+        """
+
+        ledger = self._get_ledger()
+        ledger.reset_stale()  # jobs left running by a killed run
+        # ligands prepared without a ledger (`prepare_molecules`) changed the folder
+        signature = self._ligands_signature()
+        if (
+            rescan_ligands
+            or ledger.n_ligands() == 0
+            or ledger.get_meta("ligands_signature") != signature
+        ):
+            ledger.add_ligands(self._ligand_folder().listdir())
+            ledger.set_meta("ligands_signature", signature)
+
+        return ledger
+
+    def _ligands_signature(self):
+        """
+        Version of the prepared ligands folder, which changes whenever ligand files or
+        archive entries are added.
+        """
+
+        mtime = (
+            os.stat(self.ligands_subdir).st_mtime_ns
+            if self.ligands_subdir.is_dir()
+            else 0
+        )
+        archive = self._ligand_archive()
+        if archive is not None:
+            archive.refresh()  # entries packed by other processes
+
+        return f"{mtime}:{len(archive) if archive is not None else 0}"
+
+    def _open_queues(self, ledger, targets, rewrite=False, tier=None):
+        """
+        Enqueues jobs for newly registered ligands on every target, returns {target: params hash}.
+        """
+
+        queues = {}
+        for trgt in targets:
+            config_path, receptor_path = self._target_paths(trgt)
+            tier_args = (tier, *self._tier_settings(tier).items()) if tier else ()
+            params = job_params(config_path, receptor_path, *tier_args)
+            if ledger.enqueue(trgt, params):  # first run on this target and settings
+                ledger.mark_done(trgt, params, self._docked_ligands(trgt, tier))
+            if rewrite:
+                ledger.requeue(trgt, params)
+            queues[trgt] = params
+
+        return queues
+
+    def _dock_distributed(
+        self,
+        ledger,
+        queues,
+        cpu_per_job=1,
+        silent_error=False,
+        tier=None,
+        **run_options,
+    ):
+        """
+        Keeps claiming batches of jobs from the shared ledger and docking them until no claimable job is left.
+        """
+
+        claim_size = self.docking_params["claim_size"] or 4 * (
+            run_options["n_workers"] or default_n_workers(cpu_per_job)
+        )
+        print(f">>> DOCKING FROM SHARED QUEUE AS WORKER {ledger.worker} <<< ")
+
+        while True:
+            claimed = ledger.claim(list(queues.items()), claim_size)
+            if not claimed:
+                break
+
+            jobs = []
+            for ligand, trgt, params in claimed:
+                jobs += self._make_jobs(trgt, [ligand], cpu_per_job, params, tier)
+            self._run_jobs(jobs, ledger, silent_error, **run_options)
+
+    def _make_out_dirs(self, target, tier=None):
+        """
+        Creates (if needed) and returns the output pose and log directories of a target,
+        under the tier's subdirectory if docking in tiers.
+        """
+
+        out_target_dir = self.out_subdir / target.lower()
+        if tier is not None:
+            out_target_dir = out_target_dir / tier
+        out_pdbqt_dir = out_target_dir / self.paths["out_pdbqt_dir"]
+        out_logs_dir = out_target_dir / self.paths["out_logs_dir"]
+        os.makedirs(out_pdbqt_dir, exist_ok=True)
+        os.makedirs(out_logs_dir, exist_ok=True)
+
+        return out_pdbqt_dir, out_logs_dir
+
+    def _target_paths(self, target):
+        """
+        Returns paths to the vina config and the receptor PDBQT of a target.
+        """
+
+        config_path = (
+            self.data_path
+            / self.paths["targets_dir"]
+            / self.paths["targets_vina_config_dir"]
+            / self.all_targets[target]["vina_config"]
+        )
+        receptor_path = (
+            self.data_path
+            / self.paths["targets_dir"]
+            / self.paths["targets_pdbqt_dir"]
+            / self.all_targets[target]["pdbqt"]
+        )
+
+        return config_path, receptor_path
+
+    def _select_ligands(self, ligands_to_dock, subsample=1, dock_from_logs=None):
+        """
+        Narrows ligands down to those listed in `dock_from_logs` or to a random subsample.
+        """
+
+        if os.path.isfile(
+            str(dock_from_logs)
+        ):  # if choose molecules from logs of another docking experiment
+            ligands_from_logs = set(pd.read_csv(dock_from_logs)["uuid"].values)
+            ligand_files = [
+                lig
+                for lig in ligands_to_dock
+                if change_file_ext(lig) in ligands_from_logs
+            ]
+
+        elif subsample != False or subsample < 1:
+            subsample_count = int(subsample * len(ligands_to_dock))
+            print(f"subsampling {subsample_count} molecules to dock")
+            ligand_files = sample(ligands_to_dock, subsample_count)
+
+        else:
+            ligand_files = ligands_to_dock
+
+        return ligand_files
+
+    def _make_jobs(self, target, ligand_files, cpu_per_job=1, params="", tier=None):
+        """
+        Creates docking jobs for the given ligand files on one target.
+        """
+
+        out_pdbqt_dir, out_logs_dir = self._make_out_dirs(target, tier)
+        config_path, receptor_path = self._target_paths(target)
+        tier_settings = self._tier_settings(tier)
+
+        jobs = []
+        for ligand in ligand_files:
+            ligand_path, ligand_folder = self._ligand_source(target, ligand)
+            jobs.append(
+                DockingJob(
+                    target=target,
+                    ligand=ligand,
+                    ligand_path=ligand_path,
+                    receptor_path=receptor_path,
+                    config_path=config_path,
+                    out_pdbqt=out_pdbqt_dir / ligand,
+                    out_log=out_logs_dir / change_file_ext(ligand, ext="txt"),
+                    cpu=cpu_per_job,
+                    params=params,
+                    ligand_folder=ligand_folder,
+                    **tier_settings,
+                )
+            )
+
+        return jobs
+
+    def _tier_settings(self, tier=None):
+        """
+        Vina settings overriding the per-target config in a docking tier.
+        """
+
+        if tier is None:
+            return {}
+        if tier not in self.config["tier_params"]:
+            raise ValueError(f"unknown docking tier: {tier}")
+
+        settings = self.config["tier_params"][tier]
+
+        return {
+            "exhaustiveness": settings["exhaustiveness"],
+            "num_modes": settings["num_modes"],
+        }
+
+    def _run_jobs(
+        self,
+        jobs,
+        ledger=None,
+        silent_error=False,
+        n_workers=None,
+        backend="pool",
+        timeout=None,
+        verbose=True,
+    ):
+        """
+        Docks all jobs on the chosen backend, reporting each molecule as it finishes.
+
+        Jobs start longest first by the cost model's estimate, so no large molecule is
+        left running alone at the end of the run, and every report carries an ETA.
+        """
+
+        # every job is handed to the backend now, queue waits count from here
+        queued = time.time()
+        jobs = [job._replace(queued=queued) for job in jobs]
+        model_path = self._get_cost_model_path()
+        estimator = RunEstimator(
+            jobs,
+            CostModel.load(model_path),
+            n_workers or default_n_workers(jobs[0].cpu if jobs else 1),
+        )
+        if self.docking_params["longest_first"]:
+            jobs = estimator.jobs
+
+        if backend == "pool":
+            results = run_jobs(jobs, n_workers, timeout)
+        elif backend == "asyncio":
+            results = run_jobs_async(
+                jobs,
+                n_workers,
+                timeout,
+                retries=self.docking_params["retries"],
+                backoff=self.docking_params["retry_backoff"],
+            )
+        elif backend == "vina_python":
+            results = run_jobs_in_process(jobs, n_workers)
+        elif backend == "batch":
+            results = run_jobs_batched(
+                jobs, n_workers, self.docking_params["batch_size"], timeout
+            )
+        else:
+            raise ValueError(f"unknown docking backend: {backend}")
+
+        try:
+            self._record_results(results, ledger, silent_error, verbose, estimator)
+        finally:
+            estimator.model.save(model_path)
+            self._remove_scratch_ligands(jobs)
+
+    def _record_results(
+        self, results, ledger=None, silent_error=False, verbose=True, estimator=None
+    ):
+        """
+        Records every finished job in the ledger and the metrics, and reports it. Runs
+        whose jobs are known up front pass their `estimator` for progress and ETA.
+        """
+
+        metrics = self._get_metrics()
+        submitted = time.time()
+        n_docked, n_failed = 0, 0
+        to_archive = []
+        try:
+            for result in results:
+                if ledger is not None:
+                    ledger.mark_finished(result)
+                if estimator is not None:
+                    estimator.finished(result)
+                metrics.record(result)
+                n_docked += 1
+                n_failed += result.exit_code != 0
+                if result.exit_code == 0 and self.paths["storage"] == "archive":
+                    to_archive.append(result.job)
+                    if len(to_archive) >= self.paths["archive_batch_size"]:
+                        self._archive_outputs(to_archive)
+                        to_archive = []
+
+                if not verbose:
+                    continue
+                progress = (
+                    f"docking molecule {change_file_ext(result.job.ligand)} "
+                    + f"on {result.job.target} ({n_docked}"
+                    + (
+                        f"/{len(estimator.jobs)}, ETA {format_eta(estimator.eta())})"
+                        if estimator is not None
+                        else ")"
+                    )
+                )
+                if result.exit_code == 0:
+                    print(f"{progress} ✅ success")
+                elif not silent_error:
+                    print(
+                        f"{progress} ❌ subprocess error (exit code {result.exit_code})"
+                    )
+        finally:
+            if to_archive:
+                self._archive_outputs(to_archive)
+            metrics.flush()
+
+        if n_docked:
+            print(
+                f"docked {n_docked} molecules in {time.time() - submitted:.0f} s, "
+                + f"{n_failed} failed"
+            )
+
+    def _get_out_subdir(self):
+        """
+        Output folder of the current ligand set, also kept as `self.out_subdir`.
+        """
+
         self.out_subdir = (
             self.data_path
             / self.paths["out_dir"]
             / self.paths[f"out_{self.which_ligands}_dir"]
         )
 
-        # TODO: parallelize the docking process
-        for trgt in targets_to_dock:
-            trgt_name = trgt.lower()
-            out_pdbqt_dir = self.out_subdir / trgt_name / self.paths["out_pdbqt_dir"]
-            out_logs_dir = self.out_subdir / trgt_name / self.paths["out_logs_dir"]
-            os.makedirs(out_pdbqt_dir, exist_ok=True)
-            os.makedirs(out_logs_dir, exist_ok=True)
+        return self.out_subdir
 
-            ligands_to_dock = list(  # filter out already docked molecules
-                set(os.listdir(self.ligands_gen_dir)) - set(os.listdir(out_pdbqt_dir))
-            )
+    def _get_ledger(self):
+        """
+        Opens the docking job ledger of the current ligand set.
+        """
 
-            print(
-                f">>> DOCKING {len(ligands_to_dock)} MOLECULES ON {trgt.upper()} <<< "
+        self._get_out_subdir()
+
+        return JobLedger(
+            self.out_subdir / self.paths["ledger_db"],
+            max_attempts=self.docking_params["max_attempts"],
+            lease_seconds=self.docking_params["lease_seconds"],
+        )
+
+    def _get_cost_model_path(self):
+        """
+        Dock time model learned by earlier runs of this host on the current ligand set.
+        """
+
+        out_subdir = self._get_out_subdir()
+        out_subdir.mkdir(parents=True, exist_ok=True)
+
+        return host_model_path(out_subdir / self.paths["cost_model_json"])
+
+    def _get_metrics(self):
+        """
+        Docking metrics of this TinyDock, shared by all its runs so counters keep growing.
+        """
+
+        if getattr(self, "_metrics", None) is None:
+            self._metrics = DockingMetrics(
+                self._get_out_subdir() / self.paths["metrics_jsonl"],
+                prometheus_path=self.docking_params["prometheus_textfile"],
+                interval=self.docking_params["metrics_interval"],
             )
 
-            if os.path.isfile(
-                str(dock_from_logs)
-            ):  # if choose molecules from logs of another docking experiment
-                ligands_from_logs = pd.read_csv(molecs_from_logs)["uuid"].values
-                ligand_files = []
-                for lig in ligands_to_dock:
-                    if change_file_ext(lig) in ligands_from_logs:
-                        ligand_files.append(lig)
+        return self._metrics
 
-            elif subsample != False or subsample < 1:
-                subsample_count = int(subsample * len(ligands_to_dock))
-                print(f"subsampling {subsample_count} molecules to dock")
-                ligand_files = sample(ligands_to_dock, subsample_count)
+    def _docked_ligands(self, target, tier=None):
+        """
+        Ligands with both an output pose and a log on disk, used to seed a new ledger queue.
+        """
 
-            else:
-                ligand_files = ligands_to_dock
+        poses, logs = self._out_folders(target, tier)
+        log_files = set(logs.listdir())
 
-            # dock every molecule
-            config_path = (
-                self.data_path
-                / self.paths["targets_dir"]
-                / self.paths["targets_vina_config_dir"]
-                / self.all_targets[trgt]["vina_config"]
+        return [
+            lig
+            for lig in poses.listdir()
+            if change_file_ext(lig, ext="txt") in log_files
+        ]
+
+    def _out_archive(self, target, create=False):
+        """
+        Packed archive of a target's docking outputs (all tiers), None if the target has
+        none and `create` is False.
+        """
+
+        archive_path = self.out_subdir / target.lower() / self.paths["out_archive"]
+        if archive_path not in self._archives:
+            if not (create or PackedArchive.exists(archive_path)):
+                return None
+            self._archives[archive_path] = PackedArchive(
+                archive_path, self.paths["archive_compress"]
             )
-            receptor_path = (
-                self.data_path
-                / self.paths["targets_dir"]
-                / self.paths["targets_pdbqt_dir"]
-                / self.all_targets[trgt]["pdbqt"]
+
+        return self._archives[archive_path]
+
+    def _out_folders(self, target, tier=None):
+        """
+        Output pose and log folders of a target, reading loose files and the target's archive alike.
+        """
+
+        target_dir = self.out_subdir / target.lower()
+        archive = self._out_archive(target)
+
+        return tuple(
+            Folder(out_dir, archive, out_dir.relative_to(target_dir).as_posix())
+            for out_dir in self._make_out_dirs(target, tier)
+        )
+
+    def _archive_outputs(self, jobs):
+        """
+        Moves docked molecules' poses and logs from loose files into their targets'
+        archives, one append (and fsync) per target for the whole chunk.
+        """
+
+        by_target = {}
+        for job in jobs:
+            by_target.setdefault(job.target, []).append(job)
+
+        metrics = self._get_metrics()
+        for target, target_jobs in by_target.items():
+            start = time.time()
+            target_dir = self.out_subdir / target.lower()
+            paths = [
+                path for job in target_jobs for path in (job.out_pdbqt, job.out_log)
+            ]
+            self._out_archive(target, create=True).write_many(
+                [
+                    (path.relative_to(target_dir).as_posix(), path.read_bytes())
+                    for path in paths
+                ]
             )
+            for path in paths:
+                os.remove(path)
+            metrics.record_archive(target, len(target_jobs), time.time() - start)
 
-            for i, ligand in enumerate(ligand_files):
-                print(
-                    f"docking molecule {change_file_ext(ligand)} ({i + 1}/{len(ligand_files)})",
-                    end="",
+    def _ligand_archive(self):
+        if self.ligands_subdir not in self._archives:
+            if not PackedArchive.exists(self.ligands_subdir):
+                return None
+            self._archives[self.ligands_subdir] = PackedArchive(self.ligands_subdir)
+
+        return self._archives[self.ligands_subdir]
+
+    def _ligand_folder(self):
+        return Folder(self.ligands_subdir, self._ligand_archive())
+
+    def _ligand_source(self, target, ligand):
+        """
+        (path vina reads a prepared ligand from, ligand folder to extract it from). Ligands
+        only found in the ligand archive get a path in a scratch folder of this process,
+        where the docking worker extracts them right before the job and removes them
+        after it (see `scheduler.stage_ligands`). Other ligands have no folder.
+        """
+
+        ligand_path = self.ligands_subdir / ligand
+        archive = self._ligand_archive()
+        if ligand_path.is_file() or archive is None or ligand not in archive:
+            return ligand_path, None
+
+        if self._scratch_dir is None:
+            self._scratch_dir = Path(
+                tempfile.mkdtemp(
+                    prefix=f".{self.ligands_subdir.name}_scratch_",
+                    dir=self.ligands_dir,
                 )
-                try:
-                    shell_command(
-                        f"vina --config {config_path} "
-                        + f"--receptor {receptor_path} "
-                        + f"--ligand {self.ligands_subdir / ligand} "
-                        + f"--out {out_pdbqt_dir / ligand} "
-                        + f"--log {out_logs_dir / change_file_ext(ligand, ext='txt')}"
+            )
+
+        # one folder per target, a ligand may be docked on several targets at once
+        return self._scratch_dir / target.lower() / ligand, self._ligand_folder()
+
+    def _remove_scratch_ligands(self, jobs=()):
+        """
+        Removes ligands left extracted by jobs that never finished, and the scratch
+        folder once it's empty.
+        """
+
+        if self._scratch_dir is None:
+            return
+        for job in jobs:
+            if job.ligand_folder is not None and job.ligand_path.exists():
+                os.remove(job.ligand_path)
+        for target_dir in self._scratch_dir.iterdir():
+            if target_dir.is_dir() and not os.listdir(target_dir):
+                os.rmdir(target_dir)
+        if not os.listdir(self._scratch_dir):
+            os.rmdir(self._scratch_dir)
+            self._scratch_dir = None
+
+    def pack_storage(self, targets=None, ligands=True, remove=True):
+        """
+        Packs the loose files of the current ligand set into archives: ligands into
+        `<ligands dir>.pack`, and every target's poses and logs (all tiers) into its
+        `out_archive`. Readers in tinymolecule go through the archives transparently.
+
+        Parameters
+        ----------
+        targets: list (Optional)
+            Targets whose outputs to pack, all if not specified
+
+        ligands: bool (Optional)
+            Pack the prepared ligands too
+
+        remove: bool (Optional)
+            Delete the loose files once packed
+        """
+
+        self._get_out_subdir()
+        compress = self.paths["archive_compress"]
+        if ligands:
+            n_files = pack_directory(
+                self.ligands_subdir, self.ligands_subdir, compress, remove
+            )
+            print(f"packed {n_files} ligands")
+
+        for target in targets or self.all_targets:
+            target_dir = self.out_subdir / target.lower()
+            for tier in (None, "screen", "refine"):
+                tier_dir = target_dir / tier if tier else target_dir
+                for name in (self.paths["out_pdbqt_dir"], self.paths["out_logs_dir"]):
+                    if not (tier_dir / name).is_dir():
+                        continue
+                    n_files = pack_directory(
+                        tier_dir / name,
+                        target_dir / self.paths["out_archive"],
+                        compress,
+                        remove,
+                        prefix=(tier_dir / name).relative_to(target_dir).as_posix(),
                     )
-                    print(" ✅ success")
-                except CalledProcessError as e:
-                    if not silent_error:
-                        print(" ❌ subprocess error")
+                    print(f"packed {n_files} files of {target} from {tier_dir / name}")
+        self._archives = {}  # reopen with the new entries
+
+    def unpack_storage(self, targets=None, ligands=True):
+        """
+        Writes the contents of the archives of `pack_storage` back to loose files.
+        """
+
+        self._get_out_subdir()
+        if ligands and PackedArchive.exists(self.ligands_subdir):
+            n_files = unpack_archive(self.ligands_subdir, self.ligands_subdir)
+            print(f"unpacked {n_files} ligands")
+
+        for target in targets or self.all_targets:
+            target_dir = self.out_subdir / target.lower()
+            archive_path = target_dir / self.paths["out_archive"]
+            if PackedArchive.exists(archive_path):
+                n_files = unpack_archive(archive_path, target_dir)
+                print(f"unpacked {n_files} files of {target}")
 
     def generate_logs_table(self, targets):
         pass
@@ -0,0 +1,352 @@
+import os
+import mmap
+import zlib
+import fcntl
+import struct
+import argparse
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+
+
+PACK_EXT = ".pack"
+INDEX_EXT = ".idx"
+
+# index record: key length, data offset, data length, flags, then the key itself
+_RECORD = struct.Struct("<HQIB")
+_COMPRESSED = 1
+
+
+class PackedArchive:
+    """
+    Append-only archive of many small files (e.g. ligand and pose PDBQTs, vina logs) in one
+    data file `<path>.pack` with a compact offset index `<path>.idx`.
+
+    Entries are read through an mmap of the data file and may be zlib compressed.
+    Writing a key again appends a new entry that shadows the old one. Appends hold an
+    exclusive file lock, so several processes can add to one archive.
+    """
+
+    def __init__(self, path: Union[str, Path], compress: bool = False):
+        path = Path(path)
+        if path.suffix == PACK_EXT:
+            path = path.with_suffix("")
+        self.pack_path = path.with_name(path.name + PACK_EXT)
+        self.index_path = path.with_name(path.name + INDEX_EXT)
+        self.compress = compress
+
+        self.pack_path.parent.mkdir(parents=True, exist_ok=True)
+        self._pack = open(self.pack_path, "a+b")
+        self._index_file = open(self.index_path, "a+b")
+        self._index: Dict[str, Tuple[int, int, int]] = (
+            {}
+        )  # key -> offset, length, flags
+        self._index_pos = 0
+        self._mmap = None
+        self.refresh()
+
+    @staticmethod
+    def exists(path: Union[str, Path]) -> bool:
+        path = Path(path)
+        return path.with_name(path.name + INDEX_EXT).is_file()
+
+    def refresh(self):
+        """
+        Loads index records appended since the last call, e.g. by other processes.
+        """
+
+        self._index_file.seek(self._index_pos)
+        buffer = self._index_file.read()
+        pos = 0
+        while pos + _RECORD.size <= len(buffer):
+            key_length, offset, length, flags = _RECORD.unpack_from(buffer, pos)
+            end = pos + _RECORD.size + key_length
+            if end > len(buffer):  # record still being written
+                break
+            key = buffer[pos + _RECORD.size : end].decode()
+            self._index[key] = (offset, length, flags)
+            pos = end
+        self._index_pos += pos
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._index
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def keys(self, prefix: str = "") -> List[str]:
+        return [key for key in self._index if key.startswith(prefix)]
+
+    def locate(self, key: str) -> Tuple[int, int]:
+        """
+        (offset, length) of an entry's data, which changes whenever the key is written again.
+        """
+
+        offset, length, _ = self._index[key]
+        return offset, length
+
+    def read(self, key: str) -> bytes:
+        offset, length, flags = self._index[key]
+        if self._mmap is None or offset + length > len(self._mmap):
+            if self._mmap is not None:
+                self._mmap.close()
+            self._pack.flush()
+            self._mmap = mmap.mmap(self._pack.fileno(), 0, access=mmap.ACCESS_READ)
+
+        data = self._mmap[offset : offset + length]
+
+        return zlib.decompress(data) if flags & _COMPRESSED else data
+
+    def read_text(self, key: str) -> str:
+        return self.read(key).decode()
+
+    def write(self, key: str, data: Union[bytes, str]):
+        self.write_many([(key, data)])
+
+    def write_many(self, entries: List[Tuple[str, Union[bytes, str]]]):
+        """
+        Appends several entries under one lock: data first, then their index records,
+        so the index never points at data that isn't there.
+        """
+
+        blobs = []
+        for key, data in entries:
+            data = data.encode() if isinstance(data, str) else data
+            flags = 0
+            if self.compress:
+                data, flags = zlib.compress(data), _COMPRESSED
+            blobs.append((key.encode(), data, flags))
+
+        fcntl.flock(self._pack, fcntl.LOCK_EX)
+        try:
+            self._pack.seek(0, os.SEEK_END)
+            offset = self._pack.tell()
+            records = []
+            for key, data, flags in blobs:
+                self._pack.write(data)
+                records.append(_RECORD.pack(len(key), offset, len(data), flags) + key)
+                offset += len(data)
+            self._pack.flush()
+            os.fsync(self._pack.fileno())
+
+            self._index_file.seek(0, os.SEEK_END)
+            self._index_file.write(b"".join(records))
+            self._index_file.flush()
+        finally:
+            fcntl.flock(self._pack, fcntl.LOCK_UN)
+
+        self.refresh()
+
+    def close(self):
+        if self._mmap is not None:
+            self._mmap.close()
+        self._pack.close()
+        self._index_file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class Folder:
+    """
+    A directory whose files may also live in a packed archive under `prefix`/.
+    Lists the union of both and reads loose files first, so readers don't need to
+    know which storage holds a file.
+
+    Folders can be sent to worker processes, which open the archive once and reuse it,
+    and compare equal when they read the same files.
+    """
+
+    def __init__(
+        self,
+        path: Union[str, Path],
+        archive: Optional[PackedArchive] = None,
+        prefix: str = "",
+    ):
+        self.path = Path(path)
+        self.archive = archive
+        self.prefix = f"{prefix}/" if prefix else ""
+
+    def __reduce__(self):
+        return _open_folder, self._location()
+
+    def _location(self) -> Tuple[str, Optional[str], str]:
+        archive_path = None if self.archive is None else str(self.archive.pack_path)
+        return str(self.path), archive_path, self.prefix.rstrip("/")
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, Folder) and self._location() == other._location()
+
+    def __hash__(self) -> int:
+        return hash(self._location())
+
+    def listdir(self) -> List[str]:
+        names = set(os.listdir(self.path)) if self.path.is_dir() else set()
+        if self.archive is not None:
+            start = len(self.prefix)
+            names.update(key[start:] for key in self.archive.keys(self.prefix))
+
+        return sorted(names)
+
+    def exists(self, name: str) -> bool:
+        return (self.path / name).is_file() or (
+            self.archive is not None and self.prefix + name in self.archive
+        )
+
+    def signatures(self) -> Dict[str, str]:
+        """
+        Version of every file by name, which changes whenever the file is rewritten:
+        size and modification time of loose files, location of archive entries.
+        """
+
+        signatures = {}
+        if self.archive is not None:
+            start = len(self.prefix)
+            for key in self.archive.keys(self.prefix):
+                offset, length = self.archive.locate(key)
+                signatures[key[start:]] = f"archive:{offset}:{length}"
+        if self.path.is_dir():
+            with os.scandir(self.path) as entries:
+                for entry in entries:
+                    if entry.is_file():
+                        stat = entry.stat()
+                        signatures[entry.name] = f"{stat.st_size}:{stat.st_mtime_ns}"
+
+        return signatures
+
+    def read_text(self, name: str) -> str:
+        if (self.path / name).is_file():
+            return (self.path / name).read_text()
+        if self.archive is not None and self.prefix + name in self.archive:
+            return self.archive.read_text(self.prefix + name)
+
+        raise FileNotFoundError(self.path / name)
+
+
+# per process, archives of unpickled Folders
+_OPEN_ARCHIVES: Dict[str, PackedArchive] = {}
+
+
+def _open_folder(path: str, archive_path: Optional[str], prefix: str) -> Folder:
+    archive = None
+    if archive_path is not None:
+        if archive_path not in _OPEN_ARCHIVES:
+            _OPEN_ARCHIVES[archive_path] = PackedArchive(archive_path)
+        archive = _OPEN_ARCHIVES[archive_path]
+        archive.refresh()  # entries added since it was opened
+
+    return Folder(path, archive, prefix)
+
+
+def _iter_files(src_dir: Path) -> Iterator[Path]:
+    for root, _, files in os.walk(src_dir):
+        for name in sorted(files):
+            yield Path(root) / name
+
+
+def pack_directory(
+    src_dir: Union[str, Path],
+    archive_path: Union[str, Path],
+    compress: bool = False,
+    remove: bool = False,
+    prefix: str = "",
+    batch_size: int = 1000,
+) -> int:
+    """
+    Appends every file under `src_dir` to an archive, keyed by `prefix`/ and its path
+    relative to `src_dir` (e.g. "pdbqt/ec0fdc31.pdbqt"). Skips archive files.
+
+    Parameters
+    ----------
+    src_dir: Path or string
+        Directory to pack
+
+    archive_path: Path or string
+        Archive to append to, created if needed
+
+    compress: bool (Optional)
+        zlib compress the entries
+
+    remove: bool (Optional)
+        Delete the packed files once they are safely in the archive
+
+    prefix: string (Optional)
+        Folder inside the archive to pack into
+
+    batch_size: int (Optional)
+        Files appended under one lock
+
+    Returns
+    -------
+    Number of files packed
+    """
+
+    src_dir = Path(src_dir)
+    prefix = f"{prefix}/" if prefix else ""
+    n_packed = 0
+    with PackedArchive(archive_path, compress) as archive:
+        archive_files = {archive.pack_path.resolve(), archive.index_path.resolve()}
+        files = [
+            path
+            for path in _iter_files(src_dir)
+            if path.resolve() not in archive_files
+            and path.suffix not in (PACK_EXT, INDEX_EXT)
+        ]
+        for i in range(0, len(files), batch_size):
+            batch = files[i : i + batch_size]
+            archive.write_many(
+                [
+                    (prefix + path.relative_to(src_dir).as_posix(), path.read_bytes())
+                    for path in batch
+                ]
+            )
+            if remove:
+                for path in batch:
+                    os.remove(path)
+            n_packed += len(batch)
+
+    return n_packed
+
+
+def unpack_archive(archive_path: Union[str, Path], dest_dir: Union[str, Path]) -> int:
+    """
+    Writes every entry of an archive back to a file under `dest_dir`, returns how many.
+    """
+
+    dest_dir = Path(dest_dir)
+    with PackedArchive(archive_path) as archive:
+        for key in archive.keys():
+            out_path = dest_dir / key
+            out_path.parent.mkdir(parents=True, exist_ok=True)
+            out_path.write_bytes(archive.read(key))
+
+        return len(archive)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Pack a directory of ligands or docking outputs into an archive, or unpack one."
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+    pack = commands.add_parser("pack")
+    pack.add_argument("src_dir")
+    pack.add_argument("archive")
+    pack.add_argument("--compress", action="store_true")
+    pack.add_argument("--remove", action="store_true", help="delete packed files")
+    unpack = commands.add_parser("unpack")
+    unpack.add_argument("archive")
+    unpack.add_argument("dest_dir")
+    args = parser.parse_args()
+
+    if args.command == "pack":
+        n_files = pack_directory(args.src_dir, args.archive, args.compress, args.remove)
+        print(f"packed {n_files} files into {args.archive}")
+    else:
+        n_files = unpack_archive(args.archive, args.dest_dir)
+        print(f"unpacked {n_files} files into {args.dest_dir}")
+
+
+if __name__ == "__main__":
+    main()
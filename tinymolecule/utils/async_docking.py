@@ -0,0 +1,167 @@
+import time
+import queue
+import asyncio
+import threading
+from typing import Iterable, Iterator, Optional
+
+from tinymolecule.utils.scheduler import (
+    SPAWN_ERROR_EXIT_CODE,
+    TIMEOUT_EXIT_CODE,
+    DockingJob,
+    JobResult,
+    default_n_workers,
+    stage_ligands,
+    vina_command,
+)
+
+
+def is_transient(exit_code: int) -> bool:
+    """
+    Failures worth retrying: vina killed by a signal (e.g. the OOM killer) or unable to start.
+    Parse errors and timeouts would fail the same way again.
+    """
+
+    return exit_code < 0 or exit_code == SPAWN_ERROR_EXIT_CODE
+
+
+async def _run_vina_once(job: DockingJob, timeout: Optional[float]):
+    try:
+        proc = await asyncio.create_subprocess_exec(
+            *vina_command(job),
+            stdout=asyncio.subprocess.DEVNULL,
+            stderr=asyncio.subprocess.PIPE,
+        )
+    except OSError as e:
+        return SPAWN_ERROR_EXIT_CODE, str(e)
+
+    try:
+        _, stderr = await asyncio.wait_for(proc.communicate(), timeout)
+    except asyncio.TimeoutError:
+        proc.kill()
+        await proc.communicate()
+        return TIMEOUT_EXIT_CODE, f"timed out after {timeout} s"
+    except asyncio.CancelledError:  # never leave an orphaned vina behind
+        proc.kill()
+        await proc.communicate()  # reaped before the loop closes
+        raise
+
+    error = stderr.decode(errors="replace")[-2000:] if proc.returncode else ""
+
+    return proc.returncode, error
+
+
+async def dock_job(
+    job: DockingJob,
+    timeout: Optional[float] = None,
+    retries: int = 2,
+    backoff: float = 5.0,
+) -> JobResult:
+    """
+    Docks a single job, retrying transient failures after `backoff`, 2 * `backoff`, ... seconds.
+    """
+
+    start = time.time()
+    with stage_ligands([job]):
+        stage_time = time.time() - start
+        for attempt in range(retries + 1):
+            exit_code, error = await _run_vina_once(job, timeout)
+            if exit_code == 0 or not is_transient(exit_code) or attempt == retries:
+                break
+            await asyncio.sleep(backoff * 2**attempt)
+
+    return JobResult(
+        job, exit_code, time.time() - start, error, start, stage_time=stage_time
+    )
+
+
+def run_jobs_async(
+    jobs: Iterable[DockingJob],
+    n_workers: Optional[int] = None,
+    timeout: Optional[float] = None,
+    retries: int = 2,
+    backoff: float = 5.0,
+) -> Iterator[JobResult]:
+    """
+    Docks every job with vina subprocesses driven by an asyncio event loop.
+
+    Parameters
+    ----------
+    jobs: iterable of DockingJob
+        (target, ligand) pairs to dock, in the order they should be started
+
+    n_workers: int (Optional)
+        Number of vina processes to run at once (semaphore size), defaults to CPU count / cpu per job
+
+    timeout: float (Optional)
+        Wall-clock limit in seconds for a single vina process
+
+    retries: int (Optional)
+        How many times to re-run a job after a transient failure
+
+    backoff: float (Optional)
+        Seconds to wait before the first retry, doubled for every following one
+
+    Yields
+    ------
+    JobResult for every job in order of completion, with vina's stderr for failed jobs
+    """
+
+    jobs = list(jobs)
+    if not jobs:
+        return
+
+    if n_workers is None:
+        n_workers = default_n_workers(jobs[0].cpu)
+
+    # the loop runs in its own thread, so this also works where the calling thread
+    # already runs one, e.g. a Jupyter kernel
+    loop = asyncio.new_event_loop()
+    done = queue.Queue()
+
+    async def run_and_release(job, semaphore):
+        try:
+            result = await dock_job(job, timeout, retries, backoff)
+        except Exception as e:  # e.g. an archived ligand that can't be staged
+            result = JobResult(job, SPAWN_ERROR_EXIT_CODE, 0.0, repr(e))
+        finally:
+            semaphore.release()
+        done.put(result)
+
+    async def produce():
+        semaphore = asyncio.Semaphore(n_workers)
+        tasks = []
+        try:
+            for job in jobs:  # only `n_workers` jobs are in flight at any time
+                await semaphore.acquire()
+                tasks.append(loop.create_task(run_and_release(job, semaphore)))
+            await asyncio.gather(*tasks)
+        finally:  # cancelled when the consumer stopped early, kill running vina processes
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    producer = loop.create_task(produce())
+
+    def run_loop():
+        try:
+            loop.run_until_complete(producer)
+        except asyncio.CancelledError:  # by the consumer, which stopped early
+            pass
+        finally:
+            done.put(None)  # wakes the consumer if the producer failed
+
+    thread = threading.Thread(target=run_loop, daemon=True)
+    thread.start()
+    try:
+        for _ in range(len(jobs)):
+            result = done.get()
+            if result is None:
+                break
+            yield result
+        thread.join()
+    finally:
+        if thread.is_alive():  # consumer stopped early
+            loop.call_soon_threadsafe(producer.cancel)
+        thread.join()
+        loop.close()
+    producer.result()  # re-raises whatever stopped the producer
@@ -0,0 +1,209 @@
+import os
+import time
+import shutil
+import tempfile
+import subprocess
+from pathlib import Path
+from typing import Iterable, Iterator, List, Optional
+
+from tinymolecule.utils.scheduler import (
+    SPAWN_ERROR_EXIT_CODE,
+    TIMEOUT_EXIT_CODE,
+    DockingJob,
+    JobResult,
+    default_n_workers,
+    stage_ligands,
+    threadsafe_context,
+)
+from tinymolecule.utils.docking import parse_vina_results, write_vina_log
+
+
+def vina_batch_command(jobs: List[DockingJob], out_dir: Path) -> List[str]:
+    """
+    Builds a vina 1.2 CLI call docking all jobs' ligands in one process. The jobs
+    must share target and settings, poses go to `out_dir`/<ligand>_out.pdbqt.
+    """
+
+    job = jobs[0]
+    command = [
+        "vina",
+        "--config",
+        str(job.config_path),
+        "--receptor",
+        str(job.receptor_path),
+        "--dir",
+        str(out_dir),
+        "--cpu",
+        str(job.cpu),
+    ]
+    if job.exhaustiveness is not None:
+        command += ["--exhaustiveness", str(job.exhaustiveness)]
+    if job.num_modes is not None:
+        command += ["--num_modes", str(job.num_modes)]
+
+    return command + ["--batch"] + [str(j.ligand_path) for j in jobs]
+
+
+def _call_vina(command, timeout=None):
+    try:
+        proc = subprocess.run(
+            command,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+            timeout=timeout,
+        )
+        return proc.returncode, proc.stderr.decode(errors="replace")[-2000:]
+    except subprocess.TimeoutExpired:
+        return TIMEOUT_EXIT_CODE, f"timed out after {timeout} s"
+    except OSError as e:
+        return SPAWN_ERROR_EXIT_CODE, str(e)
+
+
+def _collect(job: DockingJob, out_dir: Path) -> Optional[float]:
+    """
+    Moves a ligand's poses out of the batch directory and writes its log.
+
+    Returns the seconds this took, or None if vina produced no poses.
+    """
+
+    start = time.time()
+    batch_out = out_dir / f"{Path(job.ligand).stem}_out.pdbqt"
+    if not batch_out.is_file():
+        return None
+
+    results = parse_vina_results(batch_out.read_text())
+    if not len(results):
+        return None
+
+    os.replace(batch_out, job.out_pdbqt)
+    write_vina_log(job.out_log, results, header="AutoDock Vina (batch)")
+
+    return time.time() - start
+
+
+def run_vina_batch(
+    jobs: List[DockingJob], timeout: Optional[float] = None
+) -> List[JobResult]:
+    """
+    Docks a chunk of jobs on one target in a single vina process and splits the
+    output back into per-ligand pose and log files.
+
+    Ligands without output are re-docked one by one, so every failure is attributed
+    to its own ligand with its own exit code and error output.
+    """
+
+    start = time.time()
+    # scratch directory next to the outputs, so os.replace is an atomic rename
+    target_dir = jobs[0].out_pdbqt.parent.parent
+    out_dir = Path(tempfile.mkdtemp(prefix=".batch_", dir=target_dir))
+    try:
+        with stage_ligands(jobs):
+            stage_time = (time.time() - start) / len(jobs)
+            batch_timeout = timeout * len(jobs) if timeout else None
+            # the exit code covers the whole batch, outcomes are read per ligand from the outputs
+            _call_vina(vina_batch_command(jobs, out_dir), batch_timeout)
+
+            write_times = {job: _collect(job, out_dir) for job in jobs}
+            docked = [job for job in jobs if write_times[job] is not None]
+            duration = (time.time() - start) / len(jobs)
+            results = [
+                JobResult(job, 0, duration, "", start, write_times[job], stage_time)
+                for job in docked
+            ]
+
+            for job in jobs:
+                if write_times[job] is not None:
+                    continue
+                single_start = time.time()
+                exit_code, error = _call_vina(
+                    vina_batch_command([job], out_dir), timeout
+                )
+                write_time = _collect(job, out_dir) if exit_code == 0 else None
+                if exit_code == 0 and write_time is None:
+                    exit_code, error = 1, "vina wrote no poses"
+                results.append(
+                    JobResult(
+                        job,
+                        exit_code,
+                        time.time() - single_start,
+                        error,
+                        single_start,
+                        write_time,
+                    )
+                )
+    finally:
+        shutil.rmtree(out_dir, ignore_errors=True)
+
+    return results
+
+
+def make_batches(jobs: Iterable[DockingJob], batch_size: int) -> List[List[DockingJob]]:
+    """
+    Splits jobs into chunks of at most `batch_size` jobs sharing target and vina settings.
+    Jobs keep their order within a chunk, and chunks are ordered by their first job, so
+    an order such as longest first carries over to the chunks.
+    """
+
+    groups = {}  # settings -> [(position, job)], in order of first appearance
+    for i, job in enumerate(jobs):
+        settings = (job.target, job.params, job.cpu, job.exhaustiveness, job.num_modes)
+        groups.setdefault(settings, []).append((i, job))
+
+    batches = [
+        group[i : i + batch_size]
+        for group in groups.values()
+        for i in range(0, len(group), batch_size)
+    ]
+    batches.sort(key=lambda batch: batch[0][0])
+
+    return [[job for _, job in batch] for batch in batches]
+
+
+def run_jobs_batched(
+    jobs: Iterable[DockingJob],
+    n_workers: Optional[int] = None,
+    batch_size: int = 64,
+    timeout: Optional[float] = None,
+) -> Iterator[JobResult]:
+    """
+    Docks jobs in chunks of `batch_size` ligands per vina process (vina 1.2 `--batch`),
+    cutting process spawn and receptor setup to once per chunk.
+
+    Parameters
+    ----------
+    jobs: iterable of DockingJob
+        (target, ligand) pairs to dock, in the order they should be started
+
+    n_workers: int (Optional)
+        Number of vina processes to run at once, defaults to CPU count / cpu per job
+
+    batch_size: int (Optional)
+        Maximum number of ligands docked by one vina process
+
+    timeout: float (Optional)
+        Wall-clock limit in seconds per ligand, a chunk gets `timeout` times its size
+
+    Yields
+    ------
+    JobResult for every job, chunk by chunk in order of completion
+    """
+
+    batches = make_batches(jobs, batch_size)
+    if not batches:
+        return
+
+    if n_workers is None:
+        n_workers = default_n_workers(batches[0][0].cpu)
+
+    if n_workers <= 1:
+        for batch in batches:
+            yield from run_vina_batch(batch, timeout)
+        return
+
+    with threadsafe_context().Pool(processes=min(n_workers, len(batches))) as pool:
+        for results in pool.imap_unordered(_run_batch, [(b, timeout) for b in batches]):
+            yield from results
+
+
+def _run_batch(args):
+    return run_vina_batch(*args)
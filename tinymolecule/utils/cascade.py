@@ -0,0 +1,44 @@
+import heapq
+from typing import Dict, Iterable, Optional
+
+import numpy as np
+
+
+def ligand_score(log_table: np.ndarray, n_modes: Optional[int] = None) -> float:
+    """
+    Per-target score used by the objective function: negated mean affinity over all
+    binding modes (higher binds better), same as `helper_fn.get_mean_baff_df`, or over
+    the best `n_modes` of them if given.
+    """
+
+    return -np.nanmean(log_table[:n_modes, 0])
+
+
+def select_binders(
+    scores: Dict[str, float],
+    percentile: Optional[float] = None,
+    cutoff: Optional[float] = None,
+) -> list:
+    """
+    Ligands worth docking on the remaining variants: the top `percentile` percent by score
+    and/or those with mean affinity at or below `cutoff` kcal/mol. Keeps all if neither is given.
+    """
+
+    selected = list(scores)
+    if cutoff is not None:
+        selected = [lig for lig in selected if -scores[lig] <= cutoff]
+    if percentile is not None and selected:
+        min_score = np.percentile(list(scores.values()), 100 - percentile)
+        selected = [lig for lig in selected if scores[lig] >= min_score]
+
+    return selected
+
+
+def kth_best(values: Iterable[float], k: int) -> float:
+    """
+    The k-th highest value, -inf if there are fewer than k values.
+    """
+
+    top = heapq.nlargest(k, values)
+
+    return top[-1] if len(top) == k else -np.inf
@@ -0,0 +1,219 @@
+import os
+import json
+import time
+import socket
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from tinymolecule.utils.archive import Folder
+from tinymolecule.utils.docking import read_vina_config
+from tinymolecule.utils.scheduler import DockingJob, JobResult
+
+
+# log(seconds) ~ intercept + log(heavy atoms) + torsions + log(box volume) + log(exhaustiveness) + log(cpu)
+_PRIOR_WEIGHTS = [-6.9, 1.0, 0.1, 0.5, 1.0, -0.8]
+_PRIOR_VARIANCE = 1.0
+_FORGETTING = 0.999  # older measurements fade out slowly, e.g. after a hardware change
+_DEFAULT_LIGAND = (25, 5)  # heavy atoms, torsions assumed for unreadable ligands
+
+
+def ligand_features(
+    pdbqt_path: Union[str, Path], folder: Optional[Folder] = None
+) -> Tuple[int, int]:
+    """
+    Heavy atom count and number of rotatable bonds (TORSDOF line) of a prepared ligand,
+    read from `folder` (e.g. the ligand archive) if the file isn't there.
+    """
+
+    pdbqt_path = Path(pdbqt_path)
+    heavy_atoms, torsdof = 0, None
+    try:
+        if folder is not None and not pdbqt_path.is_file():
+            lines = folder.read_text(pdbqt_path.name).splitlines()
+        else:
+            with open(pdbqt_path) as pdbqt:
+                lines = pdbqt.readlines()
+        for line in lines:
+            if line.startswith(("ATOM", "HETATM")):
+                if line[77:79].strip() not in ("H", "HD", "HS"):
+                    heavy_atoms += 1
+            elif line.startswith("TORSDOF"):
+                torsdof = int(line.split()[1])
+    except (OSError, ValueError, IndexError):
+        return _DEFAULT_LIGAND
+
+    if not heavy_atoms:
+        return _DEFAULT_LIGAND
+
+    return heavy_atoms, torsdof or 0
+
+
+def host_model_path(path: Union[str, Path], host: Optional[str] = None) -> Path:
+    """
+    This host's copy of a model saved at `path`, e.g. `cost_model.node1.json`. Dock times
+    depend on the machine, and hosts sharing one data folder would overwrite each other.
+    """
+
+    path = Path(path)
+    host = host or socket.gethostname()
+
+    return path.with_name(f"{path.stem}.{host}{path.suffix}")
+
+
+def box_settings(config_path: Union[str, Path]) -> Tuple[float, int]:
+    """
+    Search box volume (cubic angstrom) and exhaustiveness of a vina config.
+    """
+
+    config = read_vina_config(config_path)
+    try:
+        volume = np.prod([float(config[f"size_{axis}"]) for axis in "xyz"])
+    except KeyError:
+        volume = 20.0**3
+
+    return volume, int(config.get("exhaustiveness", 8))
+
+
+class CostModel:
+    """
+    Log-linear estimate of a docking job's wall time from ligand size, flexibility,
+    search box volume, exhaustiveness and CPUs, refined online by recursive least
+    squares on measured dock times.
+    """
+
+    def __init__(self, weights: Sequence[float] = None, covariance=None):
+        self.weights = np.array(weights if weights is not None else _PRIOR_WEIGHTS)
+        self.covariance = (
+            np.array(covariance)
+            if covariance is not None
+            else np.eye(len(self.weights)) * _PRIOR_VARIANCE
+        )
+        self._ligands = {}  # ligand path -> (heavy atoms, torsions)
+        self._boxes = {}  # config path -> (volume, exhaustiveness)
+
+    @classmethod
+    def load(cls, path: Union[str, Path]):
+        """
+        Model saved by an earlier run, or the prior if there is none.
+        """
+
+        try:
+            with open(path) as model_file:
+                saved = json.load(model_file)
+            return cls(saved["weights"], saved["covariance"])
+        except (OSError, ValueError, KeyError):
+            return cls()
+
+    def save(self, path: Union[str, Path]):
+        """
+        Replaces the model at `path` atomically, so a concurrent `load` never reads it
+        half written.
+        """
+
+        path = Path(path)
+        tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+        with open(tmp_path, "w") as model_file:
+            json.dump(
+                {
+                    "weights": self.weights.tolist(),
+                    "covariance": self.covariance.tolist(),
+                },
+                model_file,
+            )
+        os.replace(tmp_path, path)
+
+    def features(self, job: DockingJob) -> np.ndarray:
+        if job.ligand_path not in self._ligands:
+            self._ligands[job.ligand_path] = ligand_features(
+                job.ligand_path, job.ligand_folder
+            )
+        if job.config_path not in self._boxes:
+            self._boxes[job.config_path] = box_settings(job.config_path)
+
+        heavy_atoms, torsdof = self._ligands[job.ligand_path]
+        volume, exhaustiveness = self._boxes[job.config_path]
+
+        return np.array(
+            [
+                1.0,
+                np.log(heavy_atoms),
+                torsdof,
+                np.log(volume),
+                np.log(job.exhaustiveness or exhaustiveness),
+                np.log(job.cpu),
+            ]
+        )
+
+    def predict(self, features: np.ndarray) -> np.ndarray:
+        """
+        Expected wall time in seconds for one (1D) or many (2D) feature vectors.
+        """
+
+        return np.exp(features @ self.weights)
+
+    def update(self, features: np.ndarray, seconds: float):
+        """
+        Recursive least squares step towards a measured dock time.
+        """
+
+        error = np.log(max(seconds, 1e-3)) - features @ self.weights
+        cov_x = self.covariance @ features
+        gain = cov_x / (_FORGETTING + features @ cov_x)
+        self.weights = self.weights + gain * error
+        self.covariance = (self.covariance - np.outer(gain, cov_x)) / _FORGETTING
+
+
+class RunEstimator:
+    """
+    Orders a run's jobs longest first and keeps an estimate of its remaining wall time,
+    learning from every job that finishes.
+    """
+
+    def __init__(
+        self, jobs: List[DockingJob], model: CostModel, n_workers: Optional[int] = 1
+    ):
+        self.model = model
+        self.n_workers = max(1, n_workers or 1)
+        features = (
+            np.vstack([model.features(job) for job in jobs])
+            if jobs
+            else np.empty((0, len(model.weights)))
+        )
+
+        order = np.argsort(-model.predict(features), kind="stable")
+        self.jobs = [jobs[i] for i in order]
+        self.features = features[order]
+        self._index: Dict[DockingJob, int] = {job: i for i, job in enumerate(self.jobs)}
+        self._remaining = np.ones(len(self.jobs), dtype=bool)
+        self._eta, self._eta_time = None, 0.0
+
+    def finished(self, result: JobResult):
+        i = self._index[result.job]
+        self._remaining[i] = False
+        if result.exit_code == 0:
+            self.model.update(self.features[i], result.duration)
+
+    def eta(self, refresh_seconds: float = 1.0) -> float:
+        """
+        Seconds until all remaining jobs are docked, recomputed at most every `refresh_seconds`.
+        """
+
+        if not self._remaining.any():
+            return 0.0
+
+        if self._eta is None or time.time() - self._eta_time > refresh_seconds:
+            remaining = self.model.predict(self.features[self._remaining])
+            # the run can't end before its longest remaining job
+            self._eta = max(remaining.sum() / self.n_workers, remaining.max())
+            self._eta_time = time.time()
+
+        return self._eta
+
+
+def format_eta(seconds: float) -> str:
+    hours, rest = divmod(int(seconds), 3600)
+    minutes, seconds = divmod(rest, 60)
+
+    return f"{hours}h{minutes:02d}m" if hours else f"{minutes}m{seconds:02d}s"
@@ -1,6 +1,8 @@
 import os
+import re
 import shlex
 import subprocess
+from multiprocessing import Pool
 from pathlib import Path
 from random import sample
 import itertools
@@ -8,8 +10,17 @@ import itertools
 import numpy as np
 import pandas as pd
 
+from tinymolecule.utils.archive import Folder
+
 
 LOGS_SUMMARY_FILE = "summary.csv"
+N_MODES = 10  # binding modes per molecule in summaries
+
+# results table of a vina log: two header lines, a separator, then one row per mode
+_TABLE_HEADER = ("mode |", "| (kcal/mol) |", "-----+")
+_TABLE_ROW = re.compile(
+    r"\s*(\d+)\s+(-?\d+(?:\.\d*)?)\s+(\d+(?:\.\d*)?)\s+(\d+(?:\.\d*)?)\s*$"
+)
 
 
 def change_file_ext(filename, ext=None):
@@ -21,9 +32,13 @@ def change_file_ext(filename, ext=None):
     return new_filename
 
 
-def shell_command(command):
-    FNULL = open(os.devnull, "w")
-    subprocess.check_call(shlex.split(command), stdout=FNULL, stderr=subprocess.STDOUT)
+def shell_command(command, timeout=None):
+    subprocess.check_call(
+        shlex.split(command),
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.STDOUT,
+        timeout=timeout,
+    )
 
 
 def get_vina_header():
@@ -115,46 +130,342 @@ def dock(
     generate_logs_table(logs_path)
 
 
-def generate_logs_table(logs_path):
-    all_logs = os.listdir(logs_path)
-    logs_table = get_vina_header()  # get header of log entries
-    log_ids = []
+def read_vina_config(config_path):
+    """
+    Reads a vina config file ("key = value" per line) into a dictionary of strings.
+    """
+
+    config = {}
+    with open(config_path) as _config:
+        for line in _config:
+            line = line.split("#")[0]
+            if "=" in line:
+                key, value = line.split("=", 1)
+                config[key.strip()] = value.strip()
+
+    return config
+
+
+def parse_vina_results(pdbqt_text):
+    """
+    Collects the "REMARK VINA RESULT" lines of docked poses into an (n_modes, 3) array of
+    affinity (kcal/mol), rmsd l.b. and rmsd u.b.
+    """
 
-    for logfile in all_logs:
-        if logfile == LOGS_SUMMARY_FILE:  # ignore summary file that we will create
-            continue
+    results = [
+        list(map(float, line.split()[3:6]))
+        for line in pdbqt_text.splitlines()
+        if line.startswith("REMARK VINA RESULT")
+    ]
 
-        with open(logs_path / logfile) as _log:
-            lines = _log.readlines()
+    return np.array(results).reshape(-1, 3)
+
+
+def write_vina_log(log_path, results, header="AutoDock Vina"):
+    """
+    Writes a results table in the layout of vina CLI logs, readable by `read_vina_log`.
+    """
+
+    lines = [
+        header,
+        "",
+        "mode |   affinity | dist from best mode",
+        "     | (kcal/mol) | rmsd l.b.| rmsd u.b.",
+        "-----+------------+----------+----------",
+    ]
+    lines += [
+        f"{i + 1:4d}    {affinity:8.1f}   {lb:8.3f}   {ub:8.3f}"
+        for i, (affinity, lb, ub) in enumerate(results)
+    ]
+    lines.append("Writing output ... done.")
+
+    with open(log_path, "w") as _log:
+        _log.write("\n".join(lines) + "\n")
+
+
+def read_vina_log(log_path, n_modes=10):
+    """
+    Parses the results table of a vina log into an (n_modes, 3) float array of
+    affinity (kcal/mol), rmsd l.b. and rmsd u.b. per binding mode, padded with NaN.
+    Returns None if the log has no results table, e.g. vina was killed mid-run.
+    """
 
-        if len(lines) > 27:  # where the table starts
-            all_positions = lines[
-                -lines[::-1].index("\n") + 3 : -1
-            ]  # binding positions log
-        else:
-            continue
+    with open(log_path) as _log:
+        return parse_vina_log(_log.read(), n_modes)
+
+
+def parse_vina_log(log_text, n_modes=10):
+    """
+    Same as `read_vina_log` for the contents of a log, e.g. read from an archive.
+
+    The table must follow its header and separator lines, with rows numbered 1, 2, ...
+    It ends at the first line that isn't such a row, rows beyond `n_modes` are dropped.
+    """
+
+    lines = log_text.splitlines()
+    start = None
+    for i in range(2, len(lines)):
+        if (
+            lines[i].startswith(_TABLE_HEADER[2])
+            and lines[i - 2].startswith(_TABLE_HEADER[0])
+            and _TABLE_HEADER[1] in lines[i - 1]
+        ):
+            start = i + 1
+            break
+    if start is None:
+        return None
+
+    table = np.full((n_modes, 3), np.nan)
+    n_rows = 0
+    for line in lines[start:]:
+        row = _TABLE_ROW.match(line)
+        if row is None or int(row.group(1)) != n_rows + 1:
+            break
+        if n_rows < n_modes:
+            table[n_rows] = row.group(2, 3, 4)
+        n_rows += 1
+
+    return table if n_rows else None
+
+
+def _parse_logs_chunk(args):
+    folder, logfiles, n_modes = args
+    table = np.full((len(logfiles), 3 * n_modes), np.nan)
+    parsed = np.zeros(len(logfiles), dtype=bool)
+    for i, logfile in enumerate(logfiles):
+        try:
+            log = parse_vina_log(folder.read_text(logfile), n_modes)
+        except (OSError, UnicodeDecodeError):
+            log = None
+        if log is not None:
+            # affinities of all modes, then their rmsd l.b., then rmsd u.b.
+            table[i] = log.flatten(order="F")
+            parsed[i] = True
+
+    return table, parsed
+
+
+def parse_vina_logs(logs_path, logfiles, n_workers=None, chunksize=1000, n_modes=10):
+    """
+    Parses many vina logs of one directory in parallel chunks into a preallocated array.
+
+    Parameters
+    ----------
+    logs_path: Path or archive.Folder
+        Directory holding the logs
+
+    logfiles: list of strings
+        Names of the logs to parse
+
+    n_workers: int (Optional)
+        Number of worker processes, defaults to CPU count
+
+    chunksize: int (Optional)
+        Logs parsed by a worker at once
+
+    n_modes: int (Optional)
+        Binding modes kept per log
+
+    Returns
+    -------
+    ((len(logfiles), 3 * n_modes) float array in the `get_vina_header` column order,
+    boolean array telling which logs had a results table)
+    """
 
-        for i in range(len(all_positions)):
-            all_positions[i] = list(map(float, all_positions[i].split()))
+    folder = logs_path if isinstance(logs_path, Folder) else Folder(logs_path)
+    chunks = [
+        (folder, logfiles[i : i + chunksize], n_modes)
+        for i in range(0, len(logfiles), chunksize)
+    ]
 
-        log = np.array(all_positions)[:, 1:]
-        if log.shape == ():
-            log = create_empty_entry()
-        elif log.shape[0] < 10:
-            filler = np.ones((10 - log.shape[0], 3)) * np.nan
-            log = np.vstack((log, filler))
-        entry = log.flatten(order="F")
+    table = np.full((len(logfiles), 3 * n_modes), np.nan)
+    parsed = np.zeros(len(logfiles), dtype=bool)
 
-        logs_table = np.vstack((logs_table, entry))
-        log_ids.append(change_file_ext(logfile))
+    def fill(results):
+        for i, (chunk_table, chunk_parsed) in enumerate(results):
+            rows = slice(i * chunksize, i * chunksize + len(chunk_parsed))
+            table[rows], parsed[rows] = chunk_table, chunk_parsed
 
-    logs_df = pd.DataFrame(logs_table[1:], columns=logs_table[0], dtype=float)
+    n_workers = n_workers or os.cpu_count() or 1
+    if n_workers <= 1 or len(chunks) <= 1:
+        fill(map(_parse_logs_chunk, chunks))
+    else:
+        with Pool(processes=min(n_workers, len(chunks))) as pool:
+            fill(pool.imap(_parse_logs_chunk, chunks))
+
+    return table, parsed
+
+
+def generate_logs_table(logs_path, n_workers=None):
+    """
+    Summarizes every vina log of a directory into a table of binding modes, also saved
+    as `summary.csv` in the directory, see `generate_tiered_logs_table`.
+    """
+
+    logs_df = generate_tiered_logs_table([(None, logs_path)], n_workers).drop(
+        columns="tier"
+    )
+    logs_dir = logs_path.path if isinstance(logs_path, Folder) else Path(logs_path)
+    logs_df.to_csv(logs_dir / LOGS_SUMMARY_FILE)  # save
+
+    return logs_df
+
+
+def generate_tiered_logs_table(logs_dirs, n_workers=None):
+    """
+    Summarizes vina logs spread over several directories, e.g. one per docking tier.
+
+    Parameters
+    ----------
+    logs_dirs: list of (name, Path or archive.Folder) tuples
+        Log directories in order of preference, a molecule is summarized from the first
+        directory holding a complete log for it
+
+    n_workers: int (Optional)
+        Number of processes parsing logs, defaults to CPU count
+
+    Returns
+    -------
+    DataFrame of the 10 binding modes (columns of `get_vina_header`) and `uuid` of every
+    molecule, plus a `tier` column naming the source directory
+    """
+
+    tables, log_ids, tiers = [], [], []
+    seen = set()
+    for tier, logs_path in logs_dirs:
+        folder = logs_path if isinstance(logs_path, Folder) else Folder(logs_path)
+        logfiles = [
+            logfile
+            for logfile in folder.listdir()
+            if logfile != LOGS_SUMMARY_FILE and change_file_ext(logfile) not in seen
+        ]
+
+        table, parsed = parse_vina_logs(folder, logfiles, n_workers, n_modes=N_MODES)
+        ids = [change_file_ext(logfile) for logfile in np.array(logfiles)[parsed]]
+        tables.append(table[parsed])
+        log_ids += ids
+        tiers += [tier] * len(ids)
+        seen.update(ids)
+
+    logs_df = pd.DataFrame(
+        np.vstack(tables) if tables else np.empty((0, 3 * N_MODES)),
+        columns=get_vina_header(),
+    )
     logs_df["uuid"] = log_ids
-    logs_df.to_csv(logs_path / LOGS_SUMMARY_FILE)  # save
+    logs_df["tier"] = tiers
 
     return logs_df
 
 
+def update_tiered_logs_table(logs_dirs, summary_path, state_path, n_workers=None):
+    """
+    Brings a `generate_tiered_logs_table` summary saved at `summary_path` up to date,
+    parsing only the logs that are new or changed since it was written. Which version of
+    every log the summary holds is kept in `state_path`. Both files are replaced
+    atomically, so the summary can be updated periodically while docking is running.
+
+    Parameters
+    ----------
+    logs_dirs: list of (name, Path or archive.Folder) tuples
+        Log directories in order of preference, see `generate_tiered_logs_table`
+
+    summary_path: Path
+        Summary CSV, created if missing
+
+    state_path: Path
+        CSV of the (tier, logfile, signature, parsed) of every log behind the summary,
+        the summary is rebuilt if it is missing
+
+    n_workers: int (Optional)
+        Number of processes parsing logs, defaults to CPU count
+
+    Returns
+    -------
+    (summary DataFrame, number of logs parsed, whether the summary changed)
+    """
+
+    summary_path, state_path = Path(summary_path), Path(state_path)
+    folders = {
+        tier: path if isinstance(path, Folder) else Folder(path)
+        for tier, path in logs_dirs
+    }
+    ranks = {tier: rank for rank, tier in enumerate(folders)}
+    columns = list(get_vina_header())
+
+    logs = pd.DataFrame(
+        [
+            (tier, logfile, signature)
+            for tier, folder in folders.items()
+            for logfile, signature in folder.signatures().items()
+            if logfile != LOGS_SUMMARY_FILE
+        ],
+        columns=["tier", "logfile", "signature"],
+    )
+    if summary_path.is_file() and state_path.is_file():
+        summary = pd.read_csv(summary_path, index_col=0, dtype={"uuid": str})
+        state = pd.read_csv(state_path)
+    else:
+        summary = pd.DataFrame(columns=columns + ["uuid", "tier"])
+        state = pd.DataFrame(columns=["tier", "logfile", "signature", "parsed"])
+
+    logs = logs.merge(state, on=["tier", "logfile", "signature"], how="left")
+    stale = logs["parsed"].isna()
+    if not stale.any() and len(logs) == len(state):  # nothing new, changed or removed
+        return summary, 0, False
+
+    def parse(entries):
+        rows, parsed = [], []
+        for tier, group in entries.groupby("tier", sort=False):
+            table, ok = parse_vina_logs(
+                folders[tier], group["logfile"].tolist(), n_workers, n_modes=N_MODES
+            )
+            rows.append(
+                pd.DataFrame(table[ok], columns=columns).assign(
+                    uuid=group["logfile"][ok].map(change_file_ext).values, tier=tier
+                )
+            )
+            parsed.append(pd.Series(ok, index=group.index))
+
+        return pd.concat(rows), pd.concat(parsed)
+
+    fresh, parsed = parse(logs[stale]) if stale.any() else (summary.iloc[:0], None)
+    if parsed is not None:
+        logs.loc[parsed.index, "parsed"] = parsed
+    n_parsed = int(stale.sum())
+
+    # every molecule is summarized from its most preferred tier with a parsed log
+    logs["uuid"] = logs["logfile"].map(change_file_ext)
+    logs["rank"] = logs["tier"].map(ranks)
+    winners = (
+        logs[logs["parsed"].astype(bool)]
+        .sort_values(["rank", "logfile"], kind="stable")
+        .drop_duplicates("uuid")
+    )
+    known = pd.concat([df for df in (fresh, summary) if len(df)] or [summary])
+    known = known.drop_duplicates(["uuid", "tier"])
+    merged = winners[["uuid", "tier"]].merge(
+        known, on=["uuid", "tier"], how="left", indicator=True
+    )
+    # the summary held another tier of these molecules, e.g. their refined log was removed
+    missing = (merged["_merge"] == "left_only").values
+    if missing.any():
+        extra, _ = parse(winners[missing])
+        n_parsed += len(extra)
+        known = pd.concat([known, extra])
+        merged = winners[["uuid", "tier"]].merge(known, on=["uuid", "tier"], how="left")
+
+    logs_df = merged.reset_index(drop=True)[columns + ["uuid", "tier"]]
+    for path, table, index in (
+        (summary_path, logs_df, True),
+        (state_path, logs[["tier", "logfile", "signature", "parsed"]], False),
+    ):
+        tmp_path = path.with_name(f".{path.name}.tmp")
+        table.to_csv(tmp_path, index=index)
+        os.replace(tmp_path, path)
+
+    return logs_df, n_parsed, True
+
+
 # # CCR5 docking on generated
 # dock(
 #     ligand_folder_path=Path(
@@ -374,4 +685,4 @@ def generate_logs_table(logs_path):
 #     Path(
 #         "/Users/Munchic/Developer/Capstone/tinymolecule/data/pdb_out/ccr6_valid_45e/logs"
 #     )
-# )
\ No newline at end of file
+# )
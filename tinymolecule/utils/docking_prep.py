@@ -5,9 +5,11 @@ from pathlib import Path
 import numpy as np
 import pandas as pd
 
-from openbabel import openbabel
 import moses
 
+from tinymolecule.utils.ligand_prep import prepare_ligands
+
+
 PDBQT_DIR = Path("/Users/Munchic/Developer/Capstone/tinymolecule/data/pdb")
 SAMPLES_DIR = Path("/Users/Munchic/Developer/Capstone/tinymolecule/data/samples")
 GEN_DIR = Path("/Users/Munchic/Developer/Capstone/tinymolecule/data/gen")
@@ -55,29 +57,11 @@ def get_pdbqt(
     save_folder = molec_path.stem
     os.makedirs(save_dir / save_folder, exist_ok=True)  # "valid_sample_1e5"
 
-    for i in valid_samples.index:
-        print(
-            f"converting molecule {valid_samples['uuid'][i]} ({i + 1}/{len(valid_samples)})"
-        )
-
-        # write temporary SMILES
-        molec = valid_samples["SMILES"][i]
-        uuid = valid_samples["uuid"][i]
-        temp_file = save_dir / save_folder / f"temp_{uuid}.smi"  # "valid_sample_1e5"
-        with open(temp_file, "w") as temp:
-            temp.write(molec)
-
-        # TODO: openbabel conversion settings, use FullConvert might be faster
-        conv = openbabel.OBConversion()
-        conv.SetInAndOutFormats("smi", "pdbqt")
-        conv.AddOption("gen3d", conv.GENOPTIONS)
-        conv.AddOption("h", conv.GENOPTIONS)
-
-        # convert temporary SMILES to PDBQT format
-        pdbqt_file = save_dir / save_folder / f"{uuid}.pdbqt"  # "valid_sample_1e5"
-        conv.OpenInAndOutFiles(str(temp_file), str(pdbqt_file))
-        conv.Convert()
-        os.remove(temp_file)
+    molecules = zip(valid_samples["uuid"], valid_samples["SMILES"])
+    for i, result in enumerate(
+        prepare_ligands(molecules, save_dir / save_folder)  # "valid_sample_1e5"
+    ):
+        print(f"converting molecule {result.uuid} ({i + 1}/{len(valid_samples)})")
 
 
 # # get valid generated molecules
@@ -88,4 +72,4 @@ def get_pdbqt(
 filter_valid(
     samples_path="/Users/Munchic/Developer/Capstone/tinymolecule/data/ccr5_train.csv",
 )
-get_pdbqt(molec_path=GEN_DIR / "ccr5_train.csv")
\ No newline at end of file
+get_pdbqt(molec_path=GEN_DIR / "ccr5_train.csv")
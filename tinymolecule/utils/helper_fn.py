@@ -1,8 +1,8 @@
 import os
 import uuid
 import shlex
+import shutil
 import subprocess
-import random
 
 import pandas as pd
 
@@ -17,18 +17,38 @@ def change_file_ext(filename, ext=None):
 
 
 def hash_smiles(smiles, hash_crop=8, hash_seed=42):
-    rd = random.Random()
-    rd.seed(hash_seed)
-    namespace = uuid.NAMESPACE_URL
+    # `hash_seed` is ignored, uuid5 needs no seed, and only kept for existing callers
     hash_val = uuid.uuid5(uuid.NAMESPACE_URL, name=smiles)
     cropped_hash_val = str(hash_val)[:hash_crop]
 
     return cropped_hash_val
 
 
-def shell_command(command):
-    FNULL = open(os.devnull, "w")
-    subprocess.check_call(shlex.split(command), stdout=FNULL, stderr=subprocess.STDOUT)
+def replace_dir(new_dir, dest_dir):
+    """
+    Swaps a fully written `new_dir` in for `dest_dir`. The old directory is moved aside
+    rather than deleted first, so `dest_dir` always holds a complete copy apart from the
+    instant between the two renames, and a crash never leaves neither.
+    """
+
+    new_dir, dest_dir = str(new_dir), str(dest_dir)
+    old_dir = os.path.join(
+        os.path.dirname(dest_dir), f".{os.path.basename(dest_dir)}.old"
+    )
+    shutil.rmtree(old_dir, ignore_errors=True)
+    if os.path.exists(dest_dir):
+        os.rename(dest_dir, old_dir)
+    os.rename(new_dir, dest_dir)
+    shutil.rmtree(old_dir, ignore_errors=True)
+
+
+def shell_command(command, timeout=None):
+    subprocess.check_call(
+        shlex.split(command),
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.STDOUT,
+        timeout=timeout,
+    )
 
 
 def get_smiles_from_id(logs_path, samples_path):
@@ -48,4 +68,4 @@ def get_mean_baff_df(logs, prefix=""):
     mean_baff.rename(f"{prefix}avg_affin_kcal_mol-1", inplace=True)
     mean_baff_df = pd.concat([logs["uuid"], mean_baff], axis=1)
 
-    return mean_baff_df
\ No newline at end of file
+    return mean_baff_df
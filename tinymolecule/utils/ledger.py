@@ -0,0 +1,453 @@
+import os
+import time
+import zlib
+import socket
+import hashlib
+import sqlite3
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterable, List, Optional, Sequence, Tuple, Union
+
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+SKIPPED = "skipped"  # not selected for a queue docked on a selection, see restrict
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS ligands (
+    id INTEGER PRIMARY KEY,
+    ligand TEXT UNIQUE NOT NULL
+);
+CREATE TABLE IF NOT EXISTS queues (
+    target TEXT NOT NULL,
+    params TEXT NOT NULL,
+    last_ligand_id INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (target, params)
+);
+CREATE TABLE IF NOT EXISTS jobs (
+    ligand TEXT NOT NULL,
+    target TEXT NOT NULL,
+    params TEXT NOT NULL,
+    state TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    exit_code INTEGER,
+    duration REAL,
+    updated REAL,
+    error TEXT,
+    worker TEXT,
+    lease_until REAL,
+    PRIMARY KEY (ligand, target, params)
+);
+CREATE INDEX IF NOT EXISTS jobs_by_state ON jobs (target, params, state);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+# columns added to `jobs` after the first ledger release, see JobLedger._migrate
+_ADDED_COLUMNS = {"error": "TEXT", "worker": "TEXT", "lease_until": "REAL"}
+
+
+def job_params(config_path: Union[str, Path], receptor_path: Union[str, Path], *extra):
+    """
+    Short hash identifying docking settings: vina config contents, receptor and any extra vina arguments.
+    """
+
+    digest = hashlib.sha1()
+    digest.update(Path(config_path).read_bytes())
+    digest.update(str(Path(receptor_path).name).encode())
+    for arg in extra:
+        digest.update(str(arg).encode())
+
+    return digest.hexdigest()[:12]
+
+
+def parse_shard(shard: str) -> Tuple[int, int]:
+    """
+    Parses a "i/n" shard specification into (i, n) with 0 <= i < n.
+    """
+
+    try:
+        index, count = (int(part) for part in shard.split("/"))
+    except ValueError:
+        raise ValueError(f"shard must look like 'i/n', got {shard!r}")
+    if not 0 <= index < count:
+        raise ValueError(f"shard index must be in [0, {count}), got {index}")
+
+    return index, count
+
+
+def in_shard(ligand: str, index: int, count: int) -> bool:
+    """
+    Deterministic hash-based assignment of a ligand to one of `count` shards.
+    """
+
+    return zlib.crc32(ligand.encode()) % count == index
+
+
+def default_worker_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class JobLedger:
+    """
+    Persistent SQLite record of every (ligand, target, params) docking job.
+
+    Tracks each job's state (pending, running, done, failed, skipped), attempt count,
+    vina exit code and duration, so an interrupted run resumes from the pending jobs
+    alone instead of listing output directories.
+
+    Running jobs are leased to a worker (host:pid) until `lease_until`, and a heartbeat
+    thread keeps extending the leases while the worker is alive. Jobs of a crashed
+    worker become claimable again once their lease expires, which lets several
+    processes on different hosts share one ledger file on a shared filesystem.
+    """
+
+    def __init__(
+        self,
+        db_path: Union[str, Path],
+        max_attempts: int = 3,
+        lease_seconds: float = 600,
+        worker: Optional[str] = None,
+    ):
+        self.db_path = Path(db_path)
+        self.max_attempts = max_attempts
+        self.lease_seconds = lease_seconds
+        self.worker = worker or default_worker_id()
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+
+        self.conn = self._connect()
+        with self.conn:
+            self.conn.executescript(_SCHEMA)
+            self._migrate()
+
+        self._heartbeat = None
+        self._heartbeat_stop = threading.Event()
+
+    def _connect(self):
+        conn = sqlite3.connect(str(self.db_path), timeout=60)
+        conn.execute("PRAGMA synchronous = NORMAL")
+
+        return conn
+
+    def _migrate(self):
+        """
+        Adds columns introduced after a ledger file was created.
+        """
+
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(jobs)")}
+        for column, column_type in _ADDED_COLUMNS.items():
+            if column not in columns:
+                self.conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} {column_type}")
+
+    @contextmanager
+    def _write_lock(self):
+        """
+        Transaction holding the database write lock from its first statement on,
+        so no other process can claim the same rows in between.
+        """
+
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+        except BaseException:
+            self.conn.rollback()
+            raise
+        self.conn.commit()
+
+    def close(self):
+        self.stop_heartbeat()
+        self.conn.close()
+
+    def n_ligands(self) -> int:
+        return self.conn.execute("SELECT COUNT(*) FROM ligands").fetchone()[0]
+
+    def ligands(self) -> List[str]:
+        return [row[0] for row in self.conn.execute("SELECT ligand FROM ligands")]
+
+    def get_meta(self, key: str) -> Optional[str]:
+        row = self.conn.execute(
+            "SELECT value FROM meta WHERE key = ?", (key,)
+        ).fetchone()
+        return None if row is None else row[0]
+
+    def set_meta(self, key: str, value: str):
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value)
+            )
+
+    def add_ligands(self, ligands: Iterable[str]):
+        """
+        Registers ligand files (e.g. "ec0fdc31.pdbqt") that can be docked, ignoring known ones.
+        """
+
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO ligands (ligand) VALUES (?)",
+                ((lig,) for lig in ligands),
+            )
+
+    def enqueue(self, target: str, params: str) -> bool:
+        """
+        Adds a pending job for every ligand registered since the last call for this target and params.
+
+        Returns True if the (target, params) queue did not exist before.
+        """
+
+        with self._write_lock():
+            row = self.conn.execute(
+                "SELECT last_ligand_id FROM queues WHERE target = ? AND params = ?",
+                (target, params),
+            ).fetchone()
+            is_new = row is None
+            last_id = 0 if is_new else row[0]
+
+            self.conn.execute(
+                "INSERT OR IGNORE INTO jobs (ligand, target, params) "
+                + "SELECT ligand, ?, ? FROM ligands WHERE id > ?",
+                (target, params, last_id),
+            )
+            self.conn.execute(
+                "INSERT OR REPLACE INTO queues (target, params, last_ligand_id) "
+                + "VALUES (?, ?, (SELECT COALESCE(MAX(id), 0) FROM ligands))",
+                (target, params),
+            )
+
+        return is_new
+
+    def pending(
+        self,
+        target: str,
+        params: str,
+        shard: Optional[str] = None,
+        among: Optional[Sequence[str]] = None,
+    ) -> List[str]:
+        """
+        Ligands still to dock: pending jobs plus failed jobs with attempts left,
+        optionally only those falling into shard "i/n" or listed in `among`.
+        """
+
+        query = (
+            "SELECT ligand FROM jobs WHERE target = ? AND params = ? "
+            + "AND (state = ? OR (state = ? AND attempts < ?))"
+        )
+        args = (target, params, PENDING, FAILED, self.max_attempts)
+        if among is None:
+            ligands = [row[0] for row in self.conn.execute(query, args)]
+        else:
+            ligands = []
+            for i in range(0, len(among), 500):  # SQLite caps parameters per query
+                batch = among[i : i + 500]
+                rows = self.conn.execute(
+                    query + f" AND ligand IN ({', '.join('?' * len(batch))})",
+                    args + tuple(batch),
+                )
+                ligands += [row[0] for row in rows]
+
+        if shard is not None:
+            index, count = parse_shard(shard)
+            ligands = [lig for lig in ligands if in_shard(lig, index, count)]
+
+        return ligands
+
+    def claim(
+        self, queues: Sequence[Tuple[str, str]], n: int
+    ) -> List[Tuple[str, str, str]]:
+        """
+        Atomically leases up to `n` claimable jobs of the given (target, params) queues
+        to this worker. Claimable are pending jobs, failed jobs with attempts left and
+        running jobs whose lease has expired.
+
+        Returns (ligand, target, params) of the claimed jobs, an empty list once no work is left.
+        """
+
+        if not queues:
+            return []
+
+        now = time.time()
+        queue_filter = " OR ".join(["(target = ? AND params = ?)"] * len(queues))
+        queue_args = tuple(arg for queue in queues for arg in queue)
+
+        with self._write_lock():
+            claimed = self.conn.execute(
+                f"SELECT ligand, target, params FROM jobs WHERE ({queue_filter}) AND ("
+                + "state = ? OR (state = ? AND attempts < ?) "
+                + "OR (state = ? AND lease_until < ?)) LIMIT ?",
+                queue_args + (PENDING, FAILED, self.max_attempts, RUNNING, now, n),
+            ).fetchall()
+            self.conn.executemany(
+                "UPDATE jobs SET state = ?, attempts = attempts + 1, updated = ?, "
+                + "worker = ?, lease_until = ? "
+                + "WHERE ligand = ? AND target = ? AND params = ?",
+                (
+                    (RUNNING, now, self.worker, now + self.lease_seconds) + job
+                    for job in claimed
+                ),
+            )
+
+        return claimed
+
+    def renew_leases(self, conn=None):
+        """
+        Extends the leases of every job this worker is running.
+        """
+
+        conn = conn or self.conn
+        with conn:
+            conn.execute(
+                "UPDATE jobs SET lease_until = ? WHERE worker = ? AND state = ?",
+                (time.time() + self.lease_seconds, self.worker, RUNNING),
+            )
+
+    def start_heartbeat(self):
+        """
+        Renews this worker's leases from a background thread every third of the lease time.
+        """
+
+        if self._heartbeat is not None:
+            return
+
+        def beat():
+            conn = self._connect()  # sqlite connections can't cross threads
+            while not self._heartbeat_stop.wait(self.lease_seconds / 3):
+                try:
+                    self.renew_leases(conn)
+                except sqlite3.OperationalError:  # database busy, retry next beat
+                    pass
+            conn.close()
+
+        self._heartbeat_stop.clear()
+        self._heartbeat = threading.Thread(target=beat, daemon=True)
+        self._heartbeat.start()
+
+    def stop_heartbeat(self):
+        if self._heartbeat is not None:
+            self._heartbeat_stop.set()
+            self._heartbeat.join()
+            self._heartbeat = None
+
+    def requeue(self, target: str, params: str):
+        """
+        Marks every job of a target as pending again with a fresh attempt budget.
+        """
+
+        with self.conn:
+            self.conn.execute(
+                "UPDATE jobs SET state = ?, attempts = 0 WHERE target = ? AND params = ?",
+                (PENDING, target, params),
+            )
+
+    def reset_stale(self):
+        """
+        Returns jobs left running by a crashed or killed worker (expired lease) to the pending state.
+        """
+
+        with self.conn:
+            self.conn.execute(
+                "UPDATE jobs SET state = ?, worker = NULL, lease_until = NULL "
+                + "WHERE state = ? AND (lease_until IS NULL OR lease_until < ?)",
+                (PENDING, RUNNING, time.time()),
+            )
+
+    def restrict(self, target: str, params: str, ligands: Iterable[str]):
+        """
+        Limits the jobs left to run in a queue to the given ligands, for queues only docked
+        on a selection, e.g. the refine tier. Pending jobs of other ligands are skipped,
+        skipped jobs of the given ones (from an earlier selection) are pending again.
+        """
+
+        with self._write_lock():
+            self.conn.execute(
+                "UPDATE jobs SET state = ? WHERE target = ? AND params = ? AND state = ?",
+                (SKIPPED, target, params, PENDING),
+            )
+            self.conn.executemany(
+                "UPDATE jobs SET state = ? "
+                + "WHERE ligand = ? AND target = ? AND params = ? AND state = ?",
+                ((PENDING, lig, target, params, SKIPPED) for lig in ligands),
+            )
+
+    def mark_done(self, target: str, params: str, ligands: Iterable[str]):
+        """
+        Records jobs as done without running them, e.g. when importing existing outputs.
+        """
+
+        with self.conn:
+            self.conn.executemany(
+                "UPDATE jobs SET state = ?, updated = ? "
+                + "WHERE ligand = ? AND target = ? AND params = ?",
+                ((DONE, time.time(), lig, target, params) for lig in ligands),
+            )
+
+    def mark_running(self, jobs: Iterable):
+        """
+        Leases jobs picked without `claim` to this worker.
+        """
+
+        now = time.time()
+        with self.conn:
+            self.conn.executemany(
+                "UPDATE jobs SET state = ?, attempts = attempts + 1, updated = ?, "
+                + "worker = ?, lease_until = ? "
+                + "WHERE ligand = ? AND target = ? AND params = ?",
+                (
+                    (RUNNING, now, self.worker, now + self.lease_seconds)
+                    + (j.ligand, j.target, j.params)
+                    for j in jobs
+                ),
+            )
+
+    def mark_finished(self, result):
+        """
+        Records the outcome of a finished job from its JobResult.
+        """
+
+        job = result.job
+        state = DONE if result.exit_code == 0 else FAILED
+        with self.conn:
+            self.conn.execute(
+                "UPDATE jobs SET state = ?, exit_code = ?, duration = ?, updated = ?, "
+                + "error = ?, lease_until = NULL "
+                + "WHERE ligand = ? AND target = ? AND params = ?",
+                (
+                    state,
+                    result.exit_code,
+                    result.duration,
+                    time.time(),
+                    result.error or None,
+                    job.ligand,
+                    job.target,
+                    job.params,
+                ),
+            )
+
+    def failures(self, target: str = None) -> List[tuple]:
+        """
+        (ligand, target, attempts, exit code, error output) of every failed job.
+        """
+
+        query = "SELECT ligand, target, attempts, exit_code, error FROM jobs WHERE state = ?"
+        args = (FAILED,)
+        if target is not None:
+            query += " AND target = ?"
+            args += (target,)
+
+        return self.conn.execute(query, args).fetchall()
+
+    def counts(self, target: str = None) -> dict:
+        """
+        Number of jobs in each state, optionally for one target only.
+        """
+
+        query = "SELECT state, COUNT(*) FROM jobs"
+        args = ()
+        if target is not None:
+            query += " WHERE target = ?"
+            args = (target,)
+
+        return dict(self.conn.execute(query + " GROUP BY state", args).fetchall())
@@ -0,0 +1,205 @@
+import os
+import json
+import shutil
+from pathlib import Path
+from typing import List, Optional, Sequence, Union
+
+import numpy as np
+import pandas as pd
+
+from tinymolecule.utils.helper_fn import replace_dir
+from tinymolecule.utils.molecules import (
+    PROPERTY_NAMES,
+    molecular_properties,
+    molecule_is_valid,
+)
+
+
+UUIDS_FILE = "uuids.npy"  # ligand IDs, sorted
+SMILES_FILE = "smiles.bin"  # SMILES of every ligand in ID order, utf-8, concatenated
+OFFSETS_FILE = "offsets.npy"  # start of every SMILES in the blob, plus its end
+PROPERTIES_FILE = "properties.npy"  # float64 (ligands, properties), computed on demand
+COMPUTED_FILE = "computed.npy"  # which ligands' properties were computed
+META_FILE = "meta.json"  # version of the ligand table the index was built from
+
+
+def _positions(sorted_uuids: np.ndarray, uuids: Sequence[str]) -> np.ndarray:
+    uuids = np.asarray(uuids, dtype=str)
+    if not len(sorted_uuids):
+        return np.full(len(uuids), -1, dtype=np.int64)
+
+    rows = np.searchsorted(sorted_uuids, uuids)
+    rows[rows == len(sorted_uuids)] = 0
+    found = sorted_uuids[rows] == uuids
+
+    return np.where(found, rows, -1)
+
+
+def _read_smiles(
+    blob: np.ndarray, offsets: np.ndarray, rows: np.ndarray
+) -> List[Optional[str]]:
+    starts, ends = offsets[rows], offsets[rows + 1]
+
+    return [
+        blob[start:end].tobytes().decode() if row >= 0 else None
+        for row, start, end in zip(rows, starts, ends)
+    ]
+
+
+class LigandIndex:
+    """
+    Persistent ID index of a ligand table (e.g. `gen.csv`): the IDs sorted for binary
+    search, the SMILES of every ID in one blob, and molecular properties (see
+    `molecules.molecular_properties`) calculated the first time they are asked for.
+
+    The index is built on first use, rebuilt when the table changes, and opened as
+    memory maps, so any number of IDs is looked up in one vectorized pass without
+    reading the table. Rows sharing an ID (spellings of one molecule) keep the first.
+    """
+
+    def __init__(self, csv_path: Union[str, Path], index_dir: Union[str, Path]):
+        self.csv_path = Path(csv_path)
+        self.index_dir = Path(index_dir)
+        self._version = None
+
+    def _table_version(self) -> dict:
+        stat = os.stat(self.csv_path)
+        return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+    def _open(self):
+        """
+        (Re)loads the index if the table changed since it was last opened, building it
+        if needed.
+        """
+
+        version = self._table_version()
+        if version == self._version:
+            return
+
+        meta_path = self.index_dir / META_FILE
+        built = None
+        if meta_path.is_file():
+            with open(meta_path) as meta_file:
+                built = json.load(meta_file)["table"]
+        if built != version:
+            build_ligand_index(self.csv_path, self.index_dir)
+
+        self.uuids = np.load(self.index_dir / UUIDS_FILE, mmap_mode="r")
+        self._offsets = np.load(self.index_dir / OFFSETS_FILE, mmap_mode="r")
+        smiles_path = self.index_dir / SMILES_FILE
+        self._smiles = (
+            np.memmap(smiles_path, dtype=np.uint8, mode="r")
+            if smiles_path.stat().st_size
+            else np.empty(0, np.uint8)  # mmap can't map an empty file
+        )
+        self._version = version
+
+    def __len__(self) -> int:
+        self._open()
+        return len(self.uuids)
+
+    def positions(self, uuids: Sequence[str]) -> np.ndarray:
+        """
+        Index rows of the given IDs, found by binary search, -1 for unknown ones.
+        """
+
+        self._open()
+        return _positions(self.uuids, uuids)
+
+    def __contains__(self, uuid: str) -> bool:
+        return self.positions([uuid])[0] >= 0
+
+    def smiles(self, uuids: Sequence[str]) -> List[Optional[str]]:
+        """
+        SMILES of every ID, None for unknown ones.
+        """
+
+        rows = self.positions(uuids)
+        return _read_smiles(self._smiles, self._offsets, rows)
+
+    def properties(
+        self, uuids: Sequence[str], names: Sequence[str] = PROPERTY_NAMES
+    ) -> pd.DataFrame:
+        """
+        Molecular properties of every ID, in their order, NaN for unknown IDs and
+        invalid SMILES. Properties not calculated before are calculated and kept.
+        """
+
+        rows = self.positions(uuids)
+        columns = [PROPERTY_NAMES.index(name) for name in names]
+        known = rows[rows >= 0]
+
+        computed = np.load(self.index_dir / COMPUTED_FILE, mmap_mode="r")
+        missing = np.unique(known[~computed[known]])
+        if len(missing):
+            self._compute_properties(missing)
+
+        table = np.full((len(rows), len(columns)), np.nan)
+        stored = np.load(self.index_dir / PROPERTIES_FILE, mmap_mode="r")
+        table[rows >= 0] = stored[known][:, columns]
+
+        return pd.DataFrame(table, columns=list(names))
+
+    def _compute_properties(self, rows: np.ndarray):
+        stored = np.load(self.index_dir / PROPERTIES_FILE, mmap_mode="r+")
+        computed = np.load(self.index_dir / COMPUTED_FILE, mmap_mode="r+")
+        for row, smi in zip(rows, self.smiles(self.uuids[rows])):
+            if molecule_is_valid(smi):
+                props = molecular_properties(smi)
+                stored[row] = [float(props[name]) for name in PROPERTY_NAMES]
+            computed[row] = True
+        stored.flush()
+        computed.flush()
+
+
+def build_ligand_index(csv_path: Union[str, Path], index_dir: Union[str, Path]):
+    """
+    Builds the index of a ligand table with `uuid` and `SMILES` columns (see
+    `LigandIndex`), replacing an existing one. Properties already calculated for a
+    molecule with the same ID and SMILES are carried over.
+    """
+
+    csv_path, index_dir = Path(csv_path), Path(index_dir)
+    version = os.stat(csv_path)
+    ligands_df = (
+        pd.read_csv(csv_path, usecols=["uuid", "SMILES"], dtype=str)
+        .dropna(subset=["uuid"])
+        .drop_duplicates("uuid")
+        .sort_values("uuid", kind="stable")
+    )
+    uuids = ligands_df["uuid"].to_numpy(dtype=str)
+    encoded = [smi.encode() for smi in ligands_df["SMILES"].fillna("")]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(smi) for smi in encoded], out=offsets[1:])
+
+    properties = np.full((len(uuids), len(PROPERTY_NAMES)), np.nan)
+    computed = np.zeros(len(uuids), dtype=bool)
+    if (index_dir / META_FILE).is_file():
+        rows = _positions(np.load(index_dir / UUIDS_FILE), uuids)
+        old_smiles = _read_smiles(
+            np.fromfile(index_dir / SMILES_FILE, dtype=np.uint8),
+            np.load(index_dir / OFFSETS_FILE),
+            rows,
+        )
+        same = np.array(
+            [smi.decode() == old for smi, old in zip(encoded, old_smiles)], dtype=bool
+        )
+        properties[same] = np.load(index_dir / PROPERTIES_FILE)[rows[same]]
+        computed[same] = np.load(index_dir / COMPUTED_FILE)[rows[same]]
+
+    tmp_dir = index_dir.with_name(f".{index_dir.name}.tmp")
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    tmp_dir.mkdir(parents=True)
+    np.save(tmp_dir / UUIDS_FILE, uuids)
+    np.save(tmp_dir / OFFSETS_FILE, offsets)
+    with open(tmp_dir / SMILES_FILE, "wb") as smiles_file:
+        smiles_file.write(b"".join(encoded))
+    np.save(tmp_dir / PROPERTIES_FILE, properties)
+    np.save(tmp_dir / COMPUTED_FILE, computed)
+    with open(tmp_dir / META_FILE, "w") as meta_file:
+        json.dump(
+            {"table": {"size": version.st_size, "mtime_ns": version.st_mtime_ns}},
+            meta_file,
+        )
+
+    replace_dir(tmp_dir, index_dir)
@@ -0,0 +1,291 @@
+import os
+import time
+from collections import deque
+from itertools import islice
+from pathlib import Path
+from typing import Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+import pandas as pd
+from openbabel import openbabel
+from rdkit import Chem, rdBase
+from rdkit.Chem import AllChem
+
+from tinymolecule.utils.scheduler import threadsafe_context
+
+
+class PrepResult(NamedTuple):
+    """
+    Outcome of preparing one molecule: an empty `error` means its PDBQT file was written.
+    """
+
+    uuid: str
+    smiles: str
+    error: str = ""
+    duration: float = 0.0  # seconds spent converting and writing the molecule
+    write_time: float = 0.0  # part of `duration` spent writing its PDBQT file
+
+
+def pdbqt_error(pdbqt: str) -> str:
+    """
+    Reason a converted PDBQT can't be docked, or an empty string if it looks fine.
+    """
+
+    coords = [
+        line[30:54].split()
+        for line in pdbqt.splitlines()
+        if line.startswith(("ATOM", "HETATM"))
+    ]
+    if not coords:
+        return "no atoms written"
+    # openbabel leaves every atom at the origin when 3D embedding fails
+    if len(coords) > 1 and all(float(c) == 0.0 for xyz in coords for c in xyz):
+        return "3D embedding failed"
+
+    return ""
+
+
+ENGINES = ("openbabel", "rdkit")
+OPENBABEL_OPTIONS = ("gen3d", "h")  # 3D coordinates, explicit hydrogens
+RDKIT_SEED = 42  # reproducible ETKDG embeddings
+
+# per worker process and input format, configured once and reused for every molecule
+_CONVERTERS = {}
+
+
+def _get_converter(in_format: str = "smi"):
+    """
+    openbabel converter to PDBQT: from SMILES with 3D generation, or from a 3D mol block as is.
+    """
+
+    if in_format not in _CONVERTERS:
+        conv = openbabel.OBConversion()
+        conv.SetInAndOutFormats(in_format, "pdbqt")
+        if in_format == "smi":
+            for option in OPENBABEL_OPTIONS:
+                conv.AddOption(option, conv.GENOPTIONS)
+        _CONVERTERS[in_format] = conv
+
+    return _CONVERTERS[in_format]
+
+
+def conversion_settings(engine: str = "openbabel", n_confs: int = 10) -> dict:
+    """
+    Everything that determines a prepared PDBQT besides the molecule itself.
+    """
+
+    if engine == "openbabel":
+        return {
+            "engine": "openbabel",
+            "version": openbabel.OBReleaseVersion(),
+            "options": list(OPENBABEL_OPTIONS),
+        }
+    if engine == "rdkit":
+        return {
+            "engine": "rdkit",
+            "version": rdBase.rdkitVersion,
+            "embedding": "ETKDGv3",
+            "force_field": "MMFF94, UFF fallback",
+            "n_confs": n_confs,
+            "seed": RDKIT_SEED,
+            "pdbqt_writer": openbabel.OBReleaseVersion(),
+        }
+
+    raise ValueError(f"unknown prep engine: {engine}, choose from {ENGINES}")
+
+
+def openbabel_pdbqt(smiles: str) -> Tuple[str, str]:
+    """
+    Converts a SMILES string to 3D PDBQT text with openbabel (gen3d, hydrogens added),
+    entirely in memory.
+
+    Returns (PDBQT text, error), the error being empty on success.
+    """
+
+    conv = _get_converter("smi")
+    mol = openbabel.OBMol()
+    if not conv.ReadString(mol, smiles):
+        return "", "openbabel could not parse the SMILES"
+
+    # unlike Convert, ReadString doesn't apply the general options (gen3d, h)
+    mol.DoTransformations(conv.GetOptions(conv.GENOPTIONS), conv)
+    pdbqt = conv.WriteString(mol)
+
+    return pdbqt, pdbqt_error(pdbqt)
+
+
+def rdkit_pdbqt(smiles: str, n_confs: int = 10, n_threads: int = 1) -> Tuple[str, str]:
+    """
+    Embeds `n_confs` conformers with RDKit ETKDG, minimizes them with MMFF94 (UFF if MMFF
+    lacks parameters), both on `n_threads` threads, and writes the lowest-energy one as PDBQT
+    with its torsion tree via openbabel.
+
+    Returns (PDBQT text, error), the error being empty on success.
+    """
+
+    mol = Chem.MolFromSmiles(smiles)
+    if mol is None:
+        return "", "RDKit could not parse the SMILES"
+    mol = Chem.AddHs(mol)
+
+    params = AllChem.ETKDGv3()
+    params.randomSeed = RDKIT_SEED
+    params.numThreads = n_threads
+    conf_ids = list(AllChem.EmbedMultipleConfs(mol, n_confs, params))
+    if not conf_ids:
+        return "", "3D embedding failed"
+
+    if AllChem.MMFFHasAllMoleculeParams(mol):
+        energies = AllChem.MMFFOptimizeMoleculeConfs(mol, numThreads=n_threads)
+    else:
+        energies = AllChem.UFFOptimizeMoleculeConfs(mol, numThreads=n_threads)
+    best = min(range(len(conf_ids)), key=lambda i: energies[i][1])
+
+    conv = _get_converter("mol")
+    ob_mol = openbabel.OBMol()
+    conv.ReadString(ob_mol, Chem.MolToMolBlock(mol, confId=conf_ids[best]))
+    pdbqt = conv.WriteString(ob_mol)
+
+    return pdbqt, pdbqt_error(pdbqt)
+
+
+def smiles_to_pdbqt(
+    smiles: str, engine: str = "openbabel", n_confs: int = 10, n_threads: int = 1
+) -> Tuple[str, str]:
+    """
+    Converts a SMILES string to 3D PDBQT text with the chosen engine, see
+    `openbabel_pdbqt` and `rdkit_pdbqt`.
+    """
+
+    if engine == "rdkit":
+        return rdkit_pdbqt(smiles, n_confs, n_threads)
+
+    return openbabel_pdbqt(smiles)
+
+
+def prepare_chunk(
+    molecules: List[Tuple[str, str]],
+    out_dir: Path,
+    engine: str = "openbabel",
+    n_confs: int = 10,
+    n_threads: int = 1,
+) -> List[PrepResult]:
+    """
+    Converts a chunk of (uuid, SMILES) molecules, then writes the PDBQT files of all
+    successful ones to `out_dir`/<uuid>.pdbqt in one pass.
+    """
+
+    results, outputs = [], []
+    for uuid, smiles in molecules:
+        start = time.time()
+        try:
+            pdbqt, error = smiles_to_pdbqt(smiles, engine, n_confs, n_threads)
+        except Exception as e:
+            pdbqt, error = "", f"{type(e).__name__}: {e}"
+        results.append(PrepResult(uuid, smiles, error, time.time() - start))
+        if not error:
+            outputs.append((len(results) - 1, out_dir / f"{uuid}.pdbqt", pdbqt))
+
+    for i, pdbqt_file, pdbqt in outputs:
+        start = time.time()
+        # replace rather than overwrite: the old file may be hard linked into the prep cache
+        tmp_file = pdbqt_file.with_name(f".{pdbqt_file.name}.tmp")
+        with open(tmp_file, "w") as out:
+            out.write(pdbqt)
+        os.replace(tmp_file, pdbqt_file)
+        write_time = time.time() - start
+        results[i] = results[i]._replace(
+            duration=results[i].duration + write_time, write_time=write_time
+        )
+
+    return results
+
+
+def _prepare_chunk(args):
+    return prepare_chunk(*args)
+
+
+def _chunks(items: Iterable, size: int) -> Iterator[list]:
+    items = iter(items)
+    while True:
+        chunk = list(islice(items, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def prepare_ligands(
+    molecules: Iterable[Tuple[str, str]],
+    out_dir: Path,
+    n_workers: Optional[int] = None,
+    chunksize: int = 16,
+    engine: str = "openbabel",
+    n_confs: int = 10,
+) -> Iterator[PrepResult]:
+    """
+    Converts molecules to PDBQT files on a pool of worker processes.
+
+    Parameters
+    ----------
+    molecules: iterable of (uuid, SMILES) tuples
+        Molecules to prepare, each written to `out_dir`/<uuid>.pdbqt, read as workers
+        become free
+
+    out_dir: Path
+        Directory of the prepared ligands
+
+    n_workers: int (Optional)
+        Number of worker processes, defaults to CPU count
+
+    chunksize: int (Optional)
+        Molecules converted by a worker before it writes their files and reports back
+
+    engine: string, ["openbabel", "rdkit"] (Optional)
+        openbabel gen3d, or RDKit ETKDG embedding with force field cleanup whose threads
+        share the CPUs left over by the worker processes
+
+    n_confs: int (Optional)
+        rdkit engine: conformers embedded per molecule, the lowest-energy one is kept
+
+    Yields
+    ------
+    PrepResult for every molecule, in input order
+    """
+
+    out_dir = Path(out_dir)
+    if engine not in ENGINES:
+        raise ValueError(f"unknown prep engine: {engine}, choose from {ENGINES}")
+
+    n_workers = n_workers or os.cpu_count() or 1
+    n_threads = max(1, (os.cpu_count() or 1) // n_workers)
+    chunks = (
+        (chunk, out_dir, engine, n_confs, n_threads)
+        for chunk in _chunks(molecules, chunksize)
+    )
+
+    if n_workers <= 1:
+        for chunk in chunks:
+            yield from _prepare_chunk(chunk)
+        return
+
+    # chunks are handed out as results are taken, so a slow consumer holds back
+    # the conversion instead of piling up converted molecules. The pool may be started
+    # from a thread (`prepare_and_dock`), so workers aren't forked.
+    with threadsafe_context().Pool(processes=n_workers) as pool:
+        pending = deque()
+        for chunk in chunks:
+            pending.append(pool.apply_async(_prepare_chunk, (chunk,)))
+            if len(pending) >= 2 * n_workers:
+                yield from pending.popleft().get()
+        while pending:
+            yield from pending.popleft().get()
+
+
+def failures_table(results: List[PrepResult]) -> pd.DataFrame:
+    """
+    Molecules that could not be prepared, with the reason.
+    """
+
+    return pd.DataFrame(
+        [(r.uuid, r.smiles, r.error) for r in results if r.error],
+        columns=["uuid", "SMILES", "error"],
+    )
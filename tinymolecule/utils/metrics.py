@@ -0,0 +1,309 @@
+import os
+import json
+import time
+import socket
+import threading
+from collections import Counter, deque
+from pathlib import Path
+from typing import Optional, Union
+
+import numpy as np
+
+from tinymolecule.utils.ligand_prep import PrepResult
+from tinymolecule.utils.scheduler import JobResult
+
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+class DockingMetrics:
+    """
+    Structured instrumentation of docking runs.
+
+    Every finished job is appended as one JSON line to `records_path` (queue wait,
+    ligand staging time, vina wall time, output write time where it is known, exit
+    code), and so is every molecule converted to PDBQT (`"stage": "prep"`, conversion
+    and write time, error) and every chunk of outputs moved into an archive
+    (`"stage": "archive"`). Rolling aggregates
+    over the last `window_seconds` (ligands/hour, latency quantiles) and cumulative job
+    and failure counts by exit code are written every `interval` seconds to
+    `prometheus_path` in the Prometheus textfile format, e.g. for the node exporter's
+    textfile collector. Both file names and every series carry the host, so hosts
+    sharing a path don't write to each other's files.
+    """
+
+    def __init__(
+        self,
+        records_path: Union[str, Path],
+        prometheus_path: Optional[Union[str, Path]] = None,
+        interval: float = 30.0,
+        window_seconds: float = 600.0,
+        host: Optional[str] = None,
+    ):
+        self.host = host or socket.gethostname()
+        # e.g. metrics.node1.jsonl
+        self.records_path = self._host_path(records_path)
+        self.prometheus_path = None
+        if prometheus_path:
+            # e.g. tinymolecule.node1.prom, the collector reads every *.prom file
+            self.prometheus_path = self._host_path(prometheus_path)
+        self.interval = interval
+        self.window_seconds = window_seconds
+
+        self._window = deque()  # (finished, target, exit code, duration, queue wait)
+        self._jobs = Counter()  # (target, "success" or "failed") -> count
+        self._failures = Counter()  # (target, exit code) -> count
+        self._prep_window = deque()  # (finished, engine, success, duration)
+        self._prep = Counter()  # (engine, "success" or "failed") -> count
+        self._flushed = time.time()
+        # docking results and prepared molecules may be recorded from different threads
+        self._lock = threading.RLock()
+        self.records_path.parent.mkdir(parents=True, exist_ok=True)
+        self._records = open(self.records_path, "a")
+
+    def record(self, result: JobResult):
+        """
+        Logs a finished job, its queue wait counted from when the job was queued.
+        """
+
+        job = result.job
+        finished = time.time()
+        queue_wait = (
+            max(0.0, result.started - job.queued)
+            if result.started and job.queued
+            else 0.0
+        )
+        # the vina CLI writes its outputs itself, inside the vina time
+        write_time = result.write_time
+        record = {
+            "finished": round(finished, 3),
+            "target": job.target,
+            "ligand": job.ligand,
+            "params": job.params,
+            "exit_code": result.exit_code,
+            "queue_wait": round(queue_wait, 3),
+            "stage_time": round(result.stage_time, 3),
+            "vina_time": round(
+                result.duration - result.stage_time - (write_time or 0.0), 3
+            ),
+            "write_time": round(write_time, 3) if write_time is not None else None,
+        }
+
+        status = "success" if result.exit_code == 0 else "failed"
+        with self._lock:
+            self._records.write(json.dumps(record) + "\n")
+            self._jobs[job.target, status] += 1
+            if result.exit_code != 0:
+                self._failures[job.target, result.exit_code] += 1
+            self._window.append(
+                (finished, job.target, result.exit_code, result.duration, queue_wait)
+            )
+
+            if time.time() - self._flushed > self.interval:
+                self.flush()
+
+    def record_prep(self, result: PrepResult, engine: str):
+        """
+        Logs a molecule converted to PDBQT by the given prep engine.
+        """
+
+        finished = time.time()
+        record = {
+            "finished": round(finished, 3),
+            "stage": "prep",
+            "ligand": f"{result.uuid}.pdbqt",
+            "engine": engine,
+            "error": result.error or None,
+            "prep_time": round(result.duration - result.write_time, 3),
+            "write_time": round(result.write_time, 3),
+        }
+
+        status = "failed" if result.error else "success"
+        with self._lock:
+            self._records.write(json.dumps(record) + "\n")
+            self._prep[engine, status] += 1
+            self._prep_window.append(
+                (finished, engine, not result.error, result.duration)
+            )
+
+            if time.time() - self._flushed > self.interval:
+                self.flush()
+
+    def record_archive(self, target: str, n_jobs: int, duration: float):
+        """
+        Logs the outputs of `n_jobs` docked jobs on a target moved into its archive.
+        """
+
+        record = {
+            "finished": round(time.time(), 3),
+            "stage": "archive",
+            "target": target,
+            "n_jobs": n_jobs,
+            "archive_time": round(duration, 3),
+        }
+        with self._lock:
+            self._records.write(json.dumps(record) + "\n")
+
+    def flush(self):
+        with self._lock:
+            self._records.flush()
+            self._flushed = time.time()
+            if self.prometheus_path is not None:
+                self._write_prometheus()
+
+    def close(self):
+        self.flush()
+        self._records.close()
+
+    def summary(self) -> dict:
+        """
+        Rolling aggregates per target: ligands/hour, latency quantiles and queue wait quantiles.
+        """
+
+        now = time.time()
+        self._trim(now)
+
+        by_target = {}
+        for finished, target, exit_code, duration, queue_wait in self._window:
+            by_target.setdefault(target, []).append(
+                (finished, exit_code, duration, queue_wait)
+            )
+
+        summary = {}
+        for target, rows in by_target.items():
+            rows = np.array(rows)
+            # a window shorter than its nominal length at the start of a run
+            span = max(now - rows[:, 0].min(), 1.0)
+            durations = rows[rows[:, 1] == 0, 2]
+            summary[target] = {
+                "ligands_per_hour": len(rows) / span * 3600,
+                "duration": (
+                    np.quantile(durations, QUANTILES)
+                    if len(durations)
+                    else np.full(len(QUANTILES), np.nan)
+                ),
+                "queue_wait": np.quantile(rows[:, 3], QUANTILES),
+            }
+
+        return summary
+
+    def prep_summary(self) -> dict:
+        """
+        Rolling aggregates per prep engine: molecules/hour and conversion time quantiles.
+        """
+
+        now = time.time()
+        self._trim(now)
+
+        by_engine = {}
+        for finished, engine, success, duration in self._prep_window:
+            by_engine.setdefault(engine, []).append((finished, success, duration))
+
+        summary = {}
+        for engine, rows in by_engine.items():
+            rows = np.array(rows)
+            span = max(now - rows[:, 0].min(), 1.0)
+            durations = rows[rows[:, 1] == 1, 2]
+            summary[engine] = {
+                "molecules_per_hour": len(rows) / span * 3600,
+                "duration": (
+                    np.quantile(durations, QUANTILES)
+                    if len(durations)
+                    else np.full(len(QUANTILES), np.nan)
+                ),
+            }
+
+        return summary
+
+    def _trim(self, now: float):
+        for window in (self._window, self._prep_window):
+            while window and window[0][0] < now - self.window_seconds:
+                window.popleft()
+
+    def _host_path(self, path: Union[str, Path]) -> Path:
+        path = Path(path)
+
+        return path.with_name(f"{path.stem}.{self.host}{path.suffix}")
+
+    def _labels(self, **labels) -> str:
+        labels = {"host": self.host, **labels}
+        return "{" + ",".join(f'{key}="{value}"' for key, value in labels.items()) + "}"
+
+    def _write_prometheus(self):
+        lines = [
+            "# HELP tinymolecule_docking_jobs_total Docking jobs finished by this process.",
+            "# TYPE tinymolecule_docking_jobs_total counter",
+        ]
+        for (target, status), count in sorted(self._jobs.items()):
+            lines.append(
+                f"tinymolecule_docking_jobs_total{self._labels(target=target, status=status)} {count}"
+            )
+
+        lines += [
+            "# HELP tinymolecule_docking_failures_total Failed docking jobs by vina exit code.",
+            "# TYPE tinymolecule_docking_failures_total counter",
+        ]
+        for (target, exit_code), count in sorted(self._failures.items()):
+            lines.append(
+                f"tinymolecule_docking_failures_total{self._labels(target=target, exit_code=exit_code)} {count}"
+            )
+
+        summary = self.summary()
+        lines += [
+            "# HELP tinymolecule_docking_ligands_per_hour Docking throughput over the rolling window.",
+            "# TYPE tinymolecule_docking_ligands_per_hour gauge",
+        ]
+        for target, stats in sorted(summary.items()):
+            lines.append(
+                f'tinymolecule_docking_ligands_per_hour{self._labels(target=target)} {stats["ligands_per_hour"]:.3f}'
+            )
+
+        for name, description in (
+            ("duration", "Docking wall time of successful jobs"),
+            ("queue_wait", "Time jobs waited for a free worker"),
+        ):
+            metric = f"tinymolecule_docking_{name}_seconds"
+            lines += [
+                f"# HELP {metric} {description} over the rolling window.",
+                f"# TYPE {metric} gauge",
+            ]
+            for target, stats in sorted(summary.items()):
+                for quantile, value in zip(QUANTILES, stats[name]):
+                    if not np.isnan(value):
+                        lines.append(
+                            f"{metric}{self._labels(target=target, quantile=quantile)} {value:.3f}"
+                        )
+
+        lines += [
+            "# HELP tinymolecule_prep_molecules_total Molecules converted to PDBQT by this process.",
+            "# TYPE tinymolecule_prep_molecules_total counter",
+        ]
+        for (engine, status), count in sorted(self._prep.items()):
+            lines.append(
+                f"tinymolecule_prep_molecules_total{self._labels(engine=engine, status=status)} {count}"
+            )
+
+        prep_summary = self.prep_summary()
+        lines += [
+            "# HELP tinymolecule_prep_molecules_per_hour Ligand prep throughput over the rolling window.",
+            "# TYPE tinymolecule_prep_molecules_per_hour gauge",
+        ]
+        for engine, stats in sorted(prep_summary.items()):
+            lines.append(
+                f'tinymolecule_prep_molecules_per_hour{self._labels(engine=engine)} {stats["molecules_per_hour"]:.3f}'
+            )
+        lines += [
+            "# HELP tinymolecule_prep_duration_seconds Conversion time of successfully prepared molecules over the rolling window.",
+            "# TYPE tinymolecule_prep_duration_seconds gauge",
+        ]
+        for engine, stats in sorted(prep_summary.items()):
+            for quantile, value in zip(QUANTILES, stats["duration"]):
+                if not np.isnan(value):
+                    lines.append(
+                        f"tinymolecule_prep_duration_seconds{self._labels(engine=engine, quantile=quantile)} {value:.3f}"
+                    )
+
+        # write-then-rename, so the exporter never scrapes a half written file
+        tmp_path = self.prometheus_path.with_name(self.prometheus_path.name + ".tmp")
+        tmp_path.write_text("\n".join(lines) + "\n")
+        os.replace(tmp_path, self.prometheus_path)
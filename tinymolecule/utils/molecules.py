@@ -1,6 +1,7 @@
 import numpy as np
+import pandas as pd
+from rdkit import Chem
 
-import moses
 from moses.metrics.utils import (
     get_mol,
     mol_passes_filters,
@@ -11,6 +12,12 @@ from moses.metrics.utils import (
     get_n_rings,
 )
 
+from tinymolecule.utils.helper_fn import hash_smiles
+
+
+# keys of `molecular_properties`
+PROPERTY_NAMES = ("MCF_PAINS_pass", "logP", "QED", "SA", "weight", "n_rings")
+
 
 def molecular_properties(molec: str):
     mol_obj = get_mol(molec)
@@ -25,4 +32,120 @@ def molecular_properties(molec: str):
 
 
 def molecule_is_valid(molec: str):
-    return get_mol(molec) not in [None, np.nan]
\ No newline at end of file
+    return get_mol(molec) not in [None, np.nan]
+
+
+def canonical_smiles(molec: str):
+    """
+    RDKit canonical SMILES, the same for every spelling of a molecule, or None if invalid,
+    missing (NaN) or blank.
+    """
+
+    if not isinstance(molec, str) or not molec.strip():
+        return None
+
+    mol_obj = get_mol(molec)
+    if mol_obj is None:
+        return None
+
+    return Chem.MolToSmiles(mol_obj)
+
+
+class MoleculeIds:
+    """
+    Gives SMILES the ID of their canonical molecule, so all spellings of a molecule share
+    one ID and are prepared and docked once. SMILES may arrive in batches: a molecule keeps
+    its ID across batches and collisions are resolved against every ID handed out so far.
+
+    IDs are cropped hashes of the canonical SMILES. Where two different molecules would
+    share an ID, the later one is re-hashed with a salt until its ID is free. Known IDs
+    (e.g. from an earlier run) are kept for their molecules unless the ID already went to
+    another molecule. Register all of them with `add_known` before the first batch, so a
+    new molecule can't take the ID of a known one from a later batch.
+    """
+
+    def __init__(self, hash_crop: int = 8):
+        self.hash_crop = hash_crop
+        self.ids, self.owners = {}, {}  # molecule -> ID, ID -> molecule
+        self.n_collisions = 0
+
+    @staticmethod
+    def _molecules(smiles: pd.Series, canonical: pd.Series = None):
+        """
+        (canonical SMILES, molecule) of every row, the molecule being what IDs are given
+        to. Canonical SMILES are computed unless given, NaN where they are missing.
+        """
+
+        # RDKit only once per distinct string
+        todo = smiles if canonical is None else smiles[canonical.isna()]
+        unique_smiles = pd.unique(todo)
+        computed = todo.map(
+            dict(zip(unique_smiles, (canonical_smiles(smi) for smi in unique_smiles)))
+        )
+        canonical = computed if canonical is None else canonical.fillna(computed)
+        # invalid SMILES keep an ID from their raw string, they are filtered out before prep
+        molecule = canonical.fillna(smiles)
+        # missing or blank SMILES are no molecule at all and get no ID
+        molecule = molecule.where(
+            smiles.map(lambda smi: isinstance(smi, str) and bool(smi.strip()))
+        )
+
+        return canonical, molecule
+
+    def add_known(
+        self,
+        smiles: pd.Series,
+        known_ids: pd.Series,
+        canonical: pd.Series = None,
+    ):
+        """
+        Registers previously assigned IDs aligned with `smiles`, NaN for rows without one.
+        `canonical` are the rows' canonical SMILES if known, e.g. from an earlier run.
+        """
+
+        has_id = known_ids.notna()
+        if canonical is not None:
+            canonical = canonical[has_id]
+        _, molecule = self._molecules(smiles[has_id], canonical)
+        self._register(molecule, known_ids[has_id])
+
+    def _register(self, molecule: pd.Series, known_ids: pd.Series):
+        known = pd.DataFrame({"molecule": molecule, "uuid": known_ids}).dropna()
+        for mol, uid in known.drop_duplicates("molecule").itertuples(index=False):
+            if mol not in self.ids and uid not in self.owners:
+                self.ids[mol], self.owners[uid] = uid, mol
+
+    def assign(self, smiles: pd.Series, known_ids: pd.Series = None) -> pd.DataFrame:
+        """
+        Parameters
+        ----------
+        smiles: pd.Series
+            SMILES strings, one per row
+
+        known_ids: pd.Series (Optional)
+            Previously assigned IDs aligned with `smiles`, NaN for rows without one
+
+        Returns
+        -------
+        DataFrame with the rows' "canonical_smiles", NaN if invalid, and "uuid", NaN
+        for missing or blank SMILES
+        """
+
+        canonical, molecule = self._molecules(smiles)
+
+        if known_ids is not None:
+            self._register(molecule, known_ids)
+
+        for mol in pd.unique(molecule.dropna()):
+            if mol in self.ids:
+                continue
+            uid, salt = hash_smiles(mol, self.hash_crop), 0
+            while uid in self.owners:
+                self.n_collisions += 1
+                salt += 1
+                uid = hash_smiles(f"{mol} {salt}", self.hash_crop)
+            self.ids[mol], self.owners[uid] = uid, mol
+
+        return pd.DataFrame(
+            {"canonical_smiles": canonical, "uuid": molecule.map(self.ids)}
+        )
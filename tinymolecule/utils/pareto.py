@@ -0,0 +1,243 @@
+from bisect import bisect_left, bisect_right
+from typing import Optional, Tuple
+
+import numpy as np
+
+
+# entries compared at once by the block-wise dominance check, bounds its memory use
+_BLOCK_ENTRIES = 1 << 22
+# points checked together against the front found so far
+_BLOCK_POINTS = 1024
+
+
+def non_dominated_sort(
+    points: np.ndarray, max_fronts: Optional[int] = None
+) -> np.ndarray:
+    """
+    Pareto front of every point, all objectives minimized: front 0 holds the points no
+    other point dominates, front 1 those only dominated by front 0, and so on. A point
+    dominates another if it is no worse in every objective and better in at least one.
+
+    Two or three objectives are sorted in one O(n log n) sweep, more with vectorized
+    dominance checks of blocks of points against the front found so far.
+
+    Parameters
+    ----------
+    points: numpy array
+        (n_points, n_objectives) array of finite objective values
+
+    max_fronts: int (Optional)
+        Only find the first `max_fronts` fronts, points behind them get -1
+
+    Returns
+    -------
+    int array of the front of every point
+    """
+
+    points = np.asarray(points, dtype=np.float64)
+    if points.ndim != 2:
+        raise ValueError("points must be an (n_points, n_objectives) array")
+    if not np.isfinite(points).all():
+        raise ValueError("objective values must be finite")
+    if not len(points):
+        return np.empty(0, dtype=np.int64)
+
+    if points.shape[1] <= 3:
+        fronts = _sweep_fronts(points)
+        if max_fronts is not None:
+            fronts[fronts >= max_fronts] = -1
+        return fronts
+
+    return _block_fronts(points, max_fronts)
+
+
+def _sweep_fronts(points: np.ndarray) -> np.ndarray:
+    """
+    Points in lexicographic order can only be dominated by earlier ones, so each goes
+    into the first front that doesn't dominate it. A front dominates a point if its 2D
+    staircase of (second, third objective) minima has a step below and left of it, and
+    fronts are nested, so the right one is found by binary search.
+    """
+
+    points = np.hstack([points, np.zeros((len(points), 3 - points.shape[1]))])
+    # equal points share a front, unique ones come out lexicographically sorted
+    unique, inverse = np.unique(points, axis=0, return_inverse=True)
+
+    stairs = []  # per front: second objective ascending, third strictly descending
+    unique_fronts = np.empty(len(unique), dtype=np.int64)
+    for i, (_, y, z) in enumerate(unique.tolist()):
+        low, high = 0, len(stairs)
+        while low < high:
+            mid = (low + high) // 2
+            ys, zs = stairs[mid]
+            step = bisect_right(ys, y) - 1
+            if step >= 0 and zs[step] <= z:  # dominated by this front
+                low = mid + 1
+            else:
+                high = mid
+        if low == len(stairs):
+            stairs.append(([], []))
+
+        # drop the steps the point covers, they can't dominate anything it doesn't
+        ys, zs = stairs[low]
+        start = end = bisect_left(ys, y)
+        while end < len(ys) and zs[end] >= z:
+            end += 1
+        ys[start:end] = [y]
+        zs[start:end] = [z]
+        unique_fronts[i] = low
+
+    return unique_fronts[inverse.ravel()]
+
+
+def _dominance(candidates: np.ndarray, points: np.ndarray) -> np.ndarray:
+    """
+    (points, candidates) boolean array of which candidates dominate which points, built
+    one objective at a time to avoid 3D temporaries.
+    """
+
+    no_worse = candidates[:, 0] <= points[:, :1]
+    equal = candidates[:, 0] == points[:, :1]
+    for j in range(1, points.shape[1]):
+        no_worse &= candidates[:, j] <= points[:, j : j + 1]
+        equal &= candidates[:, j] == points[:, j : j + 1]
+
+    return no_worse & ~equal
+
+
+def _dominated(candidates: np.ndarray, points: np.ndarray) -> np.ndarray:
+    """
+    Which points are dominated by any of the candidates, compared in blocks.
+    """
+
+    dominated = np.zeros(len(points), dtype=bool)
+    if not len(candidates):
+        return dominated
+
+    block = max(1, _BLOCK_ENTRIES // len(candidates))
+    for start in range(0, len(points), block):
+        dominated[start : start + block] = _dominance(
+            candidates, points[start : start + block]
+        ).any(axis=1)
+
+    return dominated
+
+
+def _block_fronts(points: np.ndarray, max_fronts: Optional[int]) -> np.ndarray:
+    """
+    A dominating point has a smaller objective sum, so going through points by sum, a
+    point's dominators all come before it. Points are taken in blocks: each point's front
+    among the earlier blocks is found by a binary search over the nested fronts, all
+    points of the block searching in lockstep, then dominance inside the block is settled
+    with one (block, block) comparison.
+    """
+
+    n_objectives = points.shape[1]
+    max_fronts = len(points) if max_fronts is None else max_fronts
+    fronts = np.full(len(points), -1, dtype=np.int64)
+    # a dominating point is also lexicographically smaller, which settles equal sums
+    order = np.lexsort(tuple(points.T[::-1]) + (points.sum(axis=1),))
+
+    members, sizes = [], []  # points of every front found so far, grown by doubling
+    for start in range(0, len(order), _BLOCK_POINTS):
+        indices = order[start : start + _BLOCK_POINTS]
+        chunk = points[indices]
+
+        low = np.zeros(len(chunk), dtype=np.int64)
+        high = np.full(len(chunk), min(len(members), max_fronts), dtype=np.int64)
+        while (low < high).any():
+            searching = np.flatnonzero(low < high)
+            mid = (low[searching] + high[searching]) // 2
+            for front in np.unique(mid):
+                at = searching[mid == front]
+                dominated = _dominated(members[front][: sizes[front]], chunk[at])
+                low[at[dominated]] = front + 1
+                high[at[~dominated]] = front
+
+        # points of the block dominated by earlier points of the block go behind them,
+        # points already behind `max_fronts` stay there and so does all they dominate
+        live = np.flatnonzero(low < max_fronts)
+        inside = _dominance(chunk[live], chunk[live])
+        block_fronts = low.copy()
+        while len(live):
+            behind = np.where(inside, block_fronts[live] + 1, 0).max(axis=1)
+            updated = np.maximum(low[live], behind)
+            if (updated == block_fronts[live]).all():
+                break
+            block_fronts[live] = updated
+
+        for front in np.unique(block_fronts[block_fronts < max_fronts]):
+            new = chunk[block_fronts == front]
+            if front == len(members):
+                members.append(np.empty((0, n_objectives)))
+                sizes.append(0)
+            size = sizes[front]
+            if size + len(new) > len(members[front]):
+                grown = np.empty((2 * (size + len(new)), n_objectives))
+                grown[:size] = members[front][:size]
+                members[front] = grown
+            members[front][size : size + len(new)] = new
+            sizes[front] += len(new)
+
+        fronts[indices] = np.where(block_fronts < max_fronts, block_fronts, -1)
+
+    return fronts
+
+
+def crowding_distance(points: np.ndarray, fronts: np.ndarray) -> np.ndarray:
+    """
+    NSGA-II crowding distance of every point within its front: the sum over objectives
+    of the gap between its two neighbors, relative to the front's range. The extremes of
+    each front get infinity. Larger is more isolated, the usual tie-breaker within a front.
+    """
+
+    points = np.asarray(points, dtype=np.float64)
+    fronts = np.asarray(fronts)
+    n_points = len(points)
+    distance = np.zeros(n_points)
+    if not n_points:
+        return distance
+
+    for values in points.T:
+        # grouped by front, ascending within each
+        order = np.lexsort((values, fronts))
+        sorted_values, sorted_fronts = values[order], fronts[order]
+        starts = np.flatnonzero(np.r_[True, sorted_fronts[1:] != sorted_fronts[:-1]])
+        ends = np.r_[starts[1:], n_points] - 1
+        span = np.repeat(
+            sorted_values[ends] - sorted_values[starts],
+            np.diff(np.r_[starts, n_points]),
+        )
+
+        gap = np.zeros(n_points)
+        gap[1:-1] = sorted_values[2:] - sorted_values[:-2]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            contribution = np.where(span > 0, gap / span, 0.0)
+        contribution[starts] = np.inf
+        contribution[ends] = np.inf
+        distance[order] += contribution
+
+    return distance
+
+
+def pareto_order(
+    points: np.ndarray, max_fronts: Optional[int] = None
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Non-dominated sorting with crowding distance tie-breaking, all objectives minimized.
+
+    Returns
+    -------
+    (point indices best first, front of every point, crowding distance of every point),
+    points behind `max_fronts` come last with front -1 and distance 0
+    """
+
+    fronts = non_dominated_sort(points, max_fronts)
+    ranked = fronts >= 0
+    distance = np.zeros(len(fronts))
+    if ranked.any():
+        distance[ranked] = crowding_distance(np.asarray(points)[ranked], fronts[ranked])
+
+    order = np.lexsort((-distance, np.where(ranked, fronts, np.iinfo(np.int64).max)))
+
+    return order, fronts, distance
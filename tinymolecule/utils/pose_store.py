@@ -0,0 +1,216 @@
+import os
+import shutil
+from multiprocessing import Pool
+from pathlib import Path
+from typing import Optional, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+from tinymolecule.utils.archive import Folder
+from tinymolecule.utils.helper_fn import change_file_ext, replace_dir
+
+
+COORDS_FILE = "coords.f32"  # xyz of every atom of every pose, raw float32
+SCORES_FILE = "scores.npy"  # affinity, rmsd l.b., rmsd u.b. of every pose
+OFFSETS_FILE = "offsets.npy"  # first pose and first atom row of every ligand
+LIGANDS_FILE = "ligands.npy"  # ligand IDs in store order
+
+
+def parse_docked_pdbqt(pdbqt_text: str) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Reads every binding mode (MODEL block) of a docked PDBQT.
+
+    Returns
+    -------
+    (float32 array of atom coordinates (n_modes, n_atoms, 3), float32 array of the
+    "REMARK VINA RESULT" affinity, rmsd l.b. and rmsd u.b. of every mode (n_modes, 3)),
+    both empty if the file holds no complete pose
+    """
+
+    coords, scores = [], []
+    n_atoms = None
+    mode_coords, mode_score = [], None
+    for line in pdbqt_text.splitlines():
+        if line.startswith(("ATOM", "HETATM")):
+            mode_coords.append((line[30:38], line[38:46], line[46:54]))
+        elif line.startswith("REMARK VINA RESULT"):
+            mode_score = line.split()[3:6]
+        elif line.startswith("ENDMDL"):
+            # every mode is the same ligand, a differing atom count means a damaged file
+            if mode_score is None or n_atoms not in (None, len(mode_coords)):
+                break
+            n_atoms = len(mode_coords)
+            coords.append(mode_coords)
+            scores.append(mode_score)
+            mode_coords, mode_score = [], None
+    if not coords or not n_atoms:
+        return np.empty((0, 0, 3), np.float32), np.empty((0, 3), np.float32)
+
+    return (
+        np.array(coords, dtype=str).astype(np.float32),
+        np.array(scores, dtype=str).astype(np.float32),
+    )
+
+
+def _parse_poses_chunk(args):
+    folder, pose_files = args
+    ligands, coords, scores = [], [], []
+    for pose_file in pose_files:
+        try:
+            ligand_coords, ligand_scores = parse_docked_pdbqt(
+                folder.read_text(pose_file)
+            )
+        except (OSError, UnicodeDecodeError, ValueError):
+            continue
+        if len(ligand_scores):
+            ligands.append(change_file_ext(pose_file))
+            coords.append(ligand_coords)
+            scores.append(ligand_scores)
+
+    return ligands, coords, scores
+
+
+def build_pose_store(
+    poses_path: Union[str, Path, Folder],
+    store_dir: Union[str, Path],
+    n_workers: Optional[int] = None,
+    chunksize: int = 500,
+) -> int:
+    """
+    Extracts the poses and scores of every docked PDBQT of a directory into a pose store
+    (see `PoseStore`), replacing an existing one.
+
+    Files are parsed in parallel chunks and their coordinates streamed to disk, so memory
+    use doesn't grow with the number of ligands.
+
+    Parameters
+    ----------
+    poses_path: Path, string or archive.Folder
+        Directory of docked PDBQT files, e.g. `out_pdbqt_dir` of a target
+
+    store_dir: Path or string
+        Directory of the pose store
+
+    n_workers: int (Optional)
+        Number of processes parsing PDBQTs, defaults to CPU count
+
+    chunksize: int (Optional)
+        PDBQTs parsed by a worker at once
+
+    Returns
+    -------
+    Number of ligands stored
+    """
+
+    folder = poses_path if isinstance(poses_path, Folder) else Folder(poses_path)
+    pose_files = [name for name in folder.listdir() if name.endswith(".pdbqt")]
+    chunks = [
+        (folder, pose_files[i : i + chunksize])
+        for i in range(0, len(pose_files), chunksize)
+    ]
+
+    store_dir = Path(store_dir)
+    tmp_dir = store_dir.with_name(f".{store_dir.name}.tmp")
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    tmp_dir.mkdir(parents=True)
+
+    ligands, scores, offsets = [], [], [(0, 0)]
+    with open(tmp_dir / COORDS_FILE, "wb") as coords_file:
+
+        def write(results):
+            for chunk_ligands, chunk_coords, chunk_scores in results:
+                for ligand, coords, ligand_scores in zip(
+                    chunk_ligands, chunk_coords, chunk_scores
+                ):
+                    coords_file.write(coords.tobytes())
+                    n_poses, n_atoms = coords.shape[:2]
+                    offsets.append(
+                        (offsets[-1][0] + n_poses, offsets[-1][1] + n_poses * n_atoms)
+                    )
+                    ligands.append(ligand)
+                    scores.append(ligand_scores)
+
+        n_workers = n_workers or os.cpu_count() or 1
+        if n_workers <= 1 or len(chunks) <= 1:
+            write(map(_parse_poses_chunk, chunks))
+        else:
+            with Pool(processes=min(n_workers, len(chunks))) as pool:
+                write(pool.imap(_parse_poses_chunk, chunks))
+
+    np.save(
+        tmp_dir / SCORES_FILE,
+        np.vstack(scores) if scores else np.empty((0, 3), np.float32),
+    )
+    np.save(tmp_dir / OFFSETS_FILE, np.array(offsets, dtype=np.int64))
+    np.save(tmp_dir / LIGANDS_FILE, np.array(ligands, dtype=str))
+
+    replace_dir(tmp_dir, store_dir)
+
+    return len(ligands)
+
+
+class PoseStore:
+    """
+    Docked poses of one target in flat arrays, opened as memory maps.
+
+    Coordinates of all poses are one float32 (n_atoms_total, 3) array, scores one
+    (n_poses_total, 3) array of affinity, rmsd l.b. and rmsd u.b., and every ligand owns
+    a contiguous range of both given by its offsets. Looking up a ligand's poses is a
+    dictionary lookup plus a slice, no file is parsed.
+    """
+
+    def __init__(self, store_dir: Union[str, Path]):
+        self.store_dir = Path(store_dir)
+        coords_path = self.store_dir / COORDS_FILE
+        self.coords = (
+            np.memmap(coords_path, dtype=np.float32, mode="r").reshape(-1, 3)
+            if coords_path.stat().st_size
+            else np.empty((0, 3), np.float32)  # mmap can't map an empty file
+        )
+        self.scores = np.load(self.store_dir / SCORES_FILE, mmap_mode="r")
+        self.offsets = np.load(self.store_dir / OFFSETS_FILE)
+        self.ligands = np.load(self.store_dir / LIGANDS_FILE)
+        self._index = {ligand: i for i, ligand in enumerate(self.ligands)}
+
+    @staticmethod
+    def exists(store_dir: Union[str, Path]) -> bool:
+        return (Path(store_dir) / LIGANDS_FILE).is_file()
+
+    def __len__(self) -> int:
+        return len(self.ligands)
+
+    def __contains__(self, ligand: str) -> bool:
+        return ligand in self._index
+
+    def _range(self, ligand: str) -> Tuple[int, int, int, int]:
+        i = self._index[ligand]
+        (pose_start, atom_start), (pose_end, atom_end) = self.offsets[i : i + 2]
+        return pose_start, pose_end, atom_start, atom_end
+
+    def poses(self, ligand: str) -> np.ndarray:
+        """
+        Atom coordinates of every binding mode of a ligand, (n_modes, n_atoms, 3).
+        """
+
+        pose_start, pose_end, atom_start, atom_end = self._range(ligand)
+        return self.coords[atom_start:atom_end].reshape(pose_end - pose_start, -1, 3)
+
+    def pose_scores(self, ligand: str) -> np.ndarray:
+        """
+        Affinity, rmsd l.b. and rmsd u.b. of every binding mode of a ligand, (n_modes, 3).
+        """
+
+        pose_start, pose_end, _, _ = self._range(ligand)
+        return self.scores[pose_start:pose_end]
+
+    def best_affinities(self) -> pd.Series:
+        """
+        Affinity of the top binding mode of every ligand, indexed by ligand.
+        """
+
+        return pd.Series(
+            np.asarray(self.scores[self.offsets[:-1, 0], 0]),
+            index=self.ligands,
+            dtype=float,
+        )
@@ -0,0 +1,113 @@
+import os
+import json
+import shutil
+import hashlib
+from pathlib import Path
+from typing import Iterable, List, Optional, Tuple, Union
+
+from tinymolecule.utils.ligand_prep import PrepResult
+
+
+def settings_hash(settings: dict) -> str:
+    """
+    Short hash of conversion settings, e.g. engine, engine version and its options.
+    """
+
+    return hashlib.sha1(json.dumps(settings, sort_keys=True).encode()).hexdigest()[:12]
+
+
+def _link(src: Path, dest: Path):
+    """
+    Points `dest` at the contents of `src`, as a hard link where the filesystem allows it.
+    """
+
+    if dest.exists() and os.path.samefile(src, dest):
+        return  # renaming a link onto its own file would leave the link behind
+
+    tmp = dest.with_name(f".{dest.name}.tmp")
+    if tmp.exists():
+        os.remove(tmp)
+    try:
+        os.link(src, tmp)
+    except OSError:
+        shutil.copyfile(src, tmp)
+    os.replace(tmp, dest)
+
+
+class PrepCache:
+    """
+    Content-addressed store of prepared ligands.
+
+    Entries are keyed by the canonical SMILES of a molecule together with a hash of
+    the conversion settings, so a molecule is converted once per settings no matter how
+    often or under which UUID it shows up, and changing the settings only misses the
+    entries converted with the old ones. Failed conversions are cached too, with their
+    error, so they aren't retried on every run.
+    """
+
+    def __init__(self, cache_dir: Union[str, Path], settings: dict):
+        self.cache_dir = Path(cache_dir)
+        self.settings = settings
+        self.settings_hash = settings_hash(settings)
+
+    def key(self, canonical_smiles: str) -> str:
+        return hashlib.sha1(
+            f"{self.settings_hash}:{canonical_smiles}".encode()
+        ).hexdigest()
+
+    def _path(self, key: str, ext: str) -> Path:
+        return self.cache_dir / key[:2] / f"{key}.{ext}"
+
+    def lookup(self, key: str) -> Tuple[Optional[Path], str]:
+        """
+        (cached PDBQT path, cached error) of an entry, (None, "") if it isn't cached.
+        """
+
+        pdbqt_path = self._path(key, "pdbqt")
+        if pdbqt_path.is_file():
+            return pdbqt_path, ""
+
+        error_path = self._path(key, "err")
+        if error_path.is_file():
+            return None, error_path.read_text()
+
+        return None, ""
+
+    def store(self, key: str, result: PrepResult, out_dir: Path):
+        """
+        Adds a freshly converted molecule (its file in `out_dir`) or its failure to the cache.
+        """
+
+        (self.cache_dir / key[:2]).mkdir(parents=True, exist_ok=True)
+        if result.error:
+            self._path(key, "err").write_text(result.error)
+        else:
+            _link(Path(out_dir) / f"{result.uuid}.pdbqt", self._path(key, "pdbqt"))
+
+    def split(
+        self, molecules: Iterable[Tuple[str, str, str]], out_dir: Path
+    ) -> Tuple[List[PrepResult], List[Tuple[str, str, str]]]:
+        """
+        Splits (uuid, SMILES, canonical SMILES) molecules into cached and new ones.
+
+        Cached molecules are put in place as `out_dir`/<uuid>.pdbqt right away (failures
+        leave no file), returns their PrepResults and the molecules still to convert.
+        """
+
+        out_dir = Path(out_dir)
+        cached, missing = [], []
+        for uuid, smiles, canonical in molecules:
+            pdbqt_path, error = self.lookup(self.key(canonical))
+            if pdbqt_path is None and not error:
+                missing.append((uuid, smiles, canonical))
+                continue
+
+            out_file = out_dir / f"{uuid}.pdbqt"
+            if error:
+                if out_file.exists():  # left over from other settings
+                    os.remove(out_file)
+            else:
+                _link(pdbqt_path, out_file)
+            cached.append(PrepResult(uuid, smiles, error))
+
+        return cached, missing
@@ -0,0 +1,225 @@
+from typing import Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from tinymolecule.utils.results_store import ResultsStore
+
+
+PRIORITY_COLUMNS = ["uuid", "variants_mean", "off_targets_max", "objective"]
+
+# direction of the objectives that have an obvious one, "max" where higher is better
+OBJECTIVE_SENSES = {
+    "variants_mean": "max",
+    "variants_min": "max",  # worst case over the variants
+    "off_targets_max": "min",
+    "objective": "max",
+    "QED": "max",
+    "SA": "min",
+}
+
+
+def top_k_indices(values: np.ndarray, k: int) -> np.ndarray:
+    """
+    Indices of the `k` highest values, highest first. Only those `k` are sorted, the
+    rest is split off with a linear-time partition.
+    """
+
+    if k < len(values):
+        top = np.argpartition(-values, k - 1)[:k]
+    else:
+        top = np.arange(len(values))
+
+    return top[np.argsort(-values[top], kind="stable")]
+
+
+def target_scores(
+    store: ResultsStore,
+    variants: Sequence[str],
+    off_targets: Sequence[str],
+    rows: slice = slice(None),
+    n_modes: Optional[int] = None,
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Scores of the molecules at `rows` of a results store that were docked on every
+    target. A molecule's score on a target is its negated mean affinity over all binding
+    modes, or its best `n_modes`, as in `cascade.ligand_score`, so higher binds better.
+
+    Returns
+    -------
+    (store indices of the molecules, (molecules, variants) scores, (molecules,
+    off-targets) scores)
+    """
+
+    docked = np.flatnonzero(
+        store.docked(list(variants) + list(off_targets), rows).all(axis=1)
+    )
+    variants_baff = -np.nanmean(
+        store.affinities(variants, rows, n_modes)[docked], axis=2
+    )
+    off_targets_baff = -np.nanmean(
+        store.affinities(off_targets, rows, n_modes)[docked], axis=2
+    )
+
+    return docked + (rows.start or 0), variants_baff, off_targets_baff
+
+
+def objective_table(
+    store: ResultsStore,
+    variants: Sequence[str],
+    off_targets: Sequence[str],
+    objectives: Sequence[str],
+    n_modes: Optional[int] = None,
+) -> pd.DataFrame:
+    """
+    Docking objectives of the molecules docked on every target, one column each:
+    "variants_mean", "variants_min", "off_targets_max", "objective", the score on a
+    target by its name, or "selectivity_<off-target>", the variants mean minus the score
+    on that off-target. Scores average the best `n_modes` binding modes, all by default.
+
+    Returns
+    -------
+    dataframe | uuid | <objectives> |
+    """
+
+    docked, variants_baff, off_targets_baff = target_scores(
+        store, variants, off_targets, n_modes=n_modes
+    )
+    variants_mean = variants_baff.mean(axis=1, dtype=np.float64)
+    scores = {
+        "variants_mean": variants_mean,
+        "variants_min": variants_baff.min(axis=1),
+        "off_targets_max": off_targets_baff.max(axis=1),
+    }
+    scores["objective"] = variants_mean - scores["off_targets_max"]
+    for i, target in enumerate(variants):
+        scores[target.lower()] = variants_baff[:, i]
+    for i, target in enumerate(off_targets):
+        scores[target.lower()] = off_targets_baff[:, i]
+        scores[f"selectivity_{target.lower()}"] = variants_mean - off_targets_baff[:, i]
+
+    table = pd.DataFrame({"uuid": store.ligands[docked]})
+    for name in objectives:
+        key = name if name in scores else name.lower()
+        if key not in scores:
+            raise ValueError(f"unknown docking objective: {name}")
+        table[name] = np.asarray(scores[key], dtype=np.float64)
+
+    return table
+
+
+def objective_sense(
+    name: str, variants: Sequence[str], off_targets: Sequence[str]
+) -> Optional[str]:
+    """
+    "max" or "min", whichever is better for an objective of `objective_table` or a
+    molecular property in `OBJECTIVE_SENSES`, None if it has no obvious direction.
+    """
+
+    if name in OBJECTIVE_SENSES:
+        return OBJECTIVE_SENSES[name]
+    if name.lower() in (target.lower() for target in variants):
+        return "max"
+    if name.lower() in (target.lower() for target in off_targets):
+        return "min"
+    if name.lower().startswith("selectivity_"):
+        return "max"
+
+    return None
+
+
+def objective_chunk(
+    store: ResultsStore,
+    variants: Sequence[str],
+    off_targets: Sequence[str],
+    rows: slice = slice(None),
+    n_modes: Optional[int] = None,
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Objective function terms of the molecules at `rows` of a results store that were
+    docked on every target, see `target_scores`.
+
+    Returns
+    -------
+    (store indices of the molecules, mean score over the variants, max score over the
+    off-targets)
+    """
+
+    docked, variants_baff, off_targets_baff = target_scores(
+        store, variants, off_targets, rows, n_modes
+    )
+
+    return (
+        docked,
+        variants_baff.mean(axis=1, dtype=np.float64),
+        off_targets_baff.max(axis=1).astype(np.float64),
+    )
+
+
+def prioritize_results(
+    store: ResultsStore,
+    variants: Sequence[str],
+    off_targets: Sequence[str],
+    top_k: Optional[int] = None,
+    chunk_size: Optional[int] = None,
+    n_modes: Optional[int] = None,
+) -> pd.DataFrame:
+    """
+    Ranks the molecules of a results store by the objective function
+    `variants_mean - off_targets_max`, only counting molecules docked on every target.
+
+    The store is read `chunk_size` molecules at a time. With `top_k`, each chunk is
+    reduced to its best molecules right away, so memory doesn't grow with the size of the
+    screen and nothing beyond the top is ever sorted.
+
+    Parameters
+    ----------
+    store: ResultsStore
+        Docking results of the ligand set
+
+    variants: list of strings
+        On-targets, whose mean score should be high
+
+    off_targets: list of strings
+        Off-targets, whose max score should be low
+
+    top_k: int (Optional)
+        Only keep the best `top_k` molecules, all if not specified
+
+    chunk_size: int (Optional)
+        Molecules read at once, all if not specified
+
+    n_modes: int (Optional)
+        Best binding modes a molecule's score on a target averages, all if not specified
+
+    Returns
+    -------
+    dataframe | uuid | variants_mean | off_targets_max | objective |, best first
+    """
+
+    n_ligands = len(store.ligands)
+    chunk_size = chunk_size or max(n_ligands, 1)
+
+    kept = [np.empty(0, np.int64), np.empty(0), np.empty(0)]
+    for start in range(0, n_ligands, chunk_size):
+        chunk = objective_chunk(
+            store, variants, off_targets, slice(start, start + chunk_size), n_modes
+        )
+        kept = [np.concatenate([kept_, new]) for kept_, new in zip(kept, chunk)]
+        if top_k is not None and len(kept[0]) > top_k:
+            best = np.argpartition(kept[2] - kept[1], top_k - 1)[:top_k]
+            kept = [values[best] for values in kept]
+
+    indices, variants_mean, off_targets_max = kept
+    objective = variants_mean - off_targets_max
+    order = top_k_indices(objective, len(objective) if top_k is None else top_k)
+
+    return pd.DataFrame(
+        {
+            "uuid": store.ligands[indices[order]],
+            "variants_mean": variants_mean[order],
+            "off_targets_max": off_targets_max[order],
+            "objective": objective[order],
+        },
+        columns=PRIORITY_COLUMNS,
+    )
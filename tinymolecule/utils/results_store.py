@@ -0,0 +1,288 @@
+import os
+import json
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Union
+
+import numpy as np
+import pandas as pd
+
+from tinymolecule.utils.docking import N_MODES, get_vina_header
+
+
+META_FILE = (
+    "meta.json"  # version, targets with their group and files, tier names, modes
+)
+RESULTS_FILE = (
+    "results.{target}.{version}.npy"  # float32 (ligands, modes, 3) of a target
+)
+TIERS_FILE = (
+    "tiers.{target}.{version}.npy"  # int8 (ligands,), tier index, -1 if not docked
+)
+LIGANDS_FILE = "ligands.{version}.npy"  # ligand IDs in store order
+
+_OPEN_ATTEMPTS = 5  # reads of the meta file when an update removes the files it names
+
+
+class ResultsStore:
+    """
+    Docking results of a ligand set on every target, read as one dense float32 array of
+    shape (ligands, targets, modes, 3): affinity, rmsd l.b. and rmsd u.b. of each binding
+    mode, NaN where a molecule wasn't docked on a target or has fewer modes. Next to it
+    are the ligand IDs, the targets with their group ("variants" or "off_targets") and
+    the tier each result comes from.
+
+    Every target's results are a memory-mapped file of their own, so reading some
+    targets only touches their files. Files are never modified: an update writes new
+    ones and switches to them by replacing the meta file, see `update_results_store`.
+    A store opens the files named by one version of the meta file and keeps reading
+    that version, whatever updates happen meanwhile.
+    """
+
+    def __init__(self, store_dir: Union[str, Path]):
+        self.store_dir = Path(store_dir)
+        for attempt in range(_OPEN_ATTEMPTS):
+            with open(self.store_dir / META_FILE) as meta_file:
+                meta = json.load(meta_file)
+            try:
+                self._open(meta)
+                break
+            except FileNotFoundError:
+                # a newer version was written and this one cleaned up, read it instead
+                if attempt == _OPEN_ATTEMPTS - 1:
+                    raise
+        self._ligand_index = None
+
+    def _open(self, meta: dict):
+        self.version: int = meta["version"]
+        self.targets: List[str] = [target["name"] for target in meta["targets"]]
+        self.groups: Dict[str, str] = {
+            target["name"]: target["group"] for target in meta["targets"]
+        }
+        self.tier_names: List[str] = meta["tiers"]
+
+        self.ligands = np.load(self.store_dir / meta["ligands"])
+        # files of targets not updated since are shorter than the ligand axis
+        self._results = [
+            np.load(self.store_dir / target["results"], mmap_mode="r")
+            for target in meta["targets"]
+        ]
+        self._tiers = [
+            np.load(self.store_dir / target["tiers"], mmap_mode="r")
+            for target in meta["targets"]
+        ]
+
+    @staticmethod
+    def exists(store_dir: Union[str, Path]) -> bool:
+        return (Path(store_dir) / META_FILE).is_file()
+
+    @property
+    def results(self) -> np.ndarray:
+        """
+        (ligands, targets, modes, 3) array of all results.
+        """
+
+        return np.stack(
+            [
+                self._read(self._results[t], slice(None))
+                for t in range(len(self.targets))
+            ],
+            axis=1,
+        )
+
+    def target_indices(self, targets: Sequence[str]) -> List[int]:
+        names = [name.lower() for name in self.targets]
+        return [names.index(target.lower()) for target in targets]
+
+    def ligand_indices(self, ligands: Sequence[str]) -> np.ndarray:
+        """
+        Store rows of the given ligand IDs, -1 for unknown ones.
+        """
+
+        if self._ligand_index is None:
+            self._ligand_index = pd.Index(self.ligands)
+
+        return self._ligand_index.get_indexer(ligands)
+
+    def docked(self, targets: Sequence[str], rows=slice(None)) -> np.ndarray:
+        """
+        (ligands, targets) boolean array of which molecules have results on which targets,
+        for the ligands at `rows` (a slice or index array), all by default.
+        """
+
+        return np.stack(
+            [
+                self._read(self._tiers[t], rows) >= 0
+                for t in self.target_indices(targets)
+            ],
+            axis=1,
+        )
+
+    def affinities(
+        self, targets: Sequence[str], rows=slice(None), n_modes: Optional[int] = None
+    ) -> np.ndarray:
+        """
+        (ligands, targets, modes) float32 array of binding affinities for the ligands at
+        `rows` (a slice or index array), read target by target. Only the best `n_modes`
+        modes if given.
+        """
+
+        return np.stack(
+            [
+                self._read(self._results[t], rows)[:, :n_modes, 0]
+                for t in self.target_indices(targets)
+            ],
+            axis=1,
+        )
+
+    def summary(self, target: str) -> pd.DataFrame:
+        """
+        Results of one target in the layout of its `summary.csv`, docked molecules only.
+        """
+
+        t = self.target_indices([target])[0]
+        tiers = np.asarray(self._tiers[t])
+        rows = np.flatnonzero(tiers >= 0)
+        # affinities of all modes, then their rmsd l.b., then rmsd u.b.
+        table = self._results[t][rows].transpose(0, 2, 1).reshape(len(rows), -1)
+
+        summary = pd.DataFrame(table, columns=get_vina_header(), dtype=float)
+        summary["uuid"] = self.ligands[rows]
+        summary["tier"] = np.array(self.tier_names, dtype=object)[tiers[rows]]
+
+        return summary
+
+    def _read(self, array: np.ndarray, rows) -> np.ndarray:
+        """
+        Ligands at `rows` of a target array, not docked past the end of a shorter file.
+        """
+
+        if len(array) == len(self.ligands):
+            return array[rows]
+
+        index = np.arange(len(self.ligands))[rows]
+        fill = np.nan if array.dtype.kind == "f" else -1
+        out = np.full((len(index),) + array.shape[1:], fill, dtype=array.dtype)
+        stored = index < len(array)
+        out[stored] = array[index[stored]]
+
+        return out
+
+
+def _summary_arrays(logs_df: pd.DataFrame):
+    """
+    (ligand IDs, tier names, (ligands, modes, 3) results) of a summary table.
+    """
+
+    ligands = logs_df["uuid"].astype(str).values
+    tiers = (
+        logs_df["tier"].fillna("standard").astype(str).values
+        if "tier" in logs_df
+        else np.full(len(logs_df), "standard", dtype=object)
+    )
+    values = (
+        logs_df[list(get_vina_header())]
+        .to_numpy(dtype=np.float32)
+        .reshape(-1, 3, N_MODES)
+        .transpose(0, 2, 1)
+    )
+
+    return ligands, tiers, values
+
+
+def update_results_store(
+    store_dir: Union[str, Path],
+    summaries: Dict[str, pd.DataFrame],
+    groups: Optional[Dict[str, str]] = None,
+):
+    """
+    Replaces the results of some targets in a results store with summary tables of their
+    logs (see `docking.generate_tiered_logs_table`), creating the store if needed.
+
+    Only the updated targets are written, each to new files of the next store version,
+    along with the ligand IDs if there are new ones. The meta file naming them is then
+    replaced in one step, so readers see either the old or the new version and never a
+    mix of the two, and files no version refers to anymore are removed.
+
+    Parameters
+    ----------
+    store_dir: Path
+        Results store directory
+
+    summaries: dict of strings to DataFrames
+        Summary table of each updated target
+
+    groups: dict of strings to strings (Optional)
+        Group of each target, "variants" or "off_targets", kept as is if not given
+    """
+
+    store_dir = Path(store_dir)
+    groups = groups or {}
+    arrays = {target: _summary_arrays(df) for target, df in summaries.items()}
+
+    if ResultsStore.exists(store_dir):
+        with open(store_dir / META_FILE) as meta_file:
+            meta = json.load(meta_file)
+        old_ligands = np.load(store_dir / meta["ligands"])
+    else:
+        store_dir.mkdir(parents=True, exist_ok=True)
+        meta = {"version": 0, "targets": [], "tiers": [], "ligands": None}
+        old_ligands = np.array([], dtype=str)
+    version = meta["version"] + 1
+    meta_targets, tier_names = meta["targets"], meta["tiers"]
+
+    positions = {}
+    for target in summaries:
+        names = [entry["name"].lower() for entry in meta_targets]
+        if target.lower() in names:
+            positions[target] = names.index(target.lower())
+        else:
+            positions[target] = len(meta_targets)
+            meta_targets.append({"name": target, "group": None})
+        if groups.get(target) is not None:
+            meta_targets[positions[target]]["group"] = groups[target]
+    all_tiers = {tier for _, tiers, _ in arrays.values() for tier in tiers}
+    tier_names += sorted(all_tiers - set(tier_names))
+
+    index = pd.Index(old_ligands)
+    summary_ligands = [ligands for ligands, _, _ in arrays.values()]
+    new_ligands = pd.unique(
+        np.concatenate(
+            [ligands[index.get_indexer(ligands) < 0] for ligands in summary_ligands]
+            + [np.array([], dtype=str)]
+        )
+    )
+    all_ligands = np.concatenate([old_ligands, new_ligands]).astype(str)
+    all_index = pd.Index(all_ligands)
+
+    # new files aren't read before the meta file names them
+    for target, (ligands, tiers, values) in arrays.items():
+        t, rows = positions[target], all_index.get_indexer(ligands)
+        block = np.full((len(all_ligands), N_MODES, 3), np.nan, dtype=np.float32)
+        block[rows] = values
+        tier_codes = np.full(len(all_ligands), -1, dtype=np.int8)
+        tier_codes[rows] = [tier_names.index(tier) for tier in tiers]
+        entry = meta_targets[t]
+        entry["results"] = RESULTS_FILE.format(target=t, version=version)
+        entry["tiers"] = TIERS_FILE.format(target=t, version=version)
+        np.save(store_dir / entry["results"], block)
+        np.save(store_dir / entry["tiers"], tier_codes)
+    if len(new_ligands) or meta["ligands"] is None:
+        meta["ligands"] = LIGANDS_FILE.format(version=version)
+        np.save(store_dir / meta["ligands"], all_ligands)
+
+    meta.update(version=version, n_modes=N_MODES)
+    _write_json(store_dir / META_FILE, meta)
+
+    # open stores keep reading the files they mapped, see `ResultsStore`
+    in_use = {meta["ligands"]}
+    in_use.update(entry[key] for entry in meta_targets for key in ("results", "tiers"))
+    for path in store_dir.glob("*.npy"):
+        if path.name not in in_use:
+            path.unlink(missing_ok=True)
+
+
+def _write_json(path: Path, data: dict):
+    tmp_path = path.with_name(f".{path.name}.tmp")
+    with open(tmp_path, "w") as tmp_file:
+        json.dump(data, tmp_file)
+    os.replace(tmp_path, path)
@@ -0,0 +1,261 @@
+import os
+import time
+import queue
+import subprocess
+from contextlib import contextmanager
+from functools import partial
+import multiprocessing
+from pathlib import Path
+from typing import Iterable, Iterator, List, NamedTuple, Optional
+
+from tinymolecule.utils.archive import Folder
+
+
+TIMEOUT_EXIT_CODE = 124  # same convention as coreutils `timeout`
+SPAWN_ERROR_EXIT_CODE = 127  # vina executable missing or not runnable
+
+
+class DockingJob(NamedTuple):
+    """
+    A single (target, ligand) docking task with every path vina needs.
+    """
+
+    target: str
+    ligand: str  # ligand file name, e.g. "ec0fdc31.pdbqt"
+    ligand_path: Path
+    receptor_path: Path
+    config_path: Path
+    out_pdbqt: Path
+    out_log: Path
+    cpu: int = 1
+    params: str = ""  # hash of docking settings, see ledger.job_params
+    exhaustiveness: Optional[int] = None  # overrides the vina config if set
+    num_modes: Optional[int] = None  # overrides the vina config if set
+    ligand_folder: Optional[Folder] = (
+        None  # archived ligand to extract, see stage_ligands
+    )
+    queued: float = 0.0  # epoch time the job was queued for a worker, 0 if unknown
+
+
+class JobResult(NamedTuple):
+    """
+    Outcome of a docking job: vina exit code, wall time in seconds and captured error output.
+    """
+
+    job: DockingJob
+    exit_code: int
+    duration: float
+    error: str = ""
+    started: float = 0.0  # epoch time the job left the queue
+    # part of `duration` spent writing poses and log, None where vina writes them itself
+    write_time: Optional[float] = None
+    stage_time: float = 0.0  # part of `duration` spent extracting an archived ligand
+
+
+@contextmanager
+def stage_ligands(jobs: List[DockingJob]):
+    """
+    Extracts the ligands of jobs with a `ligand_folder` to their `ligand_path` for vina
+    to read, unless the file is already there, and removes them once the jobs are done.
+    Workers do this job by job, so archived ligands are never all extracted at once.
+    """
+
+    extracted = []
+    try:
+        for job in jobs:
+            if job.ligand_folder is None or job.ligand_path.is_file():
+                continue
+            job.ligand_path.parent.mkdir(parents=True, exist_ok=True)
+            job.ligand_path.write_text(job.ligand_folder.read_text(job.ligand))
+            extracted.append(job.ligand_path)
+        yield
+    finally:
+        for ligand_path in extracted:
+            if ligand_path.exists():
+                os.remove(ligand_path)
+
+
+def vina_command(job: DockingJob) -> List[str]:
+    """
+    Builds the vina CLI argument list for a docking job.
+    """
+
+    command = [
+        "vina",
+        "--config",
+        str(job.config_path),
+        "--receptor",
+        str(job.receptor_path),
+        "--ligand",
+        str(job.ligand_path),
+        "--out",
+        str(job.out_pdbqt),
+        "--log",
+        str(job.out_log),
+        "--cpu",
+        str(job.cpu),
+    ]
+    if job.exhaustiveness is not None:
+        command += ["--exhaustiveness", str(job.exhaustiveness)]
+    if job.num_modes is not None:
+        command += ["--num_modes", str(job.num_modes)]
+
+    return command
+
+
+def run_vina_job(job: DockingJob, timeout: Optional[float] = None) -> JobResult:
+    """
+    Runs vina for a single job, killing it after `timeout` seconds if given.
+    """
+
+    start = time.time()
+    stage_time = 0.0
+    try:
+        with stage_ligands([job]):
+            stage_time = time.time() - start
+            proc = subprocess.run(
+                vina_command(job),
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.PIPE,
+                timeout=timeout,
+            )
+        exit_code = proc.returncode
+        error = proc.stderr.decode(errors="replace")[-2000:] if exit_code else ""
+    except subprocess.TimeoutExpired:
+        exit_code, error = TIMEOUT_EXIT_CODE, f"timed out after {timeout} s"
+    except OSError as e:
+        exit_code, error = SPAWN_ERROR_EXIT_CODE, str(e)
+
+    return JobResult(
+        job, exit_code, time.time() - start, error, start, stage_time=stage_time
+    )
+
+
+def threadsafe_context():
+    """
+    Multiprocessing context for pools started while other threads are running, e.g. the
+    ledger heartbeat while docking or the producer in `TinyDock.prepare_and_dock`. A
+    forked child inherits every lock another thread happens to hold, e.g. inside an
+    SQLite connection, and nothing there releases them, so these pools start their
+    workers fresh (forkserver, or spawn where unavailable).
+    """
+
+    methods = multiprocessing.get_all_start_methods()
+
+    return multiprocessing.get_context(
+        "forkserver" if "forkserver" in methods else "spawn"
+    )
+
+
+def default_n_workers(cpu_per_job: int = 1) -> int:
+    """
+    Number of concurrent vina processes that saturates the machine without oversubscribing it.
+    """
+
+    return max(1, (os.cpu_count() or 1) // max(1, cpu_per_job))
+
+
+def run_jobs(
+    jobs: Iterable[DockingJob],
+    n_workers: Optional[int] = None,
+    timeout: Optional[float] = None,
+) -> Iterator[JobResult]:
+    """
+    Docks every job on a pool of worker processes drawing from one global queue.
+
+    Parameters
+    ----------
+    jobs: iterable of DockingJob
+        (target, ligand) pairs to dock, in the order they should be started
+
+    n_workers: int (Optional)
+        Number of vina processes to run at once, defaults to CPU count / cpu per job
+
+    timeout: float (Optional)
+        Wall-clock limit in seconds for a single vina process
+
+    Yields
+    ------
+    JobResult for every job in order of completion
+    """
+
+    jobs = list(jobs)
+    if not jobs:
+        return
+
+    if n_workers is None:
+        n_workers = default_n_workers(jobs[0].cpu)
+
+    run = partial(run_vina_job, timeout=timeout)
+    if n_workers <= 1:  # no point in paying for a pool
+        for job in jobs:
+            yield run(job)
+        return
+
+    # `dock` keeps the ledger heartbeat thread running meanwhile
+    with threadsafe_context().Pool(processes=min(n_workers, len(jobs))) as pool:
+        for result in pool.imap_unordered(run, jobs, chunksize=1):
+            yield result
+
+
+def run_jobs_streaming(
+    job_queue: queue.Queue,
+    n_workers: Optional[int] = None,
+    timeout: Optional[float] = None,
+) -> Iterator[JobResult]:
+    """
+    Docks jobs as they arrive on `job_queue`, e.g. while their ligands are still being
+    prepared, on a pool of worker processes until a None is put on the queue.
+
+    At most two jobs per worker are taken off the queue ahead of the workers, so a
+    bounded queue blocks its producer while docking is behind.
+
+    Parameters
+    ----------
+    job_queue: queue.Queue of DockingJob
+        Jobs to dock in the order they should be started, ended by None
+
+    n_workers: int (Optional)
+        Number of vina processes to run at once, defaults to CPU count
+
+    timeout: float (Optional)
+        Wall-clock limit in seconds for a single vina process
+
+    Yields
+    ------
+    JobResult for every job in order of completion
+    """
+
+    n_workers = n_workers or default_n_workers()
+    run = partial(run_vina_job, timeout=timeout)
+    done = queue.Queue()
+    n_running, closed = 0, False
+
+    with threadsafe_context().Pool(processes=n_workers) as pool:
+        while not closed or n_running:
+            while not closed and n_running < 2 * n_workers:
+                try:  # wait for work only if there are no results to wait for
+                    job = job_queue.get(timeout=0.1 if n_running else None)
+                except queue.Empty:
+                    break
+                if job is None:
+                    closed = True
+                    break
+                pool.apply_async(
+                    run,
+                    (job,),
+                    callback=done.put,
+                    error_callback=partial(_failed_result, job, done),
+                )
+                n_running += 1
+
+            try:
+                result = done.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            n_running -= 1
+            yield result
+
+
+def _failed_result(job: DockingJob, done: queue.Queue, error: BaseException):
+    done.put(JobResult(job, SPAWN_ERROR_EXIT_CODE, 0.0, repr(error)))
@@ -0,0 +1,134 @@
+import time
+from typing import Iterable, Iterator, Optional
+
+from tinymolecule.utils.scheduler import (
+    DockingJob,
+    JobResult,
+    default_n_workers,
+    threadsafe_context,
+)
+from tinymolecule.utils.docking import (
+    parse_vina_results,
+    read_vina_config,
+    write_vina_log,
+)
+
+
+# per worker process: (receptor, config, cpu) -> (Vina object with computed maps, config)
+_DOCKERS = {}
+
+
+def _get_docker(job: DockingJob):
+    """
+    Returns a Vina object with the job's receptor loaded and affinity maps computed,
+    building it only the first time this worker sees the target.
+    """
+
+    key = (str(job.receptor_path), str(job.config_path), job.cpu)
+    if key not in _DOCKERS:
+        try:
+            from vina import Vina
+        except ImportError:
+            raise ImportError(
+                "the vina_python backend needs the Vina Python bindings: pip install vina"
+            )
+
+        config = read_vina_config(job.config_path)
+        docker = Vina(
+            sf_name="vina",
+            cpu=job.cpu,
+            seed=int(config.get("seed", 0)),
+            verbosity=0,
+        )
+        docker.set_receptor(rigid_pdbqt_filename=str(job.receptor_path))
+        docker.compute_vina_maps(
+            center=[float(config[f"center_{axis}"]) for axis in "xyz"],
+            box_size=[float(config[f"size_{axis}"]) for axis in "xyz"],
+        )
+        _DOCKERS[key] = (docker, config)
+
+    return _DOCKERS[key]
+
+
+def dock_in_process(job: DockingJob) -> JobResult:
+    """
+    Docks one ligand against the cached receptor maps and writes its poses and log
+    in the same layout as the vina CLI.
+    """
+
+    start, stage_time = time.time(), 0.0
+    try:
+        docker, config = _get_docker(job)
+        num_modes = job.num_modes or int(config.get("num_modes", 9))
+        energy_range = float(config.get("energy_range", 3))
+
+        if job.ligand_folder is not None and not job.ligand_path.is_file():
+            stage_start = time.time()
+            ligand = job.ligand_folder.read_text(job.ligand)
+            stage_time = time.time() - stage_start
+            docker.set_ligand_from_string(ligand)
+        else:
+            docker.set_ligand_from_file(str(job.ligand_path))
+        docker.dock(
+            exhaustiveness=job.exhaustiveness or int(config.get("exhaustiveness", 8)),
+            n_poses=max(20, num_modes),
+        )
+        poses = docker.poses(n_poses=num_modes, energy_range=energy_range)
+
+        write_start = time.time()
+        with open(job.out_pdbqt, "w") as out_pdbqt:
+            out_pdbqt.write(poses)
+        write_vina_log(
+            job.out_log,
+            parse_vina_results(poses),
+            header="AutoDock Vina (Python bindings)",
+        )
+    except ImportError:
+        raise
+    except Exception as e:  # vina raises RuntimeError/TypeError on bad ligands
+        error = f"{type(e).__name__}: {str(e).strip()}"
+        return JobResult(job, 1, time.time() - start, error, start)
+
+    end = time.time()
+
+    return JobResult(job, 0, end - start, "", start, end - write_start, stage_time)
+
+
+def run_jobs_in_process(
+    jobs: Iterable[DockingJob], n_workers: Optional[int] = None
+) -> Iterator[JobResult]:
+    """
+    Docks every job on a pool of worker processes using the Vina Python bindings.
+    Each worker computes the grid maps of a target once and reuses them for every
+    ligand it docks on that target, instead of once per ligand as the CLI does.
+
+    Parameters
+    ----------
+    jobs: iterable of DockingJob
+        (target, ligand) pairs to dock, in the order they should be started
+
+    n_workers: int (Optional)
+        Number of worker processes, defaults to CPU count / cpu per job
+
+    Yields
+    ------
+    JobResult for every job in order of completion
+    """
+
+    # kept in the given (e.g. longest first) order: a worker keeps the maps of every
+    # target it has seen, so grouping jobs by target wouldn't build fewer of them
+    jobs = list(jobs)
+    if not jobs:
+        return
+
+    if n_workers is None:
+        n_workers = default_n_workers(jobs[0].cpu)
+
+    if n_workers <= 1:
+        for job in jobs:
+            yield dock_in_process(job)
+        return
+
+    with threadsafe_context().Pool(processes=min(n_workers, len(jobs))) as pool:
+        for result in pool.imap_unordered(dock_in_process, jobs, chunksize=1):
+            yield result